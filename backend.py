@@ -1,3 +1,5 @@
+from contextlib import asynccontextmanager
+
 import socketio
 import uvicorn
 from fastapi import FastAPI
@@ -5,15 +7,36 @@ from loguru import logger
 
 from src import Messenger
 from src.config import get_settings
-from src.kernelwrapper import KernelWrapper
+from src.discovery import start_beacon
+from src.kernelpool import KernelPool
+from src.logs import setup_logging
 from src.routes import router
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    messenger: Messenger = app.state.messenger
+    messenger.start()
+    beacon = await start_beacon()
+    yield
+    if beacon is not None:
+        beacon.close()
+    await messenger.stop()
+
+
 if __name__ == "__main__":
     settings = get_settings()
+    setup_logging()
     logger.info(f"IPython config - {settings.dict()}")
-    wrapper = KernelWrapper()
-    messenger = Messenger(wrapper)
-    app = FastAPI()
+    pool = KernelPool()
+    messenger = Messenger(pool)
+    app = FastAPI(lifespan=lifespan)
+    app.state.messenger = messenger
     app.include_router(router, tags=["Service"])
     socketio_app = socketio.ASGIApp(messenger.sio, app)
-    uvicorn.run(socketio_app, host=settings.SOCKETIO_HOST, port=settings.SOCKETIO_PORT)
+    uvicorn.run(
+        socketio_app,
+        host=settings.SOCKETIO_HOST,
+        port=settings.SOCKETIO_PORT,
+        ws_per_message_deflate=settings.WS_PER_MESSAGE_DEFLATE,
+    )
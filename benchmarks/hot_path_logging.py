@@ -0,0 +1,121 @@
+"""
+Бенчмарк логирования на hot path: сколько стоит Sender.send_message на
+сообщение с разными настройками логов.
+
+  off      - сообщения вывода в лог не пишутся (LOG_LEVEL=INFO);
+  sampled  - src.sender на DEBUG, в лог идет каждое LOG_SAMPLE_EVERY-е;
+  every    - src.sender на DEBUG, в лог идет каждое сообщение;
+  eager    - как было раньше: каждое сообщение целиком через f-string на INFO.
+
+Лог пишется в файл через enqueue-вывод, как в setup_logging. Замеряется
+только время вызовов send_message - его платят поток iopub и event loop.
+
+Запуск: python -m benchmarks.hot_path_logging --messages 20000
+"""
+import argparse
+import asyncio
+import tempfile
+import time
+from pathlib import Path
+
+from loguru import logger
+
+from src import sender as sender_module
+from src.config import get_settings
+from src.sender import Sender
+
+
+class NullServer:
+    def __init__(self) -> None:
+        self.finished = asyncio.Event()
+
+    async def emit(self, event, data=None, to=None):
+        messages = data if event == "output-batch" else [data]
+        if messages[-1].get("command") == "notebook-end":
+            self.finished.set()
+
+
+def stream_message(i: int) -> dict:
+    return {
+        "command": "notebook-upd",
+        "content": {"name": "stdout", "text": f"step {i} loss {1 / (i + 1):.6f}\n"},
+        "msg_type": "stream",
+    }
+
+
+def image_message(i: int, image: bytes) -> dict:
+    return {
+        "command": "notebook-upd",
+        "content": {
+            "data": {"image/png": image, "text/plain": f"<Figure {i}>"},
+            "metadata": {},
+        },
+        "msg_type": "display_data",
+    }
+
+
+async def run(messages: list[dict], eager: bool) -> float:
+    server = NullServer()
+    sender = Sender(server)  # type: ignore[arg-type]
+    sender.start()
+    to = "session:bench"
+    spent = 0.0
+    for start in range(0, len(messages), 1000):
+        started = time.perf_counter()
+        for data in messages[start : start + 1000]:
+            if eager:
+                logger.info(f"Sending message from kernel to {to}: {data}")
+            sender.send_message(data, to=to)
+        spent += time.perf_counter() - started
+        # даем Sender-у разгрести буфер, как при реальном потоке из kernel-а
+        await asyncio.sleep(0)
+    sender.send_message({"command": "notebook-end"}, to=to)
+    await server.finished.wait()
+    await sender.stop()
+    return spent / len(messages)
+
+
+def configure(log_path: Path, sender_level: str) -> None:
+    logger.remove()
+    logger.add(
+        log_path,
+        level="DEBUG",
+        filter={"": "INFO", "src.sender": sender_level},
+        enqueue=True,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=20_000)
+    parser.add_argument("--image-bytes", type=int, default=200_000)
+    args = parser.parse_args()
+    image = bytes(range(256)) * (args.image_bytes // 256)
+    workloads = {
+        "stream": [stream_message(i) for i in range(args.messages)],
+        "image": [image_message(i, image) for i in range(args.messages // 10)],
+    }
+    log_path = Path(tempfile.mkdtemp()) / "hot_path.log"
+    sample_every = get_settings().LOG_SAMPLE_EVERY
+    modes = (
+        ("off", "INFO", sample_every, False),
+        ("sampled", "DEBUG", sample_every, False),
+        ("every", "DEBUG", 1, False),
+        ("eager", "INFO", sample_every, True),
+    )
+
+    for workload, messages in workloads.items():
+        for name, level, every, eager in modes:
+            configure(log_path, level)
+            sender_module.sample_log.every = every
+            per_message = asyncio.run(run(messages, eager))
+            logger.complete()
+            print(
+                f"{workload:>6} {name:>8}: {per_message * 1e6:8.1f} us/msg, "
+                f"log {log_path.stat().st_size / 1024:9.0f} KiB"
+            )
+            log_path.unlink()
+
+
+if __name__ == "__main__":
+    main()
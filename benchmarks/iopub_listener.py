@@ -0,0 +1,145 @@
+"""
+Бенчмарк слушателя iopub: старый цикл NOBLOCK + sleep против zmq.Poller.
+
+Поднимает отдельный kernel, заливает stdout из ячейки и считает, сколько
+сообщений в секунду успевает вычитать каждая стратегия, а также сколько CPU
+тратит поток слушателя, пока kernel простаивает.
+
+Запуск: python -m benchmarks.iopub_listener --messages 100000
+"""
+import argparse
+import time
+from threading import Event, Thread
+from typing import Callable
+
+import zmq
+from jupyter_client import KernelManager, session
+
+LEGACY_SLEEP_S = 0.05 / 10
+POLL_TIMEOUT_MS = 500
+
+FLOOD_CELL = "for i in range({messages}):\n    print(i, flush=True)"
+
+
+def legacy_loop(socket, ses, stop: Event, on_message: Callable) -> None:
+    while not stop.is_set():
+        message = ses.recv(socket, mode=zmq.NOBLOCK)
+        if message != (None, None):
+            on_message(message)
+        time.sleep(LEGACY_SLEEP_S)
+
+
+def poller_loop(socket, ses, stop: Event, on_message: Callable) -> None:
+    poller = zmq.Poller()
+    poller.register(socket, zmq.POLLIN)
+    while not stop.is_set():
+        if not poller.poll(POLL_TIMEOUT_MS):
+            continue
+        while True:
+            message = ses.recv(socket, mode=zmq.NOBLOCK)
+            if message == (None, None):
+                break
+            on_message(message)
+
+
+class Listener(Thread):
+    def __init__(self, address: str, key: bytes, loop: Callable) -> None:
+        super().__init__(daemon=True)
+        self.stop = Event()
+        self.done = Event()
+        self.target_msg_id: str | None = None
+        self.stream_messages = 0
+        self.cpu_s = 0.0
+        self.__address = address
+        self.__key = key
+        self.__loop = loop
+        self.__ready = Event()
+
+    def run(self) -> None:
+        socket = zmq.Context.instance().socket(zmq.SUB)
+        socket.connect(self.__address)
+        socket.setsockopt_string(zmq.SUBSCRIBE, "")
+        ses = session.Session(key=self.__key)
+        self.__ready.set()
+        cpu_start = time.thread_time()
+        self.__loop(socket, ses, self.stop, self.__on_message)
+        self.cpu_s = time.thread_time() - cpu_start
+        socket.close()
+
+    def wait_ready(self) -> None:
+        self.__ready.wait()
+        # даем подписке SUB дойти до PUB, иначе первые сообщения потеряются
+        time.sleep(0.5)
+
+    def __on_message(self, message) -> None:
+        _, msg = message
+        if msg["msg_type"] == "stream":
+            self.stream_messages += 1
+        elif (
+            msg["msg_type"] == "status"
+            and msg["content"]["execution_state"] == "idle"
+            and msg["parent_header"].get("msg_id") == self.target_msg_id
+        ):
+            self.done.set()
+
+
+def measure_idle_cpu(address: str, key: bytes, loop: Callable, seconds: float):
+    listener = Listener(address, key, loop)
+    listener.start()
+    listener.wait_ready()
+    time.sleep(seconds)
+    listener.stop.set()
+    listener.join()
+    return listener.cpu_s / seconds
+
+
+def measure_throughput(client, address, key, loop, messages, deadline_s):
+    listener = Listener(address, key, loop)
+    listener.start()
+    listener.wait_ready()
+    started = time.perf_counter()
+    listener.target_msg_id = client.execute(FLOOD_CELL.format(messages=messages))
+    listener.done.wait(deadline_s)
+    elapsed = time.perf_counter() - started
+    listener.stop.set()
+    listener.join()
+    return listener.stream_messages, elapsed, listener.done.is_set()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=100_000)
+    parser.add_argument("--idle-seconds", type=float, default=5.0)
+    parser.add_argument("--deadline", type=float, default=60.0)
+    args = parser.parse_args()
+
+    kernel_manager = KernelManager(kernel_name="python")
+    kernel_manager.start_kernel()
+    client = kernel_manager.client()
+    client.start_channels()
+    client.wait_for_ready(timeout=30)
+    info = client.get_connection_info()
+    address = f"{info['transport']}://{info['ip']}:{info['iopub_port']}"
+    key = info["key"]
+
+    try:
+        for name, loop in (("noblock+sleep", legacy_loop), ("poller", poller_loop)):
+            idle_cpu = measure_idle_cpu(address, key, loop, args.idle_seconds)
+            received, elapsed, finished = measure_throughput(
+                client, address, key, loop, args.messages, args.deadline
+            )
+            print(
+                f"{name:>14}: {received / elapsed:10.0f} msg/s "
+                f"({received} stream messages in {elapsed:.2f}s, "
+                f"{'finished' if finished else 'deadline hit'}), "
+                f"idle CPU {idle_cpu * 100:.2f}%"
+            )
+            # ждем, пока kernel доработает ячейку, чтобы не мешать следующему замеру
+            client.execute_interactive("pass", timeout=args.deadline)
+    finally:
+        client.stop_channels()
+        kernel_manager.shutdown_kernel(now=True)
+
+
+if __name__ == "__main__":
+    main()
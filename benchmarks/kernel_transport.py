@@ -0,0 +1,71 @@
+"""
+Бенчмарк транспорта каналов kernel-а: tcp loopback против ipc (unix-сокеты).
+
+Для каждого транспорта запускается KernelWrapper, и в него по одной
+отправляются маленькие ячейки. Замеряются два круга:
+
+  reply - от execute_request до execute_reply на shell (execute_code);
+  cell  - от отправки до idle на iopub с выводом ячейки, как ее видит Handler.
+
+Запуск: UPLOAD_DIR=/tmp/user python -m benchmarks.kernel_transport --cells 2000
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from loguru import logger
+
+from src.config import get_settings
+from src.kernelwrapper import KernelWrapper
+
+
+def percentiles(samples: list[float]) -> str:
+    samples_us = sorted(sample * 1e6 for sample in samples)
+    return (
+        f"p50 {statistics.median(samples_us):7.0f} us, "
+        f"p99 {samples_us[int(len(samples_us) * 0.99)]:7.0f} us"
+    )
+
+
+async def cell_round_trips(kernel: KernelWrapper, cells: int) -> list[float]:
+    samples = []
+    for i in range(cells):
+        started = time.perf_counter()
+        execution = kernel.execute(f"print({i})")
+        async for _ in execution:
+            pass
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def run(transport: str, cells: int) -> tuple[list[float], list[float]]:
+    connection_info = {**get_settings().connection_info, "transport": transport}
+    kernel = KernelWrapper(connection_info)
+    try:
+        for _ in range(100):
+            # прогрев: первые ячейки kernel-а заметно медленнее
+            kernel.execute_code("pass")
+        replies = []
+        for _ in range(cells):
+            started = time.perf_counter()
+            kernel.execute_code("pass")
+            replies.append(time.perf_counter() - started)
+        return replies, asyncio.run(cell_round_trips(kernel, cells))
+    finally:
+        kernel.shutdown_kernel()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--cells", type=int, default=2000)
+    args = parser.parse_args()
+    logger.remove()
+
+    for transport in ("tcp", "ipc"):
+        replies, cells = run(transport, args.cells)
+        print(f"{transport}: reply {percentiles(replies)}; cell {percentiles(cells)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Бенчмарк передачи вывода из потока kernel-а в event loop: по
+call_soon_threadsafe на сообщение против LoopBridge.
+
+Поток-производитель, как поток iopub, кладет сообщения в очередь и будит
+корутину-потребителя; потребитель разбирает все, что накопилось. Считаются
+сообщения в секунду, пробуждения loop-а и процессорное время производителя.
+
+Запуск: python -m benchmarks.loop_bridge --messages 500000
+"""
+import argparse
+import asyncio
+import queue
+import time
+from threading import Thread
+
+from src.bridge import LoopBridge
+
+
+async def run(messages: int, bridged: bool) -> tuple[float, int, float]:
+    loop = asyncio.get_running_loop()
+    bridge = LoopBridge(loop)
+    items: queue.SimpleQueue[int] = queue.SimpleQueue()
+    ready = asyncio.Event()
+    wakeups = 0
+    producer_cpu_s = 0.0
+
+    def wake() -> None:
+        nonlocal wakeups
+        wakeups += 1
+        ready.set()
+
+    def produce() -> None:
+        nonlocal producer_cpu_s
+        started = time.thread_time()
+        for i in range(messages):
+            items.put(i)
+            if bridged:
+                bridge.notify(wake)
+            else:
+                loop.call_soon_threadsafe(wake)
+        producer_cpu_s = time.thread_time() - started
+
+    started = time.perf_counter()
+    Thread(target=produce, daemon=True).start()
+    received = 0
+    while received < messages:
+        await ready.wait()
+        ready.clear()
+        while True:
+            try:
+                items.get_nowait()
+            except queue.Empty:
+                break
+            received += 1
+    elapsed = time.perf_counter() - started
+    if bridged:
+        wakeups = bridge.wakeups
+    return elapsed, wakeups, producer_cpu_s
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=500_000)
+    args = parser.parse_args()
+
+    for name, bridged in (("per-message", False), ("bridge", True)):
+        elapsed, wakeups, producer_cpu_s = asyncio.run(run(args.messages, bridged))
+        print(
+            f"{name:>12}: {args.messages / elapsed:10.0f} msg/s, "
+            f"{wakeups} loop wakeups, producer CPU {producer_cpu_s:.2f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Бенчмарк вывода терминала: OutputView против QTextEdit.append.
+
+В вывод добавляются строки пакетами, как их приносит поток клиента за один
+кадр; время кадра - перенос пакета на экран и перерисовка. Затем вывод
+прокручивается в случайные места. В конце печатается RSS процесса.
+QTextEdit по умолчанию получает меньше строк: на миллионе он не доживает
+до конца за разумное время.
+
+Запуск: QT_QPA_PLATFORM=offscreen python -m benchmarks.output_view --lines 1000000
+"""
+import argparse
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from PyQt5.QtGui import QImage
+from PyQt5.QtWidgets import QApplication, QTextEdit
+
+from frontapp.imagecache import ImageCache
+from frontapp.outputview import OutputView
+
+
+def rss_mib() -> float:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def report(name: str, frames: list[float], scrolls: list[float], rss: float):
+    frames_ms = sorted(frame * 1000 for frame in frames)
+    scrolls_ms = sorted(scroll * 1000 for scroll in scrolls)
+    print(
+        f"{name:>10}: frame p50 {statistics.median(frames_ms):7.2f} ms, "
+        f"p99 {frames_ms[int(len(frames_ms) * 0.99)]:7.2f} ms, "
+        f"max {frames_ms[-1]:7.2f} ms; "
+        f"scroll p50 {statistics.median(scrolls_ms):6.2f} ms; "
+        f"RSS {rss:7.1f} MiB"
+    )
+
+
+def run_view(app: QApplication, lines: int, per_frame: int, scrollback: int):
+    images = ImageCache(QImage.fromData, cache_dir=Path(tempfile.mkdtemp()))
+    view = OutputView(images, scrollback=scrollback)
+    view.resize(800, 600)
+    view.show()
+    frames = []
+    for start in range(0, lines, per_frame):
+        view.append(
+            "\n".join(f"line {i}" for i in range(start, min(start + per_frame, lines)))
+        )
+        started = time.perf_counter()
+        view.flush()
+        view.viewport().repaint()
+        app.processEvents()
+        frames.append(time.perf_counter() - started)
+    return frames, scroll(app, view)
+
+
+def run_text_edit(app: QApplication, lines: int, per_frame: int):
+    view = QTextEdit()
+    view.setReadOnly(True)
+    view.resize(800, 600)
+    view.show()
+    frames = []
+    for start in range(0, lines, per_frame):
+        started = time.perf_counter()
+        # так вывод добавлял PythonTerminal до OutputView: по вызову на сообщение
+        for i in range(start, min(start + per_frame, lines)):
+            view.append(f"line {i}")
+        scrollbar = view.verticalScrollBar()
+        scrollbar.setValue(scrollbar.maximum())
+        view.viewport().repaint()
+        app.processEvents()
+        frames.append(time.perf_counter() - started)
+    return frames, scroll(app, view)
+
+
+def scroll(app: QApplication, view, jumps: int = 200) -> list[float]:
+    scrollbar = view.verticalScrollBar()
+    times = []
+    for _ in range(jumps):
+        started = time.perf_counter()
+        scrollbar.setValue(random.randint(0, scrollbar.maximum()))
+        view.viewport().repaint()
+        app.processEvents()
+        times.append(time.perf_counter() - started)
+    return times
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--lines", type=int, default=1_000_000)
+    parser.add_argument("--per-frame", type=int, default=1000)
+    parser.add_argument("--scrollback", type=int, default=1_000_000)
+    parser.add_argument("--text-edit-lines", type=int, default=50_000)
+    args = parser.parse_args()
+    app = QApplication(sys.argv)
+
+    started = time.perf_counter()
+    frames, scrolls = run_view(app, args.lines, args.per_frame, args.scrollback)
+    print(f"OutputView: {args.lines} lines in {time.perf_counter() - started:.2f}s")
+    report("OutputView", frames, scrolls, rss_mib())
+
+    if args.text_edit_lines:
+        started = time.perf_counter()
+        frames, scrolls = run_text_edit(app, args.text_edit_lines, args.per_frame)
+        print(
+            f"QTextEdit: {args.text_edit_lines} lines "
+            f"in {time.perf_counter() - started:.2f}s"
+        )
+        # RSS растет только вверх: это сумма обоих замеров
+        report("QTextEdit", frames, scrolls, rss_mib())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Бенчмарк Sender: одно событие на сообщение против пакетов с склейкой stream.
+
+Вместо настоящего socket.io сервера используется заглушка, которая, как и
+socket.io, сериализует каждое событие в JSON; считаются кадры, байты и время
+до доставки последнего сообщения.
+
+Запуск: python -m benchmarks.sender_batching --messages 100000
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from loguru import logger
+
+from src.sender import Sender
+
+
+class CountingServer:
+    def __init__(self) -> None:
+        self.frames = 0
+        self.bytes = 0
+        self.finished = asyncio.Event()
+
+    async def emit(self, event, data=None, to=None):
+        self.frames += 1
+        self.bytes += len(json.dumps([event, data]))
+        messages = data if event == "output-batch" else [data]
+        if messages[-1].get("command") == "notebook-end":
+            self.finished.set()
+
+
+async def run(messages: int, batch_window_s: float) -> tuple[float, CountingServer]:
+    server = CountingServer()
+    sender = Sender(server, batch_window_s=batch_window_s)  # type: ignore[arg-type]
+    sender.start()
+    started = time.perf_counter()
+    for i in range(messages):
+        sender.send_message(
+            {
+                "command": "notebook-upd",
+                "content": {"name": "stdout", "text": f"{i}\n"},
+                "msg_type": "stream",
+            },
+            to="session:bench",
+        )
+        if i % 1000 == 0:
+            # даем Sender-у поработать, как при реальном потоке из kernel-а
+            await asyncio.sleep(0)
+    sender.send_message({"command": "notebook-end"}, to="session:bench")
+    await server.finished.wait()
+    elapsed = time.perf_counter() - started
+    await sender.stop()
+    return elapsed, server
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=100_000)
+    parser.add_argument("--window", type=float, default=0.016)
+    args = parser.parse_args()
+    # замеряем сам Sender, а не вывод логов по каждому сообщению
+    logger.remove()
+
+    for name, window in (("per-message", 0.0), ("batched", args.window)):
+        elapsed, server = asyncio.run(run(args.messages, window))
+        print(
+            f"{name:>12}: {args.messages / elapsed:10.0f} msg/s, "
+            f"{server.frames} frames, {server.bytes / 1024:.0f} KiB "
+            f"in {elapsed:.2f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
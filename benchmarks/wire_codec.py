@@ -0,0 +1,188 @@
+"""
+Бенчмарк вывода на проводе: JSON против msgpack, с permessage-deflate и без.
+
+События вывода кодируются так же, как их отправляет Sender (пакет socket.io
+с бинарными вложениями, кадры engine.io), и сжимаются так же, как это
+делает permessage-deflate: один поток zlib на соединение с сохранением
+словаря между кадрами. Считаются байты на проводе и время процессора на
+сообщение: кодирование и сжатие на сервере, распаковка и декодирование на
+клиенте.
+
+Нагрузки: stream - строки лога обучения пакетами, как их собирает Sender;
+image - display_data с PNG-картинками графиков.
+
+Запуск: python -m benchmarks.wire_codec --events 2000
+"""
+import argparse
+import hashlib
+import struct
+import time
+import zlib
+from uuid import uuid4
+
+import msgpack
+from socketio import packet
+
+from src.codec import pack_messages
+from src.models import OutputCodec
+
+# последние байты, которые permessage-deflate отрезает у каждого кадра
+DEFLATE_TAIL = b"\x00\x00\xff\xff"
+
+
+def png(width: int, height: int, seed: int) -> bytes:
+    """PNG с линией графика на белом фоне: сжимается, как настоящие графики"""
+    rows = []
+    for y in range(height):
+        row = bytearray(b"\xff" * width * 3)
+        for x in range(width):
+            if abs((x * (seed + 3) + y * 7) % height - y) < 2:
+                row[x * 3 : x * 3 + 3] = b"\x1f\x77\xb4"
+        rows.append(b"\x00" + bytes(row))
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return (
+            struct.pack(">I", len(data))
+            + kind
+            + data
+            + struct.pack(">I", zlib.crc32(kind + data))
+        )
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", header)
+        + chunk(b"IDAT", zlib.compress(b"".join(rows)))
+        + chunk(b"IEND", b"")
+    )
+
+
+def stream_events(events: int) -> list[list[dict]]:
+    msg_id = str(uuid4())
+    seq = 0
+    result = []
+    for event in range(events):
+        text = "".join(
+            f"epoch {event} step {step:4d} loss {1 / (step + 1):.6f} "
+            f"accuracy {step / 64:.4f} lr 0.000300\n"
+            for step in range(64)
+        )
+        seq += 1
+        result.append(
+            [
+                {
+                    "command": "notebook-upd",
+                    "content": {"name": "stdout", "text": text},
+                    "msg_type": "stream",
+                    "msg_id": msg_id,
+                    "seq": seq,
+                }
+            ]
+        )
+    return result
+
+
+def image_events(events: int) -> list[list[dict]]:
+    msg_id = str(uuid4())
+    images = [png(640, 480, seed) for seed in range(8)]
+    result = []
+    for event in range(events):
+        image = images[event % len(images)]
+        result.append(
+            [
+                {
+                    "command": "notebook-upd",
+                    "content": {
+                        "data": {
+                            "image/png": image,
+                            "text/plain": "<Figure size 640x480 with 1 Axes>",
+                        },
+                        "metadata": {},
+                        "sha256": {"image/png": hashlib.sha256(image).hexdigest()},
+                    },
+                    "msg_type": "display_data",
+                    "msg_id": msg_id,
+                    "seq": event + 1,
+                }
+            ]
+        )
+    return result
+
+
+def frames(messages: list[dict], codec: OutputCodec) -> list[bytes]:
+    """Кадры websocket одного события вывода, как их отправляет сервер"""
+    if codec == OutputCodec.JSON:
+        event, data = "output", messages[0]
+    else:
+        event, data = "output-packed", pack_messages(messages, codec)
+    encoded = packet.Packet(packet.EVENT, data=[event, data]).encode()
+    if not isinstance(encoded, list):
+        encoded = [encoded]
+    # текст - пакет engine.io "4"; бинарные вложения идут отдельными кадрами
+    return [b"4" + part.encode() if isinstance(part, str) else part for part in encoded]
+
+
+def decode(wire: list[bytes], codec: OutputCodec) -> list[dict]:
+    """Обратный путь на клиенте, как у socketio.AsyncClient и _unpack"""
+    pkt = packet.Packet(encoded_packet=wire[0][1:].decode())
+    for attachment in wire[1:]:
+        pkt.add_attachment(attachment)
+    _, data = pkt.data
+    if codec == OutputCodec.JSON:
+        return [data]
+    return msgpack.unpackb(data)
+
+
+def run(
+    workload: list[list[dict]], codec: OutputCodec, deflate: bool
+) -> tuple[int, float, float]:
+    """Байты на проводе, мкс сервера и мкс клиента на сообщение"""
+    compressor = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+    decompressor = zlib.decompressobj(wbits=-zlib.MAX_WBITS)
+    wire_bytes = 0
+    server_s = client_s = 0.0
+    for messages in workload:
+        started = time.perf_counter()
+        wire = frames(messages, codec)
+        if deflate:
+            wire = [
+                (compressor.compress(frame) + compressor.flush(zlib.Z_SYNC_FLUSH))[:-4]
+                for frame in wire
+            ]
+        server_s += time.perf_counter() - started
+        wire_bytes += sum(len(frame) for frame in wire)
+
+        started = time.perf_counter()
+        if deflate:
+            wire = [decompressor.decompress(frame + DEFLATE_TAIL) for frame in wire]
+        decoded = decode(wire, codec)
+        client_s += time.perf_counter() - started
+        assert decoded == messages
+    count = sum(len(messages) for messages in workload)
+    return wire_bytes, server_s / count * 1e6, client_s / count * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--events", type=int, default=2000)
+    args = parser.parse_args()
+
+    for name, workload in (
+        ("stream", stream_events(args.events)),
+        ("image", image_events(args.events // 10)),
+    ):
+        raw = None
+        for codec in OutputCodec:
+            for deflate in (False, True):
+                wire_bytes, server_us, client_us = run(workload, codec, deflate)
+                raw = raw or wire_bytes
+                label = f"{codec.value}{'+deflate' if deflate else ''}"
+                print(
+                    f"{name:>6} {label:>15}: {wire_bytes / 1024:9.0f} KiB "
+                    f"({wire_bytes / raw:6.1%}), server {server_us:7.1f} us/msg, "
+                    f"client {client_us:7.1f} us/msg"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,86 @@
 import asyncio
+from urllib.parse import urlsplit
+from uuid import uuid4
 
 import aiohttp
 import socketio
 from loguru import logger
 
+from frontapp.discovery import ServerCache, discover
+
+try:
+    import msgpack
+except ImportError:  # без msgpack сервер должен слать вывод в JSON
+    msgpack = None
+
+# перебор портов, если сервер не нашелся быстрее: сколько проверок идет
+# одновременно и сколько ждать каждую
+SCAN_PORTS = range(5000, 9000)
+PROBE_CONCURRENCY = 100
+PROBE_TIMEOUT_S = 0.5
+# переподключение после обрыва: первая пауза, удвоение до предела, разброс
+RECONNECT_DELAY_S = 0.5
+RECONNECT_DELAY_MAX_S = 10
+RECONNECT_JITTER = 0.5
+# окно zlib для сжатия websocket-кадров (permessage-deflate); 0 - без сжатия
+WS_COMPRESS_WBITS = 15
+# в каких кодировках клиент умеет читать вывод, кроме JSON
+CODECS = ["msgpack"] if msgpack is not None else []
+
+
+def _unpack(messages: list[dict] | bytes) -> list[dict]:
+    """Сообщения вывода, упакованные сервером msgpack, или список как есть"""
+    if isinstance(messages, bytes):
+        return msgpack.unpackb(messages)
+    return messages
+
 
 class SocketIOClient:
-    def __init__(self, server_url: str = "http://127.0.0.1"):
-        self.__sio = socketio.AsyncClient()
+    def __init__(
+        self,
+        server_url: str = "http://127.0.0.1",
+        session: str | None = None,
+        servers: ServerCache | None = None,
+    ):
+        self.__sio = socketio.AsyncClient(
+            reconnection=True,
+            reconnection_delay=RECONNECT_DELAY_S,
+            reconnection_delay_max=RECONNECT_DELAY_MAX_S,
+            randomization_factor=RECONNECT_JITTER,
+            websocket_extra_options={"compress": WS_COMPRESS_WBITS},
+        )
         self.__server_url = server_url
+        # именованная сессия: клиенты с одним именем работают с одним kernel-ом.
+        # Без имени клиент получает свою сессию, которая переживает обрывы связи
+        self.__session = session or uuid4().hex
+        # журнал вывода каждой сессии на сервере (своей и наблюдаемых) и номер
+        # последнего полученного из него сообщения: после переподключения
+        # сервер досылает пропущенное
+        self.__epochs: dict[str, str] = {}
+        self.__last_seq: dict[str, int] = {}
+        # чужие сессии, на вывод которых клиент подписан
+        self.__observed: set[str] = set()
         self._setup_handlers()
         self._output_queue = asyncio.Queue()
+        self._files_queue = asyncio.Queue()
+        self.__http: aiohttp.ClientSession | None = None
+        # где сервер нашелся в прошлый раз
+        self.__servers = servers or ServerCache()
 
     @property
     def server_url(self) -> str:
         return self.__server_url
 
+    @property
+    def http(self) -> aiohttp.ClientSession:
+        """
+        Общий пул HTTP-соединений с сервером. Создается при первом обращении,
+        пользоваться им можно только из event loop клиента
+        """
+        if self.__http is None or self.__http.closed:
+            self.__http = aiohttp.ClientSession()
+        return self.__http
+
     def set_server_url(self, server_url: str) -> None:
         self.__server_url = server_url
 
@@ -23,60 +88,158 @@ class SocketIOClient:
         @self.__sio.event
         async def connect():
             logger.info("Connected to server")
+            # подписки на чужие сессии после переподключения надо повторить
+            for session in self.__observed:
+                await self.__observe(session)
 
         @self.__sio.event
         async def disconnect():
             logger.info("Disconnected from server")
 
+        @self.__sio.on("resume")
+        async def on_resume(data):
+            session = data["session"]
+            if data["epoch"] != self.__epochs.get(session):
+                # новый журнал: его номера начинаются заново
+                self.__epochs[session] = data["epoch"]
+                self.__last_seq[session] = 0
+            if data["lost"] or data["replayed"]:
+                logger.info(
+                    f"Resumed session {data['session']}: "
+                    f"{data['replayed']} replayed, {data['lost']} lost"
+                )
+            if data["lost"]:
+                await self._output_queue.put(
+                    {
+                        "command": "notebook-upd",
+                        "msg_type": "stream",
+                        "content": {
+                            "name": "stderr",
+                            "text": f"... {data['lost']} output messages were "
+                            "lost while disconnected ...",
+                        },
+                    }
+                )
+            for message in _unpack(data["messages"]):
+                await self.__receive(message)
+
         @self.__sio.on("output")
         async def on_kernel_message(data):
-            await self._output_queue.put(data)
+            await self.__receive(data)
+
+        @self.__sio.on("output-batch")
+        async def on_kernel_messages(data):
+            for message in data:
+                await self.__receive(message)
+
+        @self.__sio.on("output-packed")
+        async def on_packed_messages(data):
+            for message in _unpack(data):
+                await self.__receive(message)
+
+        @self.__sio.on("files")
+        async def on_files_changed(data):
+            await self._files_queue.put(data)
+
+    async def __receive(self, message: dict) -> None:
+        if isinstance(message, dict) and (seq := message.get("seq")) is not None:
+            session = message.get("session", self.__session)
+            if seq <= self.__last_seq.get(session, 0):
+                # уже получено до обрыва связи
+                return
+            self.__last_seq[session] = seq
+        await self._output_queue.put(message)
+
+    def __position(self, session: str) -> dict:
+        """С какого места сервер досылает вывод сессии"""
+        return {
+            "epoch": self.__epochs.get(session),
+            "last_seq": self.__last_seq.get(session, 0),
+        }
+
+    def __auth(self) -> dict:
+        """Вызывается при каждом подключении, в том числе повторном"""
+        return {
+            "session": self.__session,
+            **self.__position(self.__session),
+            "codecs": CODECS,
+        }
 
     def connected(self):
         return self.__sio.connected
 
-    async def check_server_port_for_host(self, default_port=8000) -> int:
-        async with aiohttp.ClientSession() as session:
-            try:
-                async with session.get(
-                    f"{self.__server_url}:{default_port}/service/check"
-                ) as response:
-                    assert response.status == 200
-            except (
-                AssertionError,
-                aiohttp.ClientConnectionError,
-                aiohttp.ClientResponseError,
-            ):
-                pass
-            else:
-                return default_port
-
-            for port in range(5000, 9000):
-                try:
-                    async with session.get(
-                        f"{self.__server_url}:{port}/service/check"
-                    ) as response:
-                        assert response.status == 200
-                except (
-                    AssertionError,
-                    aiohttp.ClientConnectionError,
-                    aiohttp.ClientResponseError,
-                ):
-                    pass
-                else:
+    async def locate_server(self, default_port=8000) -> str:
+        """
+        Адрес сервера с портом для введенного адреса без порта. Проверяются
+        по очереди: адрес из прошлого подключения, default_port, ответ
+        UDP-маяка сервера и, наконец, SCAN_PORTS - по PROBE_CONCURRENCY
+        портов одновременно
+        """
+        address = self.__server_url
+        parts = urlsplit(address)
+        if (cached := self.__servers.get(address)) and await self.__probe(cached):
+            return cached
+        server_url = f"{address}:{default_port}"
+        if not await self.__probe(server_url):
+            # без имени хоста в адресе маяк спрашивать некого
+            found = await discover(parts.hostname) if parts.hostname else None
+            if found is not None:
+                server_url = f"{parts.scheme}://{found[0]}:{found[1]}"
+            if found is None or not await self.__probe(server_url):
+                port = await self.__scan_ports(address)
+                if port is None:
+                    raise Exception("No server running on this host adress")
+                server_url = f"{address}:{port}"
+        self.__servers.put(address, server_url)
+        return server_url
+
+    async def __probe(self, server_url: str) -> bool:
+        try:
+            async with self.http.get(
+                f"{server_url}/service/check",
+                timeout=aiohttp.ClientTimeout(total=PROBE_TIMEOUT_S),
+            ) as response:
+                return response.status == 200
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return False
+
+    async def __scan_ports(self, address: str) -> int | None:
+        semaphore = asyncio.Semaphore(PROBE_CONCURRENCY)
+
+        async def probe(port: int) -> int | None:
+            async with semaphore:
+                return port if await self.__probe(f"{address}:{port}") else None
+
+        probes = [asyncio.create_task(probe(port)) for port in SCAN_PORTS]
+        try:
+            for result in asyncio.as_completed(probes):
+                if (port := await result) is not None:
                     return port
-        raise Exception("No server running on this host adress")
+        finally:
+            for task in probes:
+                task.cancel()
+        return None
 
     async def connect(self):
         if len(self.__server_url.split(":")) == 2:
-            port = await self.check_server_port_for_host()
-            self.__server_url += f":{port}"
+            self.__server_url = await self.locate_server()
         logger.info(f"{self.__server_url=}")
-        await self.__sio.connect(self.__server_url, transports=["websocket"])
+        await self.__sio.connect(
+            self.__server_url,
+            transports=["websocket"],
+            auth=self.__auth,
+        )
 
     async def disconnect(self):
         await self.__sio.disconnect()
 
+    async def close(self) -> None:
+        """Отключается от сервера и закрывает пул HTTP-соединений"""
+        if self.connected():
+            await self.disconnect()
+        if self.__http is not None:
+            await self.__http.close()
+
     async def _send_command(self, command: str, **kwargs):
         """Отправляет команду ядру"""
         message = {"command": command, **kwargs}
@@ -87,8 +250,47 @@ class SocketIOClient:
         """Метод отправляет код на запуск"""
         await self._send_command("execute", code=command)
 
-    async def get_output(self) -> dict | None:
-        try:
-            return self._output_queue.get_nowait()
-        except asyncio.QueueEmpty:
-            return
+    async def execute_cells(self, cells: list[str]) -> None:
+        """
+        Отправляет ячейки одним пакетом: сервер передает их kernel-у подряд,
+        конец пакета - notebook-end
+        """
+        await self._send_command(
+            "execute",
+            cells=[
+                {"id": str(index), "code": code} for index, code in enumerate(cells)
+            ],
+        )
+
+    async def interrupt(self) -> None:
+        """Прерывает текущую ячейку; ячейки в очереди сервера отбрасываются"""
+        await self._send_command("interrupt")
+
+    async def observe(self, session: str) -> None:
+        """
+        Подписывается на вывод чужой сессии; после переподключения подписка
+        возобновляется сама, с досылкой пропущенного
+        """
+        self.__observed.add(session)
+        await self.__observe(session)
+
+    async def unobserve(self, session: str) -> None:
+        self.__observed.discard(session)
+        await self._send_command("unobserve", session=session)
+
+    async def __observe(self, session: str) -> None:
+        await self._send_command("observe", session=session, **self.__position(session))
+
+    async def get_outputs(self) -> list[dict]:
+        """Ждет вывода kernel-а и забирает все накопившиеся сообщения разом"""
+        messages = [await self._output_queue.get()]
+        while not self._output_queue.empty():
+            messages.append(self._output_queue.get_nowait())
+        return messages
+
+    async def get_files_delta(self) -> dict:
+        """
+        Ждет изменений в списке файлов сервера:
+        {"added": [...], "removed": [...]}
+        """
+        return await self._files_queue.get()
@@ -0,0 +1,88 @@
+import asyncio
+import json
+import socket
+from contextlib import suppress
+from pathlib import Path
+
+DISCOVERY_PORT = 8765
+# запрос поиска; сервер отвечает {"service": SERVICE, "port": порт socket.io}.
+# Копия констант src/discovery.py (клиент не тянет серверные зависимости):
+# менять их нужно в обоих местах
+DISCOVERY_REQUEST = b"connector-discover"
+SERVICE = "connector"
+DEFAULT_CACHE_PATH = Path.home() / ".cache" / "connector" / "servers.json"
+
+
+class ServerCache:
+    """
+    Порт, на котором сервер нашелся в прошлый раз, по введенному адресу:
+    при следующем подключении он проверяется первым.
+    """
+
+    def __init__(self, path: Path = DEFAULT_CACHE_PATH) -> None:
+        self.__path = path
+
+    def get(self, address: str) -> str | None:
+        return self.__load().get(address)
+
+    def put(self, address: str, server_url: str) -> None:
+        servers = self.__load()
+        if servers.get(address) == server_url:
+            return
+        servers[address] = server_url
+        self.__path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.__path.with_name(f"{self.__path.name}.tmp")
+        tmp.write_text(json.dumps(servers))
+        tmp.replace(self.__path)
+
+    def __load(self) -> dict[str, str]:
+        try:
+            return json.loads(self.__path.read_text())
+        except (FileNotFoundError, ValueError):
+            return {}
+
+
+class _DiscoveryReply(asyncio.DatagramProtocol):
+    def __init__(self, reply: asyncio.Future) -> None:
+        self.__reply = reply
+
+    def datagram_received(self, data: bytes, addr: tuple) -> None:
+        with suppress(ValueError, KeyError, TypeError):
+            message = json.loads(data)
+            if message["service"] == SERVICE and not self.__reply.done():
+                self.__reply.set_result((addr[0], int(message["port"])))
+
+    def error_received(self, exc: Exception) -> None:
+        # ICMP "порт недоступен" от хоста без сервера - просто нет ответа
+        pass
+
+
+async def discover(
+    host: str, port: int = DISCOVERY_PORT, timeout_s: float = 0.3
+) -> tuple[str, int] | None:
+    """
+    Спрашивает сервер на host о порте socket.io по UDP. host может быть
+    broadcast-адресом сети (например 255.255.255.255): тогда отвечает
+    первый найденный сервер. Возвращает (адрес ответившего, порт) или None.
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        addresses = await loop.getaddrinfo(
+            host, port, family=socket.AF_INET, type=socket.SOCK_DGRAM
+        )
+    except OSError:
+        return None
+    reply = loop.create_future()
+    transport, _ = await loop.create_datagram_endpoint(
+        lambda: _DiscoveryReply(reply),
+        family=socket.AF_INET,
+        local_addr=("0.0.0.0", 0),
+        allow_broadcast=True,
+    )
+    try:
+        transport.sendto(DISCOVERY_REQUEST, addresses[0][4])
+        return await asyncio.wait_for(reply, timeout_s)
+    except (asyncio.TimeoutError, OSError):
+        return None
+    finally:
+        transport.close()
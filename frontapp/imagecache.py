@@ -0,0 +1,95 @@
+import os
+import re
+from collections import OrderedDict
+from contextlib import suppress
+from pathlib import Path
+from threading import Lock
+from typing import Callable
+
+DEFAULT_CACHE_DIR = Path.home() / ".cache" / "connector" / "images"
+# ключ - sha256 картинки в hex; он же имя файла в кэше
+KEY = re.compile(r"[0-9a-f]{64}")
+
+
+def is_cache_key(key: object) -> bool:
+    return isinstance(key, str) and KEY.fullmatch(key) is not None
+
+
+class ImageCache:
+    """
+    Кэш картинок из вывода ячеек по sha256 содержимого.
+
+    В памяти - LRU уже декодированных картинок, на диске - LRU исходных байт
+    с ограничением по объему. Вывод хранит только ключи: картинка, вытесненная
+    из памяти, при следующем показе поднимается с диска.
+    decode - превращает байты в объект для отрисовки (например, QImage).
+    """
+
+    def __init__(
+        self,
+        decode: Callable[[bytes], object],
+        memory_items: int = 64,
+        disk_bytes: int = 256 * 1024 * 1024,
+        cache_dir: Path = DEFAULT_CACHE_DIR,
+    ) -> None:
+        self.__decode = decode
+        self.__memory: OrderedDict[str, object] = OrderedDict()
+        self.__memory_items = memory_items
+        self.__disk_bytes = disk_bytes
+        self.__dir = cache_dir
+        self.__dir.mkdir(parents=True, exist_ok=True)
+        self.__lock = Lock()
+
+    def get(self, key: str):
+        """Картинка из памяти или с диска; None, если ее нет в кэше."""
+        with self.__lock:
+            if (image := self.__memory.get(key)) is not None:
+                self.__memory.move_to_end(key)
+                return image
+        path = self.__path(key)
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            return None
+        # время изменения файла служит временем доступа для LRU на диске
+        os.utime(path)
+        return self.__remember(key, self.__decode(data))
+
+    def put(self, key: str, data: bytes):
+        """Кладет картинку в кэш и возвращает ее декодированной."""
+        if (image := self.get(key)) is not None:
+            return image
+        path = self.__path(key)
+        tmp = path.with_name(f"{key}.tmp")
+        tmp.write_bytes(data)
+        tmp.replace(path)
+        self.__evict()
+        return self.__remember(key, self.__decode(data))
+
+    def __path(self, key: str) -> Path:
+        # ключ приходит от сервера: имя вроде "../x" увело бы запись из кэша
+        if not is_cache_key(key):
+            raise ValueError(f"Invalid image cache key: {key!r}")
+        return self.__dir / key
+
+    def __remember(self, key: str, image):
+        with self.__lock:
+            self.__memory[key] = image
+            self.__memory.move_to_end(key)
+            while len(self.__memory) > self.__memory_items:
+                self.__memory.popitem(last=False)
+        return image
+
+    def __evict(self) -> None:
+        files = []
+        for entry in os.scandir(self.__dir):
+            if entry.is_file():
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.__disk_bytes:
+                break
+            with suppress(FileNotFoundError):
+                os.remove(path)
+            total -= size
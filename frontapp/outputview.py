@@ -0,0 +1,245 @@
+from math import ceil
+from threading import Lock
+from typing import Sequence
+
+from PyQt5.QtCore import (
+    QAbstractListModel,
+    QEvent,
+    QModelIndex,
+    QRect,
+    Qt,
+    QTimer,
+    pyqtSignal,
+)
+from PyQt5.QtWidgets import (
+    QAbstractItemView,
+    QHeaderView,
+    QStyledItemDelegate,
+    QTableView,
+)
+
+from frontapp.imagecache import ImageCache
+
+DEFAULT_SCROLLBACK = 1_000_000
+# вывод копится и попадает в модель не чаще раза за кадр
+FRAME_INTERVAL_MS = 16
+# картинки шире этого уменьшаются
+IMAGE_MAX_WIDTH = 640
+# длиннее строка не расширяет горизонтальную прокрутку
+MAX_LINE_COLUMNS = 4096
+
+
+class ImagePart:
+    """Строка вывода, которую занимает полоса картинки."""
+
+    __slots__ = ("key", "part", "width", "height")
+
+    def __init__(self, key: str, part: int, width: int, height: int) -> None:
+        self.key = key
+        self.part = part
+        # размер всей картинки на экране
+        self.width = width
+        self.height = height
+
+
+class OutputModel(QAbstractListModel):
+    """
+    Строки вывода в кольцевом буфере на scrollback строк: когда буфер полон,
+    новые строки вытесняют самые старые. Строка - str или ImagePart.
+    """
+
+    def __init__(self, scrollback: int = DEFAULT_SCROLLBACK, parent=None) -> None:
+        super().__init__(parent)
+        self.__lines: list[str | ImagePart | None] = [None] * scrollback
+        self.__start = 0
+        self.__count = 0
+        self.max_columns = 0
+
+    @property
+    def scrollback(self) -> int:
+        return len(self.__lines)
+
+    def rowCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        return 0 if parent.isValid() else self.__count
+
+    def data(self, index: QModelIndex, role: int = Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or role != Qt.ItemDataRole.DisplayRole:
+            return None
+        return self.line(index.row())
+
+    def line(self, row: int) -> str | ImagePart | None:
+        return self.__lines[(self.__start + row) % len(self.__lines)]
+
+    def extend(self, lines: list[str | ImagePart]) -> None:
+        """Добавляет строки в конец, вытесняя старые."""
+        capacity = len(self.__lines)
+        lines = lines[-capacity:]
+        if not lines:
+            return
+        evicted = self.__count + len(lines) - capacity
+        if evicted > 0:
+            self.beginRemoveRows(QModelIndex(), 0, evicted - 1)
+            self.__start = (self.__start + evicted) % capacity
+            self.__count -= evicted
+            self.endRemoveRows()
+        first = self.__count
+        self.beginInsertRows(QModelIndex(), first, first + len(lines) - 1)
+        for offset, line in enumerate(lines):
+            self.__lines[(self.__start + first + offset) % capacity] = line
+            if isinstance(line, str) and len(line) > self.max_columns:
+                self.max_columns = min(len(line), MAX_LINE_COLUMNS)
+        self.__count += len(lines)
+        self.endInsertRows()
+
+    def clear(self) -> None:
+        self.beginResetModel()
+        self.__lines = [None] * len(self.__lines)
+        self.__start = 0
+        self.__count = 0
+        self.max_columns = 0
+        self.endResetModel()
+
+
+class OutputDelegate(QStyledItemDelegate):
+    """
+    Рисует строку одним drawText, а картинку - полосами высотой в строку:
+    все строки одной высоты, и представление не измеряет ни одну из них.
+    """
+
+    def __init__(self, images: ImageCache, parent=None) -> None:
+        super().__init__(parent)
+        self.__images = images
+
+    def paint(self, painter, option, index) -> None:
+        line = index.data()
+        if isinstance(line, ImagePart):
+            self.__paint_image(painter, option.rect, line)
+        elif line:
+            painter.setPen(option.palette.text().color())
+            flags = (
+                Qt.AlignmentFlag.AlignLeft
+                | Qt.AlignmentFlag.AlignVCenter
+                | Qt.TextFlag.TextExpandTabs
+            )
+            painter.drawText(option.rect, flags, line)
+
+    def __paint_image(self, painter, rect: QRect, part: ImagePart) -> None:
+        image = self.__images.get(part.key)
+        if image is None or image.isNull():
+            return
+        scale = image.width() / part.width
+        top = part.part * rect.height()
+        height = min(rect.height(), part.height - top)
+        source = QRect(0, int(top * scale), image.width(), int(height * scale))
+        target = QRect(rect.left(), rect.top(), part.width, height)
+        painter.drawImage(target, image, source)
+
+
+class OutputView(QTableView):
+    """
+    Вывод терминала - таблица в один столбец со строками фиксированной
+    высоты: добавление строк и прокрутка не зависят от размера вывода
+    (QListView на каждой вставке заново раскладывает все строки). Рисуются
+    только видимые строки. append можно вызывать из любого потока:
+    текст копится и попадает в модель одним пакетом за кадр.
+    """
+
+    # в буфере появился вывод; из любого потока в GUI-поток
+    output_pending = pyqtSignal()
+
+    def __init__(
+        self, images: ImageCache, scrollback: int = DEFAULT_SCROLLBACK, parent=None
+    ) -> None:
+        super().__init__(parent)
+        self.__images = images
+        self.__model = OutputModel(scrollback, self)
+        self.setModel(self.__model)
+        self.setItemDelegate(OutputDelegate(images, self))
+        header, rows = self.horizontalHeader(), self.verticalHeader()
+        assert header is not None and rows is not None
+        header.hide()
+        rows.hide()
+        rows.setSectionResizeMode(QHeaderView.Fixed)
+        self.__fit_rows()
+        header.setSectionResizeMode(QHeaderView.Fixed)
+        self.setShowGrid(False)
+        self.setWordWrap(False)
+        self.setSelectionMode(QAbstractItemView.NoSelection)
+        self.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.setVerticalScrollMode(QAbstractItemView.ScrollPerPixel)
+        self.setHorizontalScrollMode(QAbstractItemView.ScrollPerPixel)
+        self.__lock = Lock()
+        self.__pending: list[str | ImagePart] = []
+        self.__timer = QTimer(self)
+        self.__timer.setSingleShot(True)
+        self.__timer.setInterval(FRAME_INTERVAL_MS)
+        self.__timer.timeout.connect(self.flush)
+        self.output_pending.connect(self.__timer.start)
+
+    def append(self, text: str) -> None:
+        """Добавляет текст с новой строки."""
+        self.__push(text.removesuffix("\n").split("\n"))
+
+    def append_image(self, key: str) -> None:
+        """Добавляет картинку из кэша по ключу."""
+        image = self.__images.get(key)
+        if image is None or image.isNull():
+            return
+        width = min(image.width(), IMAGE_MAX_WIDTH)
+        height = max(image.height() * width // image.width(), 1)
+        parts = ceil(height / self.fontMetrics().height())
+        self.__push([ImagePart(key, part, width, height) for part in range(parts)])
+
+    def clear(self) -> None:
+        with self.__lock:
+            self.__pending.clear()
+        self.__model.clear()
+
+    def flush(self) -> None:
+        """Переносит накопленный вывод в модель; вызывается в GUI-потоке."""
+        with self.__lock:
+            lines, self.__pending = self.__pending, []
+        if not lines:
+            return
+        scrollbar = self.verticalScrollBar()
+        assert scrollbar is not None
+        # к новому выводу прокручиваем, только если пользователь смотрит в конец
+        follow = scrollbar.value() >= scrollbar.maximum()
+        columns = self.__model.max_columns
+        self.__model.extend(lines)
+        if self.__model.max_columns != columns:
+            self.__fit_width()
+        if follow:
+            self.scrollToBottom()
+
+    def resizeEvent(self, event) -> None:
+        super().resizeEvent(event)
+        self.__fit_width()
+
+    def changeEvent(self, event) -> None:
+        super().changeEvent(event)
+        if event.type() in (QEvent.Type.FontChange, QEvent.Type.StyleChange):
+            # шрифт из таблицы стилей приходит уже после __init__
+            self.__fit_rows()
+            self.__fit_width()
+
+    def __fit_rows(self) -> None:
+        """Высота строки - по текущему шрифту."""
+        rows = self.verticalHeader()
+        assert rows is not None
+        rows.setDefaultSectionSize(self.fontMetrics().height())
+
+    def __fit_width(self) -> None:
+        """Столбец шириной в самую длинную строку, но не уже окна."""
+        columns = self.__model.max_columns + 1
+        width = self.fontMetrics().horizontalAdvance("0") * columns
+        header, viewport = self.horizontalHeader(), self.viewport()
+        assert header is not None and viewport is not None
+        header.resizeSection(0, max(width, viewport.width()))
+
+    def __push(self, lines: Sequence[str | ImagePart]) -> None:
+        with self.__lock:
+            was_empty = not self.__pending
+            self.__pending.extend(lines)
+        if was_empty:
+            self.output_pending.emit()
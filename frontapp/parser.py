@@ -1,12 +1,10 @@
 import base64
-import os
+import hashlib
 import re
-import subprocess
-import sys
-import uuid
-from pathlib import Path
 
-from loguru import logger
+from frontapp.imagecache import is_cache_key
+
+IMAGE_MIME_TYPES = ("image/png", "image/jpeg", "image/gif")
 
 
 def remove_ansi_escape(text: str) -> str:
@@ -33,31 +31,51 @@ def parse_text(jupyter_output: dict | None) -> str | None:
         return remove_ansi_escape(output)
 
 
+def parse_spill(jupyter_output: dict | None) -> dict | None:
+    """
+    Описание вывода, который сервер сохранил у себя вместо отправки:
+    {"handle", "offset", "tail_offset", "size"}. Клиенту уже показаны байты
+    до offset и после tail_offset, остальное дочитывается страницами.
+    """
+    if not isinstance(jupyter_output, dict):
+        return
+    return jupyter_output.get("content", {}).get("spill")
+
+
+def split_cells(code: str) -> list[str]:
+    """Делит скрипт на ячейки по маркерам "# %%"."""
+    cells = re.split(r"^# ?%%.*$", code, flags=re.MULTILINE)
+    return [cell.strip() for cell in cells if cell.strip()]
+
+
 def is_execution_ended(jupyter_output: dict | None) -> bool:
     if not jupyter_output:
         return
     return jupyter_output.get("command", "") == "notebook-end"
 
 
-def show_image(jupyter_output: dict | None) -> Path | None:
-    if not isinstance(jupyter_output, dict):
+def is_execution_interrupted(jupyter_output: dict | None) -> bool:
+    if not jupyter_output:
         return
-    if not (
-        image := jupyter_output.get("content", {}).get("data", {}).get("image/png")
-    ):
-        logger.info(f"check for image {image}")
+    return jupyter_output.get("command", "") == "notebook-interrupt"
+
+
+def parse_image(jupyter_output: dict | None) -> tuple[str, bytes] | None:
+    """
+    Картинка из вывода ячейки: (sha256, содержимое). Сервер присылает
+    картинки бинарными вложениями вместе с их sha256; base64 от старых
+    версий сервера тоже понимается. sha256 не того вида считается заново.
+    """
+    if not isinstance(jupyter_output, dict):
         return
-    file_path = Path(os.path.abspath(__file__)).parent
-    image_file_path = file_path / Path("files")
-    image_file_path.mkdir(parents=True, exist_ok=True)
-    image_file_path = image_file_path / f"{uuid.uuid4()}.png"
-    binary_data = base64.b64decode(image)
-    with image_file_path.open("wb") as file:
-        file.write(binary_data)
-    if sys.platform == "darwin":
-        subprocess.run(["open", image_file_path])
-    elif sys.platform == "win32":
-        os.startfile(image_file_path)
-    elif sys.platform == "linux":
-        subprocess.run(["xdg-open", image_file_path])
-    return image_file_path
+    content = jupyter_output.get("content", {})
+    data = content.get("data", {})
+    for mime in IMAGE_MIME_TYPES:
+        if not (image := data.get(mime)):
+            continue
+        if isinstance(image, str):
+            image = base64.b64decode(image)
+        key = content.get("sha256", {}).get(mime)
+        if not is_cache_key(key):
+            key = hashlib.sha256(image).hexdigest()
+        return key, image
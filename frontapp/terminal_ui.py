@@ -1,22 +1,25 @@
 import asyncio
-from contextlib import suppress
+from concurrent.futures import Future
+from itertools import count
 from pathlib import Path
-from queue import Empty, Queue
 from threading import Event, Thread
+from typing import Awaitable, Callable
 
-import requests
+import aiohttp
 from loguru import logger
-from PyQt5.QtCore import Qt
-from PyQt5.QtGui import QTextCursor
-from PyQt5.QtWidgets import QMenu
+from PyQt5.QtCore import Qt, pyqtSignal
+from PyQt5.QtGui import QImage
 from PyQt5.QtWidgets import (
     QFileDialog,
     QHBoxLayout,
     QLineEdit,
     QListWidget,
+    QListWidgetItem,
     QMainWindow,
+    QMenu,
+    QProgressDialog,
     QPushButton,
-    QScrollArea,
+    QStatusBar,
     QTextEdit,
     QVBoxLayout,
     QWidget,
@@ -24,22 +27,82 @@ from PyQt5.QtWidgets import (
 
 from frontapp.client import SocketIOClient
 from frontapp.highlight import PythonHighlighter
-from frontapp.parser import is_execution_ended, parse_text, show_image
+from frontapp.imagecache import ImageCache
+from frontapp.outputview import OutputView
+from frontapp.parser import (
+    is_execution_ended,
+    is_execution_interrupted,
+    parse_image,
+    parse_spill,
+    parse_text,
+    split_cells,
+)
+from frontapp.transfer import (
+    delete_file,
+    download_file,
+    fetch_output_page,
+    list_files,
+    upload_file,
+)
 
 
 class PythonTerminal(QMainWindow):
+    # изменения списка файлов сервера: (новые и измененные записи, удаленные имена)
+    files_changed = pyqtSignal(list, list)
+    # картинка из вывода ячейки уже в кэше, ключ - ее sha256
+    image_received = pyqtSignal(str)
+    # вывод ячейки сохранен на сервере и не показан целиком
+    spill_received = pyqtSignal(dict)
+    # текст вывода, накопившийся за одно пробуждение потока клиента
+    output_received = pyqtSignal(str)
+    # подключение к серверу установлено (True) или разорвано (False)
+    connection_changed = pyqtSignal(bool)
+    # ячейка (или пакет ячеек) досчитана: пришел notebook-end
+    execution_finished = pyqtSignal()
+    # kernel прерван, очередь ячеек на сервере сброшена
+    execution_interrupted = pyqtSignal()
+    # страница списка файлов; True - первая, список строится заново
+    files_listed = pyqtSignal(list, bool)
+    # страница большого вывода; пустой словарь - не удалось загрузить
+    output_page_received = pyqtSignal(dict)
+    # прогресс загрузки или скачивания: (id, сделано байт, всего байт)
+    transfer_progress = pyqtSignal(int, int, int)
+    # загрузка или скачивание кончились: (id, сообщение для вывода)
+    transfer_finished = pyqtSignal(int, str)
+
     def __init__(self):
         super().__init__()
         self.setWindowTitle("Python Terminal")
         self.setGeometry(100, 100, 800, 600)
 
+        self.__images = ImageCache(QImage.fromData)
         self.initUI()
         self.__client = SocketIOClient()
-        self.__code_queue = Queue()
         self.__client_connection: Thread | None = None
-        self.__connected = False
-        self.__connect_lock = Event()
-        self.__execute_lock = Event()
+        # команды потоку клиента; очередь живет в его event loop
+        self.__loop: asyncio.AbstractEventLoop | None = None
+        self.__commands: asyncio.Queue | None = None
+        self.__loop_ready = Event()
+        # сколько отправленных запусков ячеек еще не досчитано
+        self.__running = 0
+        # окна прогресса идущих загрузок и скачиваний по id
+        self.__transfers: dict[int, QProgressDialog] = {}
+        self.__transfer_ids = count()
+        # элементы списка файлов по имени, чтобы применять изменения точечно
+        self.__file_items: dict[str, QListWidgetItem] = {}
+        self.files_changed.connect(self._apply_files_delta)
+        self.image_received.connect(self._add_image)
+        # непоказанная часть последнего большого вывода
+        self.__spill: dict | None = None
+        self.spill_received.connect(self._set_spill)
+        self.output_received.connect(self._add_output)
+        self.connection_changed.connect(self._connection_changed)
+        self.execution_finished.connect(self._execution_finished)
+        self.execution_interrupted.connect(self._execution_interrupted)
+        self.files_listed.connect(self._set_files)
+        self.output_page_received.connect(self._add_output_page)
+        self.transfer_progress.connect(self._show_transfer_progress)
+        self.transfer_finished.connect(self._finish_transfer)
 
     def initUI(self):
         # Main widget
@@ -89,12 +152,11 @@ class PythonTerminal(QMainWindow):
         url_layout.addWidget(self.connect_btn)
         layout.addLayout(url_layout)
 
-        # Output area
-        self.output_area = QTextEdit()
-        self.output_area.setReadOnly(True)
+        # Output area: рисуются только видимые строки вывода
+        self.output_area = OutputView(self.__images)
         self.output_area.setStyleSheet(
             """
-            QTextEdit {
+            QTableView {
                 background-color: #1E1E1E;
                 color: #D4D4D4;
                 font-family: Consolas, Courier New, monospace;
@@ -102,13 +164,6 @@ class PythonTerminal(QMainWindow):
             }
         """
         )
-        tab_width = self.output_area.fontMetrics().width(" ") * 3
-        self.output_area.setTabStopDistance(tab_width)
-
-        # Scroll area for output
-        scroll = QScrollArea()
-        scroll.setWidget(self.output_area)
-        scroll.setWidgetResizable(True)
 
         # Правая панель: кнопка загрузки + список файлов
         self.load_file_btn = QPushButton("Load file")
@@ -140,6 +195,7 @@ class PythonTerminal(QMainWindow):
             }
         """
         )
+        self.files_list.setSortingEnabled(True)
         # двойной клик по файлу
         self.files_list.itemDoubleClicked.connect(self._file_double_clicked)
         # контекстное меню по правому клику
@@ -153,7 +209,7 @@ class PythonTerminal(QMainWindow):
         right_panel.addWidget(self.files_list)
 
         output_and_files_layout = QHBoxLayout()
-        output_and_files_layout.addWidget(scroll, 3)  # слева вывод
+        output_and_files_layout.addWidget(self.output_area, 3)  # слева вывод
         output_and_files_layout.addLayout(right_panel, 1)  # справа файлы
 
         layout.addLayout(output_and_files_layout)
@@ -198,14 +254,26 @@ class PythonTerminal(QMainWindow):
         )
         self.execute_btn.clicked.connect(self.execute_command)
 
+        self.interrupt_btn = QPushButton("Interrupt")
+        self.interrupt_btn.setStyleSheet(self.execute_btn.styleSheet())
+        self.interrupt_btn.clicked.connect(self._interrupt)
+        self.interrupt_btn.setEnabled(False)
+
         # Clear button
         self.clear_btn = QPushButton("Clear")
         self.clear_btn.setStyleSheet(self.execute_btn.styleSheet())
         self.clear_btn.clicked.connect(self.clear_input)
+
+        self.more_btn = QPushButton("More")
+        self.more_btn.setStyleSheet(self.execute_btn.styleSheet())
+        self.more_btn.clicked.connect(self._show_more_output)
+        self.more_btn.setEnabled(False)
         self.execute_btn.setEnabled(False)
 
         input_controls.addWidget(self.execute_btn)
+        input_controls.addWidget(self.interrupt_btn)
         input_controls.addWidget(self.clear_btn)
+        input_controls.addWidget(self.more_btn)
 
         layout.addLayout(input_controls)
         layout.addWidget(self.input_area)
@@ -214,22 +282,22 @@ class PythonTerminal(QMainWindow):
         self.input_area.setFocus()
 
     def _connect_event(self) -> None:
-        self.__connect_lock.clear()
+        # ответ придет сигналом connection_changed, окно тем временем живет
+        self.connect_btn.setEnabled(False)
         if not self.__client.connected():
             self.__client.set_server_url(self.url_input.text().strip())
-            self.__connected = True
-            self.__connect_lock.wait()
-            if self.__connected:
-                self._connected_event()
-            else:
-                self._add_output("Can't connect to server")
+            self.__status_bar().showMessage("Connecting...")
+            self.__submit(("connect", None))
         else:
-            self.__connected = False
-            self.__connect_lock.wait()
-            if not self.__connected:
-                self._disconnect_event()
-            else:
-                self._add_output("Can't disconnect from server")
+            self.__submit(("disconnect", None))
+
+    def _connection_changed(self, connected: bool) -> None:
+        self.connect_btn.setEnabled(True)
+        self.__status_bar().clearMessage()
+        if connected:
+            self._connected_event()
+        else:
+            self._disconnect_event()
 
     def _connected_event(self):
         self.connect_btn.setText("Disconnect")
@@ -245,95 +313,271 @@ class PythonTerminal(QMainWindow):
         self.execute_btn.setEnabled(False)
         self.load_file_btn.setDisabled(True)
         self.files_list.clear()
+        self.__file_items.clear()
+        self.__running = 0
+        self._show_running()
 
     def _refresh_files_list(self) -> None:
-        """Обновление списка файлов с сервера."""
-        self.files_list.clear()
+        """Обновление списка файлов с сервера, постранично."""
+        self.__spawn(self.__list_files())
+
+    async def __list_files(self) -> None:
+        cursor, first = None, True
         try:
-            response = requests.get(f"{self.__client.server_url}/service/file-list")
-            if response.status_code == 200:
-                files = [file["name"] for file in response.json()]
-            else:
-                files = []
-        except Exception:
-            files = []
-        if files:
-            self.files_list.addItems(files)
+            while True:
+                entries, cursor = await list_files(
+                    self.__client.http, self.__client.server_url, cursor
+                )
+                self.files_listed.emit(entries, first)
+                first = False
+                if cursor is None:
+                    return
+        except Exception as e:
+            logger.exception(e)
+
+    def _set_files(self, entries: list[dict], reset: bool) -> None:
+        if reset:
+            self.files_list.clear()
+            self.__file_items.clear()
+        self._add_files(entries)
+
+    def _add_files(self, entries: list[dict]) -> None:
+        for entry in entries:
+            name = entry["name"]
+            # в списке только содержимое корня UPLOAD_DIR
+            if "/" in name or name in self.__file_items:
+                continue
+            item = QListWidgetItem(name)
+            self.__file_items[name] = item
+            self.files_list.addItem(item)
+
+    def _remove_file_item(self, name: str) -> None:
+        if (item := self.__file_items.pop(name, None)) is not None:
+            self.files_list.takeItem(self.files_list.row(item))
+
+    def _apply_files_delta(self, added: list[dict], removed: list[str]) -> None:
+        """Применяет присланные сервером изменения, не перестраивая список."""
+        for name in removed:
+            self._remove_file_item(name)
+        self._add_files(added)
 
     def start_client(self) -> None:
         if self.__client_connection and self.__client_connection.is_alive():
             raise RuntimeError("Connection already set")
+        self.__loop_ready.clear()
         self.__client_connection = Thread(
             target=asyncio.run, args=(self._client_connection(),), daemon=True
         )
-        self.__running = True
         self.__client_connection.start()
 
     def stop_client(self) -> None:
-        if self.__client_connection and not self.__client_connection.is_alive():
+        if not self.__client_connection or not self.__client_connection.is_alive():
             return
-        self.__running = False
-        try:
-            self.__client_connection.join(2)
-        except RuntimeError:
+        self.__submit(None)
+        self.__client_connection.join(2)
+        if self.__client_connection.is_alive():
             logger.warning("Can't stop thread")
 
+    def __status_bar(self) -> QStatusBar:
+        # QMainWindow создает строку состояния при первом обращении
+        status = self.statusBar()
+        assert status is not None
+        return status
+
+    def __submit(self, command: tuple[str, object] | None) -> None:
+        """
+        Передает команду потоку клиента; None - остановить его. Команды
+        исполняются по очереди.
+        """
+        self.__loop_ready.wait()
+        assert self.__loop is not None and self.__commands is not None
+        self.__loop.call_soon_threadsafe(self.__commands.put_nowait, command)
+
+    def __spawn(self, job: Awaitable) -> Future:
+        """
+        Запускает job в потоке клиента отдельной задачей, не дожидаясь
+        команд перед ней. Возвращаемый Future можно отменить из GUI-потока.
+        """
+        self.__loop_ready.wait()
+        assert self.__loop is not None
+        future = asyncio.run_coroutine_threadsafe(job, self.__loop)
+        future.add_done_callback(self.__log_failure)
+        return future
+
+    @staticmethod
+    def __log_failure(future: Future) -> None:
+        if not future.cancelled() and (e := future.exception()) is not None:
+            logger.opt(exception=e).error("Client job failed")
+
     async def _client_connection(self) -> None:
-        while self.__running:
+        """
+        Поток клиента спит, пока нет команд от GUI или сообщений сервера:
+        вывод разбирается пачками и уходит в GUI-поток сигналами.
+        """
+        self.__loop = asyncio.get_running_loop()
+        self.__commands = asyncio.Queue()
+        self.__loop_ready.set()
+        consumers = [
+            asyncio.create_task(self.__consume_output()),
+            asyncio.create_task(self.__consume_files()),
+        ]
+        try:
+            while (command := await self.__commands.get()) is not None:
+                try:
+                    await self.__run_command(*command)
+                except Exception as e:  # noqa: PIE786
+                    logger.exception(e)
+        finally:
+            for consumer in consumers:
+                consumer.cancel()
+            await self.__client.close()
+
+    async def __run_command(self, name: str, argument) -> None:
+        if name == "connect":
             try:
                 if not self.__client.connected():
-                    await asyncio.sleep(0.2)
-                if self.__connected and not self.__client.connected():
-                    try:
-                        await self.__client.connect()
-                    except Exception:
-                        self.__connected = False
-                        raise
-                    finally:
-                        if not self.__connect_lock.is_set():
-                            self.__connect_lock.set()
-                elif not self.__connected and self.__client.connected():
-                    try:
-                        await self.__client.disconnect()
-                    except Exception:
-                        self.__connected = True
-                        raise
-                    finally:
-                        if not self.__connect_lock.is_set():
-                            self.__connect_lock.set()
-                command = await self.__client.get_output()
-                out = parse_text(command)
-                show_image(command)
-                if out:
-                    self._add_output(out)
-                elif is_execution_ended(command) and not self.__execute_lock.is_set():
-                    self.__execute_lock.set()
-                with suppress(Empty):
-                    code = self.__code_queue.get_nowait()
-                    if code:
-                        await self.__client.execute_command(code)
+                    await self.__client.connect()
+            except Exception as e:  # noqa: PIE786
+                logger.exception(e)
+                self.output_received.emit("Can't connect to server")
+            finally:
+                self.connection_changed.emit(self.__client.connected())
+        elif name == "disconnect":
+            try:
+                if self.__client.connected():
+                    await self.__client.disconnect()
             except Exception as e:  # noqa: PIE786
                 logger.exception(e)
-            await asyncio.sleep(0.01)
-        if self.__client.connected():
-            await self.disconnect()
-            self.__connected = False
+                self.output_received.emit("Can't disconnect from server")
+            finally:
+                self.connection_changed.emit(self.__client.connected())
+        elif name == "execute":
+            try:
+                if isinstance(argument, list):
+                    await self.__client.execute_cells(argument)
+                else:
+                    await self.__client.execute_command(argument)
+            except Exception:
+                # notebook-end не придет: запуск считается законченным
+                self.execution_finished.emit()
+                raise
+        elif name == "interrupt":
+            await self.__client.interrupt()
+
+    async def __consume_output(self) -> None:
+        while True:
+            texts = []
+            for command in await self.__client.get_outputs():
+                try:
+                    if out := parse_text(command):
+                        texts.append(out)
+                    if (image := parse_image(command)) is not None:
+                        # картинка декодируется здесь, GUI-поток только вставляет ее
+                        key, data = image
+                        self.__images.put(key, data)
+                        # текст до картинки должен попасть в вывод раньше нее
+                        self.__emit_output(texts)
+                        self.image_received.emit(key)
+                    if (spill := parse_spill(command)) is not None:
+                        self.spill_received.emit(spill)
+                    if is_execution_ended(command):
+                        self.__emit_output(texts)
+                        self.execution_finished.emit()
+                    elif is_execution_interrupted(command):
+                        self.execution_interrupted.emit()
+                except Exception as e:  # noqa: PIE786
+                    logger.exception(e)
+            self.__emit_output(texts)
+
+    def __emit_output(self, texts: list[str]) -> None:
+        if texts:
+            self.output_received.emit("\n".join(texts))
+            texts.clear()
+
+    async def __consume_files(self) -> None:
+        while True:
+            delta = await self.__client.get_files_delta()
+            self.files_changed.emit(delta["added"], delta["removed"])
 
     def clear_input(self):
         # сейчас clear чистит output_area
         self.output_area.clear()
 
-    def _execute_command_sync(self, command: str) -> None:
-        self.__execute_lock.clear()
-        self.__code_queue.put(command)
-        self.__execute_lock.wait()
+    def _execute_code(self, command: str) -> None:
+        # скрипт с маркерами "# %%" уходит пакетом ячеек за один запрос
+        cells = split_cells(command)
+        self.__running += 1
+        self._show_running()
+        self.__submit(("execute", cells if len(cells) > 1 else command))
+
+    def _interrupt(self) -> None:
+        self.__submit(("interrupt", None))
+
+    def _execution_finished(self) -> None:
+        # notebook-end других клиентов той же сессии тоже приходят сюда
+        self.__running = max(self.__running - 1, 0)
+        self._show_running()
+
+    def _execution_interrupted(self) -> None:
+        # досчитается только прерванная ячейка, очередь сервер сбросил
+        self.__running = min(self.__running, 1)
+        self._show_running()
+
+    def _show_running(self) -> None:
+        self.interrupt_btn.setEnabled(self.__running > 0)
+        if self.__running:
+            self.__status_bar().showMessage(f"Running... ({self.__running} queued)")
+        else:
+            self.__status_bar().clearMessage()
 
     def _add_output(self, output: str) -> None:
         if output:
             self.output_area.append(output)
-        self.output_area.moveCursor(QTextCursor.End)
-        scrollbar = self.output_area.verticalScrollBar()
-        scrollbar.setValue(scrollbar.maximum())
+
+    def _add_image(self, key: str) -> None:
+        self.output_area.append_image(key)
+
+    def _set_spill(self, spill: dict) -> None:
+        if self.__spill is not None and self.__spill["handle"] == spill["handle"]:
+            # пока ячейка идет, вывод в файле растет: прочитанное не перечитываем
+            spill = {**spill, "offset": max(spill["offset"], self.__spill["offset"])}
+        self.__spill = dict(spill)
+        self.more_btn.setEnabled(spill["offset"] < spill["tail_offset"])
+
+    def _show_more_output(self) -> None:
+        """Дочитывает с сервера следующую страницу большого вывода."""
+        if self.__spill is None:
+            return
+        spill = self.__spill
+        self.more_btn.setEnabled(False)
+        self.__spawn(
+            self.__fetch_output_page(
+                spill["handle"], spill["offset"], spill["tail_offset"] - spill["offset"]
+            )
+        )
+
+    async def __fetch_output_page(self, handle: str, offset: int, limit: int) -> None:
+        try:
+            page = await fetch_output_page(
+                self.__client.http, self.__client.server_url, handle, offset, limit
+            )
+        except Exception as e:
+            logger.exception(e)
+            page = {}
+        self.output_page_received.emit(page)
+
+    def _add_output_page(self, page: dict) -> None:
+        spill = self.__spill
+        if spill is None:
+            return
+        if not page:
+            self._add_output("Can't load more output")
+            self.__spill = None
+            return
+        spill["offset"] = page["next_offset"]
+        self._add_output(page["text"])
+        # прочитанный до конца вывод еще может вырасти, пока ячейка идет
+        self.more_btn.setEnabled(spill["offset"] < spill["tail_offset"])
 
     def execute_command(self):
         command = self.input_area.toPlainText().strip()
@@ -346,7 +590,7 @@ class PythonTerminal(QMainWindow):
             return
 
         self.input_area.clear()
-        self._execute_command_sync(command)
+        self._execute_code(command)
 
     def load_file(self) -> None:
         file_path, _ = QFileDialog.getOpenFileName(
@@ -358,21 +602,63 @@ class PythonTerminal(QMainWindow):
         if not file_path:
             return
 
-        file_path = Path(file_path)
+        path = Path(file_path)
+        self.__start_transfer(
+            f"Uploading {path.name}",
+            lambda progress: self.__upload(path, progress),
+        )
 
+    async def __upload(self, path: Path, progress: Callable[[int, int], None]) -> str:
         try:
-            with open(file_path, "rb") as f:
-                requests.post(
-                    f"{self.__client.server_url}/service/upload",
-                    files={"file": (file_path.name, f)},
-                )
+            # в списке файл появится из изменений, которые пришлет сервер
+            await upload_file(
+                self.__client.http, self.__client.server_url, path, progress=progress
+            )
         except Exception as e:
             logger.exception(e)
-            self._add_output(f"Can't load file: {file_path.name}")
-        else:
-            # После загрузки лучше сразу обновить список с сервера,
-            # чтобы не было расхождений.
-            self._refresh_files_list()
+            return f"Can't load file: {path.name}"
+        return ""
+
+    def __start_transfer(
+        self, label: str, job: Callable[[Callable[[int, int], None]], Awaitable[str]]
+    ) -> None:
+        """
+        Запускает загрузку или скачивание в потоке клиента с окном прогресса.
+        job получает функцию progress(сделано, всего) и возвращает сообщение
+        для вывода. Отмена в окне прерывает передачу; прерванная передача
+        того же файла потом продолжится с места остановки.
+        """
+        transfer_id = next(self.__transfer_ids)
+        dialog = QProgressDialog(label, "Cancel", 0, 1000, self)
+        dialog.setMinimumDuration(500)
+        dialog.setValue(0)
+        self.__transfers[transfer_id] = dialog
+
+        def progress(done: int, total: int) -> None:
+            self.transfer_progress.emit(transfer_id, done, total)
+
+        def finished(future: Future) -> None:
+            message = "" if future.cancelled() else future.result()
+            self.transfer_finished.emit(transfer_id, message)
+
+        future = self.__spawn(job(progress))
+
+        def cancel() -> None:
+            future.cancel()
+
+        future.add_done_callback(finished)
+        dialog.canceled.connect(cancel)
+
+    def _show_transfer_progress(self, transfer_id: int, done: int, total: int) -> None:
+        dialog = self.__transfers.get(transfer_id)
+        if dialog is not None and total and not dialog.wasCanceled():
+            dialog.setValue(min(int(done * 1000 / total), 999))
+
+    def _finish_transfer(self, transfer_id: int, message: str) -> None:
+        if (dialog := self.__transfers.pop(transfer_id, None)) is not None:
+            dialog.close()
+        if message:
+            self._add_output(message)
 
     def _file_double_clicked(self, item) -> None:
         """
@@ -381,20 +667,22 @@ class PythonTerminal(QMainWindow):
         """
         name = item.text()
         if name.lower().endswith(".py"):
-            self._execute_command_sync(f"%run {name}")
+            self._execute_code(f"%run {name}")
 
     def _show_files_context_menu(self, pos) -> None:
         """
         Контекстное меню по правому клику:
-        - Delete file (если клик по элементу)
+        - Download, Delete file (если клик по элементу)
         - Refresh (всегда)
         """
         item = self.files_list.itemAt(pos)
 
         menu = QMenu(self)
         refresh_action = menu.addAction("Refresh")
+        download_action = None
         delete_action = None
         if item is not None:
+            download_action = menu.addAction("Download")
             delete_action = menu.addAction("Delete file")
 
         global_pos = self.files_list.mapToGlobal(pos)
@@ -405,26 +693,52 @@ class PythonTerminal(QMainWindow):
 
         if action == refresh_action:
             self._refresh_files_list()
+        elif download_action is not None and action == download_action:
+            self._download_file(item)
         elif delete_action is not None and action == delete_action:
             self._delete_file(item)
 
-    def _delete_file(self, item) -> None:
+    def _download_file(self, item) -> None:
         """
-        Удаление файла на сервере и из списка.
+        Скачивание файла с сервера с прогрессом. Отмененное или прерванное
+        скачивание того же файла продолжится с места остановки.
         """
         name = item.text()
+        target, _ = QFileDialog.getSaveFileName(self, "Save file", name)
+        if not target:
+            return
+
+        self.__start_transfer(
+            f"Downloading {name}",
+            lambda progress: self.__download(name, Path(target), progress),
+        )
+
+    async def __download(
+        self, name: str, target: Path, progress: Callable[[int, int], None]
+    ) -> str:
         try:
-            resp = requests.delete(
-                f"{self.__client.server_url}/service/delete-file",
-                params={"name": name},
+            await download_file(
+                self.__client.http, self.__client.server_url, name, target, progress
             )
-            if resp.status_code != 200:
-                self._add_output(f"Can't delete file: {name}")
-                return
         except Exception as e:
             logger.exception(e)
-            self._add_output(f"Error while deleting file: {name}")
-            return
+            return f"Can't download file: {name}"
+        return f"Downloaded {name} to {target}"
 
-        row = self.files_list.row(item)
-        self.files_list.takeItem(row)
+    def _delete_file(self, item) -> None:
+        """
+        Удаление файла на сервере и из списка.
+        """
+        self.__spawn(self.__delete_file(item.text()))
+
+    async def __delete_file(self, name: str) -> None:
+        try:
+            await delete_file(self.__client.http, self.__client.server_url, name)
+        except aiohttp.ClientResponseError:
+            self.output_received.emit(f"Can't delete file: {name}")
+            return
+        except Exception as e:
+            logger.exception(e)
+            self.output_received.emit(f"Error while deleting file: {name}")
+            return
+        self.files_changed.emit([], [name])
@@ -0,0 +1,180 @@
+import asyncio
+import hashlib
+from pathlib import Path
+from typing import AsyncIterator, Callable
+from urllib.parse import quote
+
+import aiohttp
+
+CHUNK_SIZE = 8 * 1024 * 1024
+READ_SIZE = 1024 * 1024
+
+
+def sha256_file(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as f:
+        while chunk := f.read(READ_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _read_chunk(path: Path, start: int, size: int) -> bytes:
+    with path.open("rb") as f:
+        f.seek(start)
+        return f.read(size)
+
+
+async def _read_range(path: Path, start: int, size: int) -> AsyncIterator[bytes]:
+    # диск читается в потоке, чтобы не держать event loop клиента
+    while size > 0:
+        chunk = await asyncio.to_thread(_read_chunk, path, start, min(READ_SIZE, size))
+        if not chunk:
+            return
+        start += len(chunk)
+        size -= len(chunk)
+        yield chunk
+
+
+def _append(path: Path, data: bytes) -> None:
+    with path.open("ab") as f:
+        f.write(data)
+
+
+async def upload_file(
+    http: aiohttp.ClientSession,
+    server_url: str,
+    path: Path,
+    name: str | None = None,
+    chunk_size: int = CHUNK_SIZE,
+    progress: Callable[[int, int], None] | None = None,
+) -> dict:
+    """
+    Загружает файл на сервер кусками PUT /service/upload/{name}.
+
+    Если прошлая загрузка того же файла прервалась, продолжает с места, где
+    она остановилась. С последним куском отправляется sha256 файла, сервер
+    сверяет его с полученными данными.
+    progress(sent, total) вызывается после каждого куска.
+    """
+    url = f"{server_url}/service/upload/{quote(name or path.name)}"
+    total = path.stat().st_size
+    checksum = await asyncio.to_thread(sha256_file, path)
+    async with http.head(url) as response:
+        response.raise_for_status()
+        offset = int(response.headers.get("Upload-Offset", 0))
+    if offset >= total:
+        offset = 0
+    while True:
+        size = min(chunk_size, total - offset)
+        headers = {}
+        # пустой файл уходит одним запросом без Content-Range
+        if total:
+            headers["Content-Range"] = f"bytes {offset}-{offset + size - 1}/{total}"
+        if offset + size == total:
+            headers["X-Checksum-Sha256"] = checksum
+        async with http.put(
+            url, data=_read_range(path, offset, size), headers=headers
+        ) as response:
+            if response.status == 409:
+                # сервер ждет другое смещение, продолжаем с него
+                offset = int(response.headers["Upload-Offset"])
+                continue
+            response.raise_for_status()
+            result = await response.json()
+        offset = result["offset"]
+        if progress is not None:
+            progress(offset, total)
+        if result["complete"]:
+            return result
+
+
+async def download_file(
+    http: aiohttp.ClientSession,
+    server_url: str,
+    name: str,
+    target: Path,
+    progress: Callable[[int, int], None] | None = None,
+) -> Path:
+    """
+    Скачивает файл GET /service/download/{name} в target.
+
+    Данные пишутся в target.part; если прошлое скачивание прервалось, оно
+    продолжается с места остановки через Range. Рядом с target.part хранится
+    ETag (или Last-Modified) файла, и докачка просит его в If-Range: если файл
+    на сервере с тех пор изменился, сервер отдает его целиком, и скачивание
+    начинается заново. progress(received, total) вызывается после каждого
+    прочитанного куска.
+    """
+    url = f"{server_url}/service/download/{quote(name)}"
+    part = target.with_name(f"{target.name}.part")
+    validator_path = target.with_name(f"{target.name}.part.validator")
+    offset = part.stat().st_size if part.exists() else 0
+    validator = validator_path.read_text() if validator_path.exists() else None
+    headers = {}
+    if offset and validator:
+        headers = {"Range": f"bytes={offset}-", "If-Range": validator}
+    async with http.get(url, headers=headers) as response:
+        if response.status == 416:
+            # файл на сервере стал короче: качаем заново
+            part.unlink()
+            validator_path.unlink(missing_ok=True)
+            return await download_file(http, server_url, name, target, progress)
+        response.raise_for_status()
+        if response.status != 206:
+            # файл отдан целиком: начатое без проверки или устаревшее не годится
+            offset = 0
+            part.write_bytes(b"")
+            validator = response.headers.get("ETag") or response.headers.get(
+                "Last-Modified"
+            )
+            if validator:
+                validator_path.write_text(validator)
+        total = offset + (response.content_length or 0)
+        async for chunk in response.content.iter_chunked(READ_SIZE):
+            await asyncio.to_thread(_append, part, chunk)
+            offset += len(chunk)
+            if progress is not None:
+                progress(offset, total)
+    part.replace(target)
+    validator_path.unlink(missing_ok=True)
+    return target
+
+
+async def list_files(
+    http: aiohttp.ClientSession, server_url: str, cursor: str | None = None
+) -> tuple[list[dict], str | None]:
+    """Страница списка файлов сервера и курсор следующей страницы."""
+    async with http.get(
+        f"{server_url}/service/file-list",
+        params={"cursor": cursor} if cursor else None,
+    ) as response:
+        response.raise_for_status()
+        return await response.json(), response.headers.get("X-Next-Cursor")
+
+
+async def delete_file(http: aiohttp.ClientSession, server_url: str, name: str) -> None:
+    async with http.delete(
+        f"{server_url}/service/delete-file", params={"name": name}
+    ) as response:
+        response.raise_for_status()
+
+
+async def fetch_output_page(
+    http: aiohttp.ClientSession,
+    server_url: str,
+    handle: str,
+    offset: int,
+    limit: int | None = None,
+) -> dict:
+    """
+    Страница вывода ячейки, сохраненного на сервере:
+    {"text", "offset", "next_offset", "size"}
+    """
+    params = {"offset": offset}
+    if limit is not None:
+        params["limit"] = limit
+    async with http.get(
+        f"{server_url}/service/output/{handle}", params=params
+    ) as response:
+        response.raise_for_status()
+        return await response.json()
@@ -0,0 +1,39 @@
+import base64
+import hashlib
+
+# типы данных, которые kernel присылает в base64
+BINARY_MIME_TYPES = (
+    "image/png",
+    "image/jpeg",
+    "image/gif",
+    "image/webp",
+    "application/pdf",
+)
+# сообщения iopub, в которых бывают такие данные
+RICH_MSG_TYPES = ("display_data", "execute_result", "update_display_data")
+
+
+def decode_binary(content: dict) -> dict:
+    """
+    Заменяет base64-строки двоичных типов в content["data"] на bytes: socket.io
+    отправляет bytes бинарными вложениями, без раздувания на треть и без
+    декодирования на клиенте. sha256 каждого вложения кладется в
+    content["sha256"][mime], клиент кэширует картинки по нему.
+    """
+    data = content.get("data")
+    if not data:
+        return content
+    decoded = {
+        mime: base64.b64decode(value)
+        for mime in BINARY_MIME_TYPES
+        if isinstance(value := data.get(mime), str)
+    }
+    if not decoded:
+        return content
+    return {
+        **content,
+        "data": {**data, **decoded},
+        "sha256": {
+            mime: hashlib.sha256(value).hexdigest() for mime, value in decoded.items()
+        },
+    }
@@ -0,0 +1,77 @@
+import asyncio
+from threading import Lock
+from typing import Callable
+from weakref import WeakKeyDictionary
+
+
+class LoopBridge:
+    """
+    Передача вызовов из потоков kernel-ов в event loop.
+
+    call_soon_threadsafe будит loop записью в его self-pipe - системный
+    вызов на каждое сообщение iopub. Мост копит вызовы и ставит их в loop
+    одним call_soon_threadsafe на пачку: пока пачка ждет loop, новые вызовы
+    дописываются в нее. Вызовы выполняются в порядке поступления.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop) -> None:
+        self.__loop = loop
+        self.__lock = Lock()
+        self.__pending: list[tuple[Callable, tuple]] = []
+        # notify-вызовы, уже стоящие в пачке
+        self.__notified: set[Callable] = set()
+        self.__scheduled = False
+        # сколько раз мост будил loop
+        self.wakeups = 0
+
+    def call_soon(self, callback: Callable, *args) -> None:
+        """Вызывается из любого потока, в том числе из потока loop-а."""
+        with self.__lock:
+            self.__pending.append((callback, args))
+            self.__schedule()
+
+    def notify(self, callback: Callable) -> None:
+        """
+        Как call_soon для идемпотентных вызовов вроде Event.set: в пачке такой
+        вызов выполняется один раз, сколько бы раз его ни поставили.
+        """
+        with self.__lock:
+            if callback in self.__notified:
+                return
+            self.__notified.add(callback)
+            self.__pending.append((callback, ()))
+            self.__schedule()
+
+    def __schedule(self) -> None:
+        if self.__scheduled:
+            return
+        try:
+            self.__loop.call_soon_threadsafe(self.__run)
+        except RuntimeError:
+            # loop уже закрыт: выполнять вызовы больше некому
+            self.__pending.clear()
+            self.__notified.clear()
+            return
+        self.__scheduled = True
+        self.wakeups += 1
+
+    def __run(self) -> None:
+        with self.__lock:
+            pending = self.__pending
+            self.__pending = []
+            self.__notified.clear()
+            self.__scheduled = False
+        for callback, args in pending:
+            callback(*args)
+
+
+_bridges: WeakKeyDictionary[asyncio.AbstractEventLoop, LoopBridge] = WeakKeyDictionary()
+_bridges_lock = Lock()
+
+
+def loop_bridge(loop: asyncio.AbstractEventLoop) -> LoopBridge:
+    """Общий мост event loop-а: все kernel-ы будят loop одними пачками."""
+    with _bridges_lock:
+        if (bridge := _bridges.get(loop)) is None:
+            bridge = _bridges[loop] = LoopBridge(loop)
+        return bridge
@@ -0,0 +1,216 @@
+import time
+from collections import deque
+from threading import Condition
+
+from .models import OverflowPolicy
+
+
+def payload_size(value) -> int:
+    """Грубая оценка размера сообщения без сериализации в JSON."""
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(payload_size(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(payload_size(item) for item in value)
+    return 8
+
+
+def stream_name(message: dict) -> str | None:
+    if message.get("command") != "notebook-upd" or message.get("msg_type") != "stream":
+        return None
+    return message.get("content", {}).get("name")
+
+
+def is_display(message: dict) -> bool:
+    """Показ, который можно выбросить при переполнении: картинка, график."""
+    return message.get("command") == "notebook-upd" and message.get("msg_type") in (
+        "display_data",
+        "update_display_data",
+    )
+
+
+def display_id(message: dict) -> str | None:
+    if message.get("msg_type") != "update_display_data":
+        return None
+    return message.get("content", {}).get("transient", {}).get("display_id")
+
+
+class OutputBuffer:
+    """
+    Ограниченный буфер сообщений для одного адресата.
+
+    Пишут в него потоки kernel-а и event loop, читает Sender. Поведение при
+    переполнении задается OverflowPolicy. При DROP и LATEST сообщения, которые
+    нельзя выбросить (конец ячейки, ошибка, результат), занимают место
+    выброшенных показов, а если показов в буфере нет - кладутся сверх
+    maxsize: таких сообщений не больше нескольких на ячейку.
+    """
+
+    def __init__(self, maxsize: int, policy: OverflowPolicy) -> None:
+        self.__items: deque[dict] = deque()
+        # time.monotonic() получения каждого сообщения, параллельно __items
+        self.__received: deque[float] = deque()
+        self.__maxsize = maxsize
+        self.__policy = policy
+        self.__condition = Condition()
+        # маркер пропущенных строк, пока он последний в буфере
+        self.__marker: dict | None = None
+        # маркер выброшенных показов, пока он в буфере
+        self.__display_marker: dict | None = None
+        self.elided_displays = 0
+        self.__displays: dict[str, dict] = {}
+        self.__closed = False
+        self.size_bytes = 0
+        self.high_water_mark = 0
+        # когда было получено самое старое сообщение последнего drain
+        self.oldest_received: float | None = None
+
+    def __len__(self) -> int:
+        return len(self.__items)
+
+    def full(self) -> bool:
+        return len(self.__items) >= self.__maxsize
+
+    def put(
+        self, message: dict, block: bool = True, received_at: float | None = None
+    ) -> int:
+        """
+        Кладет сообщение в буфер и возвращает число выброшенных строк.
+
+        block=False не дает ждать места даже при политике BLOCK: так пишет
+        event loop, который сам же и разгребает буфер.
+        received_at - когда сообщение пришло из kernel-а, по умолчанию сейчас
+        """
+        with self.__condition:
+            if self.__policy == OverflowPolicy.LATEST and self.__replace_display(
+                message
+            ):
+                return 0
+            if len(self.__items) >= self.__maxsize:
+                if self.__policy == OverflowPolicy.BLOCK:
+                    while (
+                        block
+                        and len(self.__items) >= self.__maxsize
+                        and not self.__closed
+                    ):
+                        self.__condition.wait()
+                elif stream_name(message) is not None:
+                    return self.__elide(message)
+                elif not self.__make_room() and is_display(message):
+                    self.__elide_display(None)
+                    return 0
+            self.__items.append(message)
+            self.__received.append(
+                time.monotonic() if received_at is None else received_at
+            )
+            self.__marker = None
+            if (key := display_id(message)) is not None:
+                self.__displays[key] = message
+            self.size_bytes += payload_size(message)
+            self.high_water_mark = max(self.high_water_mark, len(self.__items))
+            return 0
+
+    def drain(self, max_bytes: int | None = None) -> list[dict]:
+        """Забирает сообщения из начала буфера, но не больше max_bytes."""
+        messages = []
+        size = 0
+        with self.__condition:
+            self.oldest_received = self.__received[0] if self.__received else None
+            while self.__items and (max_bytes is None or size < max_bytes):
+                message = self.__items.popleft()
+                self.__received.popleft()
+                message_size = payload_size(message)
+                size += message_size
+                if "elided" not in message:
+                    # маркеры пропусков не учитываются в size_bytes
+                    self.size_bytes -= message_size
+                if message is self.__marker:
+                    self.__marker = None
+                if message is self.__display_marker:
+                    self.__display_marker = None
+                if (key := display_id(message)) is not None and (
+                    self.__displays.get(key) is message
+                ):
+                    del self.__displays[key]
+                messages.append(message)
+            self.__condition.notify_all()
+        return messages
+
+    def close(self) -> None:
+        """Отпускает всех, кто ждет места в буфере."""
+        with self.__condition:
+            self.__closed = True
+            self.__condition.notify_all()
+
+    def __replace_display(self, message: dict) -> bool:
+        key = display_id(message)
+        if key is None or (queued := self.__displays.get(key)) is None:
+            return False
+        # в буфере лежит еще не отправленное обновление того же display_id
+        self.size_bytes += payload_size(message) - payload_size(queued)
+        queued.clear()
+        queued.update(message)
+        return True
+
+    def __make_room(self) -> bool:
+        """Выбрасывает самые старые показы, пока буфер полон; False - их нет."""
+        while len(self.__items) >= self.__maxsize:
+            index = next(
+                (i for i, item in enumerate(self.__items) if is_display(item)), None
+            )
+            if index is None:
+                return False
+            self.__elide_display(index)
+        return True
+
+    def __elide_display(self, index: int | None) -> None:
+        """
+        Выбрасывает показ с позиции index (None - пришедший, он в буфер не
+        попал). Первый выброшенный показ заменяется маркером, следующие
+        добавляются к его счетчику: показы после маркера всегда новее.
+        """
+        self.elided_displays += 1
+        if index is not None:
+            evicted = self.__items[index]
+            self.size_bytes -= payload_size(evicted)
+            if (key := display_id(evicted)) is not None and (
+                self.__displays.get(key) is evicted
+            ):
+                del self.__displays[key]
+        if self.__display_marker is None:
+            self.__display_marker = {
+                "command": "notebook-upd",
+                "msg_type": "stream",
+                "content": {"name": "stdout", "text": ""},
+                "elided": 0,
+            }
+            if index is None:
+                self.__items.append(self.__display_marker)
+                self.__received.append(time.monotonic())
+            else:
+                self.__items[index] = self.__display_marker
+        elif index is not None:
+            del self.__items[index]
+            del self.__received[index]
+        self.__display_marker["elided"] += 1
+        self.__display_marker["content"][
+            "text"
+        ] = f"\n... {self.__display_marker['elided']} displays elided ...\n"
+
+    def __elide(self, message: dict) -> int:
+        lines = max(message["content"].get("text", "").count("\n"), 1)
+        if self.__marker is None:
+            self.__marker = {
+                "command": "notebook-upd",
+                "msg_type": "stream",
+                "content": {"name": message["content"]["name"], "text": ""},
+                "elided": 0,
+            }
+            self.__items.append(self.__marker)
+            self.__received.append(time.monotonic())
+        self.__marker["elided"] += lines
+        self.__marker["content"][
+            "text"
+        ] = f"\n... {self.__marker['elided']} lines elided ...\n"
+        return lines
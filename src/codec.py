@@ -0,0 +1,22 @@
+from .models import OutputCodec
+
+try:
+    import msgpack
+except ImportError:  # без msgpack вывод кодируется только в JSON
+    msgpack = None
+
+
+def check_codec(codec: OutputCodec) -> None:
+    if codec == OutputCodec.MSGPACK and msgpack is None:
+        raise RuntimeError("OUTPUT_CODEC=msgpack requires the msgpack package")
+
+
+def pack_messages(messages: list[dict], codec: OutputCodec) -> list[dict] | bytes:
+    """
+    Сообщения вывода в виде, в котором они уходят клиенту: список как есть
+    для JSON или одно бинарное вложение msgpack. Двоичные данные картинок
+    msgpack хранит как есть, без отдельных вложений socket.io.
+    """
+    if codec == OutputCodec.MSGPACK:
+        return msgpack.packb(messages)
+    return messages
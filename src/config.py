@@ -1,10 +1,15 @@
+import tempfile
 from functools import lru_cache
 from pathlib import Path
 
 from pydantic import BaseSettings, Field
 
+from .models import OutputCodec, OverflowPolicy
+
 
 class JupyterClientInfo(BaseSettings):
+    # ipc - unix-сокеты вместо tcp loopback; ip тогда не нужен, файлы
+    # сокетов каждого kernel-а создаются в KERNEL_IPC_DIR
     transport: str = Field("tcp", env="JUPYTER_SHELL_TRANSPORT")
     ip: str = Field("127.0.0.1", env="JUPYTER_SHELL_HOST")
     shell_port: int = Field(4023, env="JUPYTER_SHELL_PORT")
@@ -17,8 +22,70 @@ class JupyterClientInfo(BaseSettings):
 class Config(BaseSettings):
     SOCKETIO_HOST: str = "0.0.0.0"
     SOCKETIO_PORT: int = 8000
+    # UDP-порт, на котором сервер отвечает клиентам, ищущим его; 0 - не отвечать
+    DISCOVERY_PORT: int = 8765
+    # какой порт socket.io сообщать клиентам, если снаружи он другой (docker)
+    DISCOVERY_ADVERTISED_PORT: int | None = None
+    # сжатие websocket-кадров (permessage-deflate), если клиент его предлагает
+    WS_PER_MESSAGE_DEFLATE: bool = True
     jupyter_client_info: JupyterClientInfo = JupyterClientInfo()  # type: ignore[call-arg]
     UPLOAD_DIR: Path = Path("/user")
+    # сколько прогретых свободных kernel-ов держать наготове
+    KERNEL_POOL_MIN_SIZE: int = 1
+    # сколько kernel-ов (свободных и занятых сессиями) может быть одновременно
+    KERNEL_POOL_MAX_SIZE: int = 8
+    # через сколько секунд простоя без подключенных клиентов kernel сессии гасится
+    KERNEL_IDLE_TTL_S: float = 600
+    # сдвиг портов jupyter_client_info для каждого следующего kernel-а пула
+    KERNEL_PORT_STRIDE: int = 5
+    # как часто проверять heartbeat kernel-а (0 - не проверять) и через сколько
+    # секунд без ответа считать kernel мертвым и заменять его
+    KERNEL_HEARTBEAT_INTERVAL_S: float = 1.0
+    KERNEL_HEARTBEAT_TIMEOUT_S: float = 5.0
+    KERNEL_IPC_DIR: Path = Path(tempfile.gettempdir()) / "connector-ipc"
+    # окно, за которое Sender копит сообщения в один пакет; 0 - без пакетов
+    SENDER_BATCH_WINDOW_S: float = 0.016
+    # пакет отправляется досрочно, когда набирает столько байт полезной нагрузки
+    SENDER_BATCH_MAX_BYTES: int = 64 * 1024
+    # сколько сообщений может ждать отправки одному адресату
+    OUTPUT_BUFFER_MAX_MESSAGES: int = 10_000
+    OUTPUT_BUFFER_POLICY: OverflowPolicy = OverflowPolicy.DROP
+    OUTPUT_CODEC: OutputCodec = OutputCodec.JSON
+    # сколько последних сообщений сессии хранится, чтобы дослать их клиенту,
+    # вернувшемуся после обрыва связи; журнал без обращений живет KERNEL_IDLE_TTL_S
+    REPLAY_BUFFER_MESSAGES: int = 10_000
+    REPLAY_BUFFER_BYTES: int = 16 * 1024 * 1024
+    # сколько сообщений iopub может ждать обработки, прежде чем чтение из kernel-а встанет
+    KERNEL_QUEUE_MAX_MESSAGES: int = 10_000
+    # сколько байт загружаемого файла копится в памяти перед записью на диск
+    UPLOAD_WRITE_BUFFER_BYTES: int = 1024 * 1024
+    # каким куском файл читается с диска при скачивании
+    DOWNLOAD_CHUNK_BYTES: int = 1024 * 1024
+    # как часто пересканировать UPLOAD_DIR, если watchfiles не установлен
+    FILE_INDEX_POLL_S: float = 2.0
+    # сколько записей отдает одна страница списка файлов
+    FILE_LIST_PAGE_SIZE: int = 1000
+    # сколько байт вывода ячейки уходит клиентам, прежде чем остальное пойдет в файл
+    OUTPUT_PREVIEW_BYTES: int = 64 * 1024
+    # сколько последних байт такого вывода клиенты получают по окончании ячейки
+    OUTPUT_TAIL_BYTES: int = 16 * 1024
+    # пока вывод ячейки идет в файл, клиенты раз в столько секунд получают его
+    # последнюю строку и текущий размер
+    OUTPUT_LIVE_PREVIEW_S: float = 1.0
+    # наибольшая страница, которой клиент дочитывает вывод из файла
+    OUTPUT_PAGE_BYTES: int = 256 * 1024
+    SPILL_DIR: Path = Path(tempfile.gettempdir()) / "connector-spill"
+    # сколько секунд хранится файл с выводом ячейки
+    SPILL_TTL_S: float = 3600
+
+    # уровень логов и уровни отдельных модулей, например {"src.sender": "DEBUG"};
+    # сообщения о каждом выводе kernel-а пишутся на уровне DEBUG
+    LOG_LEVEL: str = "INFO"
+    LOG_LEVELS: dict[str, str] = {}
+    # из сообщений hot path в лог попадает каждое LOG_SAMPLE_EVERY-е, значения
+    # в них обрезаются до LOG_MAX_CHARS символов
+    LOG_SAMPLE_EVERY: int = 100
+    LOG_MAX_CHARS: int = 300
 
     @property
     def connection_info(self) -> dict:
@@ -0,0 +1,54 @@
+import asyncio
+import json
+from typing import cast
+
+from loguru import logger
+
+from .config import get_settings
+
+config = get_settings()
+
+# запрос поиска; сервер отвечает {"service": SERVICE, "port": порт socket.io}.
+# Клиент ставится без серверных зависимостей, поэтому держит копию этих
+# констант в frontapp/discovery.py: менять их нужно в обоих местах
+DISCOVERY_REQUEST = b"connector-discover"
+SERVICE = "connector"
+
+
+class DiscoveryBeacon(asyncio.DatagramProtocol):
+    """
+    Отвечает по UDP на запросы поиска сервера: клиент узнает порт socket.io
+    одним пакетом вместо перебора портов. Запрос может прийти и на
+    broadcast-адрес сети.
+    """
+
+    def __init__(self, port: int) -> None:
+        self.__reply = json.dumps({"service": SERVICE, "port": port}).encode()
+        self.__transport: asyncio.DatagramTransport | None = None
+
+    def connection_made(self, transport: asyncio.BaseTransport) -> None:
+        self.__transport = cast(asyncio.DatagramTransport, transport)
+
+    def datagram_received(self, data: bytes, addr: tuple) -> None:
+        if data.strip() == DISCOVERY_REQUEST and self.__transport is not None:
+            self.__transport.sendto(self.__reply, addr)
+
+
+async def start_beacon() -> asyncio.DatagramTransport | None:
+    """Запускает DiscoveryBeacon на DISCOVERY_PORT; 0 - не запускать."""
+    if not config.DISCOVERY_PORT:
+        return None
+    loop = asyncio.get_running_loop()
+    try:
+        transport, _ = await loop.create_datagram_endpoint(
+            lambda: DiscoveryBeacon(
+                config.DISCOVERY_ADVERTISED_PORT or config.SOCKETIO_PORT
+            ),
+            local_addr=(config.SOCKETIO_HOST, config.DISCOVERY_PORT),
+        )
+    except OSError as e:
+        # без маяка клиенты найдут сервер перебором портов
+        logger.warning(f"Discovery beacon is off: {e}")
+        return None
+    logger.info(f"Discovery beacon on udp port {config.DISCOVERY_PORT}")
+    return transport
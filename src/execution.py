@@ -0,0 +1,135 @@
+import asyncio
+import queue
+import time
+from contextlib import suppress
+from threading import Event
+from typing import AsyncIterator
+
+from .bridge import loop_bridge
+from .config import get_settings
+from .models import KernelResult
+from .spill import OutputSpill
+
+config = get_settings()
+
+
+class Execution:
+    """
+    Одна ячейка, отправленная в kernel.
+
+    Поток iopub kernel-а складывает сюда результаты ячейки, корутина Handler-а
+    забирает их через async for. Очередь ограничена: если результаты не
+    успевают уходить клиенту, поток iopub ждет.
+
+    Ячейка считается завершенной по статусу idle с ее msg_id в parent_header.
+    Если idle потерялся, завершением служит execute_reply: после него ячейка
+    завершается, когда вывод не приходил REPLY_GRACE_S. Большое сообщение
+    iopub может прийти заметно позже маленького execute_reply.
+    """
+
+    POLL_TIMEOUT_S = 0.5
+    REPLY_GRACE_S = 5.0
+
+    def __init__(self, msg_id: str, loop: asyncio.AbstractEventLoop) -> None:
+        self.msg_id = msg_id
+        self.__loop = loop
+        self.__bridge = loop_bridge(loop)
+        self.__results: queue.Queue[KernelResult] = queue.Queue(
+            maxsize=config.KERNEL_QUEUE_MAX_MESSAGES
+        )
+        self.__ready = asyncio.Event()
+        self.__reply: asyncio.Future[dict] = loop.create_future()
+        self.__finished = Event()
+        self.__cancelled = Event()
+        self.__last_output = time.monotonic()
+        # time.monotonic() статусов busy и idle ячейки, их ставит поток kernel-а
+        self.started_at: float | None = None
+        self.finished_at: float | None = None
+        # ограничение вывода ячейки; работает в потоке kernel-а
+        self.spill = OutputSpill()
+
+    def put(self, result: KernelResult) -> None:
+        """Вызывается из потока kernel-а."""
+        self.__last_output = time.monotonic()
+        while not self.__cancelled.is_set():
+            try:
+                self.__results.put(result, timeout=self.POLL_TIMEOUT_S)
+            except queue.Full:
+                continue
+            self.__wakeup()
+            return
+
+    def finish(self) -> None:
+        """Вызывается из потока kernel-а, когда ячейка досчитана."""
+        self.__finished.set()
+        self.__wakeup()
+
+    def fail(self, ename: str, evalue: str) -> None:
+        """
+        Завершает ячейку ошибкой, когда kernel уже не ответит (например,
+        умер). Вызывается из любого потока и не ждет места в очереди.
+        """
+        with suppress(queue.Full):
+            self.__results.put_nowait(
+                KernelResult(
+                    msg_content={
+                        "ename": ename,
+                        "evalue": evalue,
+                        "traceback": [f"{ename}: {evalue}"],
+                    },
+                    msg_type="error",
+                    msg_id=self.msg_id,
+                )
+            )
+        self.finish()
+        self.set_reply({"status": "error", "ename": ename, "evalue": evalue})
+
+    def set_reply(self, content: dict) -> None:
+        """Вызывается из потока, получившего execute_reply."""
+        self.__bridge.call_soon(self.__on_reply, content)
+
+    def cancel(self) -> None:
+        """Прекращает выдачу результатов; ожидающий поток kernel-а отпускается."""
+        self.__cancelled.set()
+        self.__wakeup()
+        self.__bridge.call_soon(self.__on_reply, {})
+
+    async def reply(self) -> dict:
+        """
+        Содержимое execute_reply (status, execution_count, ...); пустой
+        словарь, если ячейку отменили до ответа.
+        """
+        return await self.__reply
+
+    def __on_reply(self, content: dict) -> None:
+        if self.__reply.done():
+            return
+        self.__reply.set_result(content)
+        if not self.__cancelled.is_set():
+            self.__finish_when_quiet()
+
+    def __finish_when_quiet(self) -> None:
+        if self.__finished.is_set():
+            return
+        quiet = time.monotonic() - self.__last_output
+        if quiet < self.REPLY_GRACE_S:
+            self.__loop.call_later(self.REPLY_GRACE_S - quiet, self.__finish_when_quiet)
+        else:
+            self.finish()
+
+    async def __aiter__(self) -> AsyncIterator[KernelResult]:
+        while not self.__cancelled.is_set():
+            try:
+                result = self.__results.get_nowait()
+            except queue.Empty:
+                if self.__finished.is_set():
+                    return
+                self.__ready.clear()
+                if self.__results.empty() and not self.__finished.is_set():
+                    await self.__ready.wait()
+                continue
+            yield result
+
+    def __wakeup(self) -> None:
+        # пока потребитель не проснулся, новые сообщения loop не будят
+        self.__bridge.notify(self.__ready.set)
@@ -0,0 +1,220 @@
+import asyncio
+import os
+from bisect import bisect_left, bisect_right, insort
+from pathlib import Path
+from typing import Awaitable, Callable
+
+from loguru import logger
+
+from .config import get_settings
+
+try:
+    from watchfiles import awatch
+except ImportError:  # без watchfiles каталог периодически пересканируется
+    awatch = None
+
+config = get_settings()
+
+# обработчик изменений: (новые и измененные записи, имена удаленных)
+Listener = Callable[[list[dict], list[str]], Awaitable[None]]
+
+
+class FileIndex:
+    """
+    Кэш содержимого UPLOAD_DIR для списка файлов.
+
+    Каталог сканируется один раз (os.scandir в потоке), дальше индекс
+    обновляется по событиям файловой системы (watchfiles/inotify), а если
+    watchfiles не установлен - периодическим пересканированием. Изменения
+    рассылаются подписчикам дельтами.
+
+    Имена записей - пути относительно UPLOAD_DIR через "/", индекс хранит их
+    отсортированными: страница списка - бинарный поиск по курсору.
+    """
+
+    # незавершенные загрузки в списке не показываются
+    HIDDEN_SUFFIXES = (".part",)
+    # при большем числе изменений список имен пересобирается целиком
+    RESORT_THRESHOLD = 1000
+
+    def __init__(
+        self, base_dir: Path | None = None, poll_interval_s: float | None = None
+    ) -> None:
+        self.__base = base_dir or config.UPLOAD_DIR
+        self.__poll_interval_s = (
+            config.FILE_INDEX_POLL_S if poll_interval_s is None else poll_interval_s
+        )
+        self.__entries: dict[str, dict] = {}
+        self.__names: list[str] = []
+        self.__listeners: list[Listener] = []
+        self.__ready = asyncio.Event()
+        self.__task: asyncio.Task | None = None
+
+    def subscribe(self, listener: Listener) -> None:
+        self.__listeners.append(listener)
+
+    def start(self) -> None:
+        """Запускает сканирование и слежение; повторные вызовы ничего не делают."""
+        if self.__task is None:
+            self.__task = asyncio.ensure_future(self.__watch())
+
+    async def stop(self) -> None:
+        if self.__task is None:
+            return
+        self.__task.cancel()
+        try:
+            await self.__task
+        except asyncio.CancelledError:
+            pass
+
+    async def page(
+        self, cursor: str | None = None, limit: int = 1000, recursive: bool = False
+    ) -> tuple[list[dict], str | None]:
+        """
+        Записи, следующие за cursor (имя последней записи прошлой страницы),
+        не больше limit. Возвращает записи и курсор следующей страницы.
+        recursive=False - только содержимое самого UPLOAD_DIR.
+        """
+        self.start()
+        await self.__ready.wait()
+        names = self.__names
+        index = bisect_right(names, cursor) if cursor else 0
+        items: list[dict] = []
+        # одна запись сверх limit показывает, есть ли следующая страница
+        while index < len(names) and len(items) <= limit:
+            name = names[index]
+            if not recursive and "/" in name:
+                # пропускаем все содержимое подкаталога: "0" идет сразу за "/"
+                index = bisect_left(names, name.split("/", 1)[0] + "0")
+                continue
+            items.append(self.__entries[name])
+            index += 1
+        if len(items) <= limit:
+            return items, None
+        items.pop()
+        return items, items[-1]["name"]
+
+    async def __watch(self) -> None:
+        self.__merge(await asyncio.to_thread(self.__scan, ""), [""])
+        self.__ready.set()
+        logger.info(f"File index of {self.__base}: {len(self.__entries)} entries")
+        if awatch is not None and self.__base.is_dir():
+            async for changes in awatch(self.__base):
+                scopes = sorted({self.__relative(Path(path)) for _, path in changes})
+                found = await asyncio.to_thread(self.__scan_scopes, scopes)
+                await self.__notify(*self.__merge(found, scopes))
+        else:
+            reason = (
+                "watchfiles is not installed" if awatch is None else "not a directory"
+            )
+            logger.warning(
+                f"File index of {self.__base} falls back to a rescan every "
+                f"{self.__poll_interval_s} s: {reason}"
+            )
+            while True:
+                await asyncio.sleep(self.__poll_interval_s)
+                found = await asyncio.to_thread(self.__scan, "")
+                await self.__notify(*self.__merge(found, [""]))
+
+    async def __notify(self, added: list[dict], removed: list[str]) -> None:
+        if not added and not removed:
+            return
+        for listener in self.__listeners:
+            try:
+                await listener(added, removed)
+            except Exception as e:
+                logger.opt(exception=e).warning("File index listener failed")
+
+    def __merge(
+        self, found: dict[str, dict], scopes: list[str]
+    ) -> tuple[list[dict], list[str]]:
+        """
+        Сливает результат сканирования в индекс. scopes - просканированные
+        пути: все, что лежало в них и не найдено заново, удалено.
+        """
+        removed = [
+            name
+            for scope in scopes
+            for name in self.__names_in(scope)
+            if name not in found
+        ]
+        added = [
+            entry for name, entry in found.items() if self.__entries.get(name) != entry
+        ]
+        resort = len(added) + len(removed) > self.RESORT_THRESHOLD
+        for name in removed:
+            del self.__entries[name]
+            if not resort:
+                del self.__names[bisect_left(self.__names, name)]
+        for entry in added:
+            if entry["name"] not in self.__entries and not resort:
+                insort(self.__names, entry["name"])
+            self.__entries[entry["name"]] = entry
+        if resort:
+            self.__names = sorted(self.__entries)
+        return added, removed
+
+    def __names_in(self, scope: str) -> list[str]:
+        """Имена записи scope и всего, что лежит под ней."""
+        if not scope:
+            return list(self.__names)
+        names = [scope] if scope in self.__entries else []
+        # "0" идет сразу за "/": между ними лежит только содержимое scope
+        start = bisect_left(self.__names, scope + "/")
+        end = bisect_left(self.__names, scope + "0")
+        return names + self.__names[start:end]
+
+    def __relative(self, path: Path) -> str:
+        name = path.relative_to(self.__base).as_posix()
+        return "" if name == "." else name
+
+    def __scan_scopes(self, scopes: list[str]) -> dict[str, dict]:
+        found: dict[str, dict] = {}
+        for scope in scopes:
+            found.update(self.__scan(scope))
+        return found
+
+    def __scan(self, scope: str) -> dict[str, dict]:
+        """Записи scope и всего, что под ним; "" - весь UPLOAD_DIR."""
+        found: dict[str, dict] = {}
+        path = self.__base / scope if scope else self.__base
+        if scope.endswith(self.HIDDEN_SUFFIXES):
+            return found
+        if scope:
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                return found
+            found[scope] = self.__entry(scope, stat, path.is_dir())
+            if not path.is_dir():
+                return found
+        stack = [path]
+        while stack:
+            try:
+                with os.scandir(stack.pop()) as it:
+                    for item in it:
+                        if item.name.endswith(self.HIDDEN_SUFFIXES):
+                            continue
+                        is_dir = item.is_dir(follow_symlinks=False)
+                        name = self.__relative(Path(item.path))
+                        try:
+                            found[name] = self.__entry(name, item.stat(), is_dir)
+                        except FileNotFoundError:
+                            continue
+                        if is_dir:
+                            stack.append(Path(item.path))
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+        return found
+
+    @staticmethod
+    def __entry(name: str, stat: os.stat_result, is_dir: bool) -> dict:
+        return {
+            "name": name,
+            "type": "directory" if is_dir else "file",
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+        }
+
+
+file_index = FileIndex()
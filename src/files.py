@@ -0,0 +1,249 @@
+import asyncio
+import hashlib
+import os
+import re
+import zlib
+from pathlib import Path
+from typing import AsyncIterator
+
+from .config import get_settings
+
+try:
+    import zstandard
+except ImportError:  # zstd - необязательная зависимость
+    zstandard = None
+
+config = get_settings()
+
+CONTENT_RANGE = re.compile(r"bytes (?:(\d+)-(\d+)|\*)/(\d+|\*)")
+
+
+class UploadConflict(Exception):
+    """Кусок не продолжает загрузку с места, где она остановилась."""
+
+    def __init__(self, message: str, offset: int) -> None:
+        super().__init__(message)
+        self.offset = offset
+
+
+class ChecksumMismatch(ValueError):
+    pass
+
+
+def resolve_path(name: str) -> Path:
+    """
+    Путь к файлу внутри UPLOAD_DIR. Имена, уводящие за пределы каталога
+    (абсолютные пути, ".."), запрещены.
+    """
+    base = config.UPLOAD_DIR.resolve()
+    path = (base / name).resolve()
+    if base not in path.parents:
+        raise ValueError(f"Path is outside of the upload directory: {name}")
+    return path
+
+
+def parse_content_range(header: str) -> tuple[int | None, int | None, int | None]:
+    """
+    "bytes 0-99/1000" -> (0, 99, 1000); "bytes */1000" -> (None, None, 1000).
+    Неизвестный общий размер ("/*") - None.
+    """
+    if (match := CONTENT_RANGE.fullmatch(header.strip())) is None:
+        raise ValueError(f"Invalid Content-Range: {header}")
+    first, last, size = match.groups()
+    total = None if size == "*" else int(size)
+    if first is None:
+        return None, None, total
+    start, end = int(first), int(last)
+    if end < start or (total is not None and end >= total):
+        raise ValueError(f"Invalid Content-Range: {header}")
+    return start, end, total
+
+
+def content_encodings() -> list[str]:
+    """Поддерживаемые сжатия ответа, в порядке предпочтения."""
+    return ["zstd", "gzip"] if zstandard is not None else ["gzip"]
+
+
+def choose_encoding(accept_encoding: str | None) -> str | None:
+    """Выбирает сжатие из Accept-Encoding клиента."""
+    if not accept_encoding:
+        return None
+    accepted = set()
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        if params.strip().replace(" ", "") not in ("q=0", "q=0.0", "q=0.00"):
+            accepted.add(name.strip().lower())
+    return next(
+        (encoding for encoding in content_encodings() if encoding in accepted), None
+    )
+
+
+async def compressed_chunks(
+    path: Path, encoding: str, chunk_size: int | None = None
+) -> AsyncIterator[bytes]:
+    """Читает и сжимает файл в потоке, отдавая event loop-у готовые куски."""
+    chunk_size = chunk_size or config.DOWNLOAD_CHUNK_BYTES
+    if encoding == "zstd":
+        compressor = zstandard.ZstdCompressor().compressobj()
+    else:
+        compressor = zlib.compressobj(wbits=31)  # 31 - формат gzip
+
+    def read_compressed(f) -> bytes | None:
+        """None - файл дочитан."""
+        if not (chunk := f.read(chunk_size)):
+            return None
+        return compressor.compress(chunk)
+
+    with path.open("rb") as f:
+        while (data := await asyncio.to_thread(read_compressed, f)) is not None:
+            if data:
+                yield data
+    yield compressor.flush()
+
+
+class UploadStore:
+    """
+    Загрузки файлов в UPLOAD_DIR кусками с докачкой.
+
+    Данные пишутся сразу в <name>.part по смещению из Content-Range (pwrite в
+    потоке, чтобы не блокировать event loop), без промежуточного временного
+    файла. sha256 считается по ходу записи; после перезапуска сервера
+    уже записанная часть файла один раз перечитывается. Когда получен
+    последний байт, хэш сверяется с присланным клиентом и .part
+    переименовывается в целевой файл.
+    """
+
+    def __init__(self, write_buffer_bytes: int | None = None) -> None:
+        self.__write_buffer_bytes = (
+            config.UPLOAD_WRITE_BUFFER_BYTES
+            if write_buffer_bytes is None
+            else write_buffer_bytes
+        )
+        # путь к .part -> (хэш записанной части, ее размер)
+        self.__hashes: dict[Path, tuple] = {}
+        self.__active: set[Path] = set()
+
+    @staticmethod
+    def part_path(path: Path) -> Path:
+        return path.with_name(f"{path.name}.part")
+
+    def offset(self, name: str) -> int:
+        """Сколько байт загрузки уже записано; с этого места продолжать."""
+        part = self.part_path(resolve_path(name))
+        try:
+            return part.stat().st_size
+        except FileNotFoundError:
+            return 0
+
+    async def write(
+        self,
+        name: str,
+        stream: AsyncIterator[bytes],
+        start: int = 0,
+        end: int | None = None,
+        total: int | None = None,
+        checksum: str | None = None,
+    ) -> dict:
+        """
+        Дописывает кусок загрузки с байтами start..end включительно; end=None -
+        файл приходит целиком одним телом и на этом загрузка завершается.
+        Кусок другой длины отвергается, но полученное сохраняется для
+        докачки. Загрузка кусками завершается, когда известен общий размер
+        total и файл собран до него.
+        """
+        path = resolve_path(name)
+        part = self.part_path(path)
+        if part in self.__active:
+            raise UploadConflict(f"Upload of {name} is in progress", self.offset(name))
+        self.__active.add(part)
+        try:
+            if start != 0 and start != (offset := self.offset(name)):
+                raise UploadConflict(
+                    f"Upload of {name} must continue from {offset}, not {start}",
+                    offset,
+                )
+            path.parent.mkdir(parents=True, exist_ok=True)
+            limit = None if end is None else end + 1
+            offset = await self.__write_part(part, stream, start, limit)
+            if end is None or (total is not None and offset == total):
+                return self.__complete(path, part, checksum)
+            if offset != limit:
+                raise ValueError(
+                    f"Received {offset - start} bytes for range {start}-{end}"
+                )
+            return {"filename": name, "offset": offset, "complete": False}
+        finally:
+            self.__active.discard(part)
+
+    async def __write_part(
+        self, part: Path, stream: AsyncIterator[bytes], offset: int, limit: int | None
+    ) -> int:
+        """
+        Пишет тело в .part с offset, но не дальше limit; возвращает, докуда
+        файл записан. Если тело длиннее, записанное сохраняется, а вызов
+        завершается ValueError.
+        """
+        digest, hashed = self.__hashes.pop(part, (None, 0))
+        if digest is None or hashed != offset:
+            digest = await asyncio.to_thread(self.__hash_prefix, part, offset)
+        fd = os.open(part, os.O_WRONLY | os.O_CREAT, 0o644)
+        buffer = bytearray()
+        try:
+            if offset == 0:
+                os.ftruncate(fd, 0)
+            async for chunk in stream:
+                if limit is not None and offset + len(buffer) + len(chunk) > limit:
+                    buffer += chunk[: limit - offset - len(buffer)]
+                    raise ValueError(f"Request body runs past byte {limit - 1}")
+                buffer += chunk
+                if len(buffer) >= self.__write_buffer_bytes:
+                    data, buffer = bytes(buffer), bytearray()
+                    await asyncio.to_thread(self.__pwrite, fd, data, offset, digest)
+                    offset += len(data)
+        finally:
+            # при обрыве соединения сохраняем все полученное: докачка продолжит с него
+            if buffer:
+                await asyncio.to_thread(
+                    self.__pwrite, fd, bytes(buffer), offset, digest
+                )
+                offset += len(buffer)
+            os.close(fd)
+            self.__hashes[part] = (digest, offset)
+        return offset
+
+    def __complete(self, path: Path, part: Path, checksum: str | None) -> dict:
+        digest, size = self.__hashes.pop(part)
+        sha256 = digest.hexdigest()
+        if checksum is not None and checksum.lower() != sha256:
+            part.unlink(missing_ok=True)
+            raise ChecksumMismatch(
+                f"Checksum mismatch for {path.name}: expected {checksum}, got {sha256}"
+            )
+        os.replace(part, path)
+        return {
+            "filename": path.name,
+            "saved_to": str(path),
+            "size": size,
+            "offset": size,
+            "sha256": sha256,
+            "complete": True,
+        }
+
+    @staticmethod
+    def __pwrite(fd: int, data: bytes, offset: int, digest) -> None:
+        view = memoryview(data)
+        while view:
+            written = os.pwrite(fd, view, offset)
+            view = view[written:]
+            offset += written
+        digest.update(data)
+
+    def __hash_prefix(self, part: Path, size: int):
+        digest = hashlib.sha256()
+        if size == 0:
+            return digest
+        with part.open("rb") as f:
+            while size > 0 and (chunk := f.read(min(self.__write_buffer_bytes, size))):
+                digest.update(chunk)
+                size -= len(chunk)
+        return digest
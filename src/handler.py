@@ -1,62 +1,120 @@
+import asyncio
 import time
-from threading import Event, Thread
+from typing import Coroutine
 
-import zmq
 from loguru import logger
 
-from src.sender import Sender
+from src.sender import Sender, session_room
 
+from .bridge import loop_bridge
 from .config import get_settings
+from .execution import Execution
+from .kernelpool import KernelPool, KernelPoolExhausted
 from .kernelwrapper import KernelWrapper
-from .models import Status
+from .logs import preview
+from .metrics import (
+    CELL_EXECUTION_SECONDS,
+    CELL_QUEUE_WAIT_SECONDS,
+    KERNEL_RECOVERY_SECONDS,
+    KERNEL_RESTART_SECONDS,
+)
+from .models import Cell
 
 config = get_settings()
 
 
 class Handler:
-    def __init__(self, sender: Sender, kernel: KernelWrapper) -> None:
+    """
+    Управляет kernel-ом одной сессии. Ячейки ставятся в asyncio-очередь и
+    исполняются единственной корутиной-потребителем, так что event loop
+    никогда не ждет kernel. Ячейки пакета отправляются в kernel разом, а их
+    вывод уходит клиентам по порядку.
+    """
+
+    def __init__(
+        self, sender: Sender, pool: KernelPool, session: str, kernel: KernelWrapper
+    ) -> None:
         self.__sender = sender
+        self.__pool = pool
+        self.__session = session
+        self.__room = session_room(session)
+        self.__loop = asyncio.get_running_loop()
+        self.__closed = False
         self.__kernel = kernel
-        self.__skip_execution = Event()
-        self.__execution_thread: Thread | None = None
-
-    def restart(self):
-        self.__kernel.restart_kernel()
-        self.__kernel.clear_out()
-        self.__kernel.preload_cells()
-        self.__sender.send_message({"command": "notebook-restart"})
-
-    def shutdown(self):
-        self.__skip_execution.set()
-        self.__kernel.interrupt_kernel()
-        if self.__execution_thread is not None:
-            self.__execution_thread.join()
-        self.__kernel.clear_out()
-        self.__skip_execution.clear()
-        self.__kernel.shutdown_kernel()
-        self.__sender.send_message({"command": "notebook-shutdown"})
+        # сброшен, пока умерший kernel сессии заменяется: ячейки из очереди
+        # ждут нового kernel-а
+        self.__recovered = asyncio.Event()
+        self.__recovered.set()
+        self.__watch(kernel)
+        # пакет ячеек и признак того, что он пришел одной командой
+        self.__cells: asyncio.Queue[tuple[list[Cell], bool]] = asyncio.Queue()
+        self.__executions: list[Execution] = []
+        self.__consumer: asyncio.Task | None = None
+        # фоновые задачи сессии: event loop держит на них только слабые ссылки
+        self.__tasks: set[asyncio.Task] = set()
+
+    @property
+    def kernel(self) -> KernelWrapper:
+        return self.__kernel
+
+    async def restart(self):
+        """
+        Перезапуск: вместо перезагрузки текущего kernel-а сессия получает уже
+        запущенный и прогретый kernel из пула, старый гасится в фоне.
+        """
+        started = time.perf_counter()
+        self.__drop_pending()
+        self.__kernel = await asyncio.to_thread(self.__pool.replace, self.__session)
+        self.__watch(self.__kernel)
+        latency = time.perf_counter() - started
+        KERNEL_RESTART_SECONDS.observe(latency)
+        logger.info(f"Kernel of session {self.__session} restarted in {latency:.3f}s")
+        self.__sender.send_message({"command": "notebook-restart"}, to=self.__room)
+
+    async def shutdown(self):
+        """Гасит kernel сессии и возвращает его слот в пул."""
+        self.__drop_pending()
+        await asyncio.to_thread(self.__pool.discard, self.__session)
+        self.__sender.send_message({"command": "notebook-shutdown"}, to=self.__room)
         logger.info("Kernel disabled.")
 
-    def interrupt(self):
-        self.__skip_execution.set()
-        self.__kernel.interrupt_kernel()
-        if self.__execution_thread is not None:
-            self.__execution_thread.join()
-        self.__kernel.clear_out()
-        self.__skip_execution.clear()
-        self.__sender.send_message({"command": "notebook-interrupt"})
+    async def interrupt(self):
+        # текущая ячейка дойдет до конца с KeyboardInterrupt, очередь сбрасывается
+        while not self.__cells.empty():
+            self.__cells.get_nowait()
+        await asyncio.to_thread(self.__kernel.interrupt_kernel)
+        self.__sender.send_message({"command": "notebook-interrupt"}, to=self.__room)
+
+    def execute(self, code: str, prompt: str | None = None) -> None:
+        """
+        Ставит ячейку в очередь. prompt - эхо введенного кода, оно уходит
+        клиентам перед выводом самой ячейки.
+        """
+        logger.opt(lazy=True).info(
+            "Kernel execute code: {}; queued: {}",
+            lambda: preview(code),
+            self.__cells.qsize,
+        )
+        self.__enqueue([Cell(code, prompt=prompt)], batch=False)
 
-    def execute(self, code: str):
+    def execute_batch(self, cells: list[Cell]) -> None:
+        """
+        Ставит в очередь пакет ячеек. Kernel получает их подряд, не дожидаясь
+        окончания каждой; вывод помечается cell_id, конец каждой ячейки -
+        notebook-cell-end, конец пакета - notebook-end. Ошибка в ячейке
+        отменяет оставшиеся ячейки пакета.
+        """
         logger.info(
-            f"Kernel execute code: {code}; kernel status: {self.__kernel.get_ex_status()}"
+            f"Kernel execute {len(cells)} cells; queued: {self.__cells.qsize()}"
         )
-        while self.__kernel.get_ex_status() == Status.BUSY:
-            time.sleep(0.1)
-        Thread(target=self.__kernel.execute_code, args=(code,), daemon=True).start()
-        self.__execution_thread = Thread(target=self.__handle_code, daemon=True)
-        self.__execution_thread.start()
-        time.sleep(self.__kernel.MIN_CODE_EXECUTION_TIME_S)
-        return self.__execution_thread
+        self.__enqueue(cells, batch=True)
+
+    def close(self) -> None:
+        """Останавливает очередь ячеек и фоновые задачи; kernel остается в пуле."""
+        self.__closed = True
+        self.__drop_pending()
+        for task in self.__tasks:
+            task.cancel()
 
     def send_jupyter_connection_info(self, message_id: int):
         jupyter_info = self.__kernel.jupyter_info
@@ -65,21 +123,144 @@ class Handler:
                 "command": "notebook-jupyter_connection_info",
                 "content": jupyter_info,
                 "id": message_id,
-            }
+            },
+            to=self.__room,
         )
         logger.info(f"Sent JupyterClient connection info: {jupyter_info}")
 
-    def __handle_code(self):
-        while self.__kernel.get_status() == Status.BUSY:
-            for kernel_result in self.__kernel.handle_results():
-                logger.info(f"handling {kernel_result}")
-                if self.__skip_execution.is_set():
-                    return
-                self.__sender.send_message(
-                    {
-                        "command": "notebook-upd",
-                        **(kernel_result.json()),
-                    }
-                )
-                logger.info(f"send to middle {kernel_result}")
-        self.__sender.send_message({"command": "notebook-end"})
+    def __watch(self, kernel: KernelWrapper) -> None:
+        kernel.on_death(
+            lambda reason, detected_at: loop_bridge(self.__loop).call_soon(
+                self.__kernel_died, kernel, reason, detected_at
+            )
+        )
+
+    def __kernel_died(
+        self, kernel: KernelWrapper, reason: str, detected_at: float
+    ) -> None:
+        if not self.__closed and kernel is self.__kernel:
+            self.__recovered.clear()
+            self.__spawn(self.__recover(reason, detected_at))
+
+    async def __recover(self, reason: str, detected_at: float) -> None:
+        """
+        Kernel сессии умер: отправленные в него ячейки уже завершены ошибкой
+        KernelDied, а сессия получает прогретый kernel из пула. Ячейки, еще
+        ждущие в очереди, исполняются уже на нем; если заменить kernel не
+        удалось, они тоже завершаются ошибкой KernelDied.
+        """
+        try:
+            self.__kernel = await asyncio.to_thread(self.__pool.replace, self.__session)
+        except KernelPoolExhausted as e:
+            logger.error(f"Can't recover kernel of session {self.__session}: {e}")
+            return
+        finally:
+            self.__recovered.set()
+        self.__watch(self.__kernel)
+        latency = time.monotonic() - detected_at
+        KERNEL_RECOVERY_SECONDS.observe(latency)
+        logger.warning(
+            f"Kernel of session {self.__session} died ({reason}), "
+            f"recovered in {latency:.3f}s"
+        )
+        self.__sender.send_message(
+            {
+                "command": "notebook-restart",
+                "reason": reason,
+                "content": {"text": f"Kernel died ({reason}) and was restarted"},
+            },
+            to=self.__room,
+        )
+
+    def __enqueue(self, cells: list[Cell], batch: bool) -> None:
+        self.__cells.put_nowait((cells, batch))
+        if self.__consumer is None or self.__consumer.done():
+            self.__consumer = self.__spawn(self.__consume())
+
+    def __spawn(self, coroutine: Coroutine) -> asyncio.Task:
+        """Запускает задачу, держит ссылку на нее до завершения и логирует сбой."""
+        task = asyncio.ensure_future(coroutine)
+        self.__tasks.add(task)
+        task.add_done_callback(self.__task_done)
+        return task
+
+    def __task_done(self, task: asyncio.Task) -> None:
+        self.__tasks.discard(task)
+        if not task.cancelled() and (error := task.exception()) is not None:
+            logger.opt(exception=error).error(
+                f"Background task of session {self.__session} failed"
+            )
+
+    def __drop_pending(self) -> None:
+        """Сбрасывает очередь ячеек и перестает ждать отправленные."""
+        while not self.__cells.empty():
+            self.__cells.get_nowait()
+        for execution in self.__executions:
+            execution.cancel()
+
+    async def __consume(self) -> None:
+        while True:
+            cells, batch = await self.__cells.get()
+            await self.__recovered.wait()
+            executions = self.__executions = [
+                self.__kernel.execute(cell.code, stop_on_error=batch) for cell in cells
+            ]
+            statuses = []
+            for cell, execution in zip(cells, executions):
+                reply = await self.__forward(cell, execution)
+                self.__observe(cell, execution)
+                statuses.append(reply.get("status", "aborted"))
+                if batch:
+                    self.__sender.send_message(
+                        {
+                            "command": "notebook-cell-end",
+                            "cell_id": cell.cell_id,
+                            **self.__summary(execution, reply),
+                        },
+                        to=self.__room,
+                    )
+            self.__executions = []
+            if batch:
+                end = {
+                    "cells": len(cells),
+                    "status": next(
+                        (status for status in statuses if status != "ok"), "ok"
+                    ),
+                }
+            else:
+                end = self.__summary(executions[0], reply)
+            self.__sender.send_message(
+                {"command": "notebook-end", **end}, to=self.__room
+            )
+
+    async def __forward(self, cell: Cell, execution: Execution) -> dict:
+        """Пересылает клиентам вывод ячейки и возвращает ее execute_reply."""
+        if cell.prompt is not None:
+            self.__sender.send_message(
+                {"content": {"text": cell.prompt}}, to=self.__room
+            )
+        async for kernel_result in execution:
+            message = {"command": "notebook-upd", **(kernel_result.json())}
+            if cell.cell_id is not None:
+                message["cell_id"] = cell.cell_id
+            await self.__sender.send(
+                message, to=self.__room, received_at=kernel_result.received_at
+            )
+        return await execution.reply()
+
+    @staticmethod
+    def __observe(cell: Cell, execution: Execution) -> None:
+        # у отмененной до начала ячейки отметок времени нет
+        if execution.started_at is None:
+            return
+        CELL_QUEUE_WAIT_SECONDS.observe(execution.started_at - cell.queued_at)
+        if execution.finished_at is not None:
+            CELL_EXECUTION_SECONDS.observe(execution.finished_at - execution.started_at)
+
+    @staticmethod
+    def __summary(execution: Execution, reply: dict) -> dict:
+        return {
+            "msg_id": execution.msg_id,
+            "status": reply.get("status", "aborted"),
+            "execution_count": reply.get("execution_count"),
+        }
@@ -0,0 +1,329 @@
+import time
+from dataclasses import dataclass, field
+from threading import Condition, Event, Lock, Thread
+
+from loguru import logger
+
+from .config import get_settings
+from .kernelwrapper import KernelWrapper
+from .metrics import (
+    KERNEL_CPU_SECONDS,
+    KERNEL_RESIDENT_MEMORY_BYTES,
+    read_process_stats,
+)
+from .models import Status
+
+config = get_settings()
+
+
+class KernelPoolExhausted(RuntimeError):
+    pass
+
+
+@dataclass
+class _PooledKernel:
+    kernel: KernelWrapper
+    slot: int
+    last_used: float = field(default_factory=time.monotonic)
+
+
+class KernelPool:
+    """
+    Пул kernel-ов.
+
+    Держит наготове KERNEL_POOL_MIN_SIZE прогретых свободных kernel-ов и
+    закрепляет за каждой сессией клиента отдельный kernel. Kernel сессии,
+    к которой давно никто не подключен, гасится по истечении KERNEL_IDLE_TTL_S.
+    """
+
+    def __init__(
+        self,
+        min_size: int | None = None,
+        max_size: int | None = None,
+        idle_ttl_s: float | None = None,
+    ) -> None:
+        self.__min_size = config.KERNEL_POOL_MIN_SIZE if min_size is None else min_size
+        self.__max_size = config.KERNEL_POOL_MAX_SIZE if max_size is None else max_size
+        self.__idle_ttl_s = (
+            config.KERNEL_IDLE_TTL_S if idle_ttl_s is None else idle_ttl_s
+        )
+        if not 0 <= self.__min_size <= self.__max_size:
+            raise ValueError("Kernel pool size must satisfy 0 <= min <= max")
+        self.__lock = Lock()
+        # появился свободный kernel или слот, закончился прогрев или подмена
+        self.__changed = Condition(self.__lock)
+        self.__spare: list[_PooledKernel] = []
+        self.__sessions: dict[str, _PooledKernel] = {}
+        # сессии, kernel которых сейчас закрепляется или подменяется: их
+        # acquire, replace и discard ждут, пока это закончится
+        self.__switching: set[str] = set()
+        # сколько клиентов подключено к сессии, с kernel-ом или еще без него
+        self.__clients: dict[str, int] = {}
+        self.__free_slots = list(range(self.__max_size))
+        # сколько слотов заняты kernel-ами, которые прогреваются про запас
+        self.__warming = 0
+        self.__disable = Event()
+        self.__wakeup = Event()
+        KERNEL_CPU_SECONDS.bind(lambda: self.__process_stats(0))
+        KERNEL_RESIDENT_MEMORY_BYTES.bind(lambda: self.__process_stats(1))
+        Thread(target=self.__maintain, daemon=True).start()
+
+    def acquire(self, session: str) -> KernelWrapper:
+        """
+        Возвращает kernel сессии, при необходимости закрепляя за ней свободный
+        kernel из пула или запуская новый. Если все слоты заняты, но в одном
+        из них прогревается свободный kernel, ждет его. Умерший kernel сессии
+        заменяется, как в replace.
+        """
+        return self.__bind(session, restart=False)
+
+    def replace(self, session: str) -> KernelWrapper:
+        """
+        Подменяет kernel сессии прогретым свободным kernel-ом, старый гасится в
+        фоне. Если свободного нет, kernel перезапускается на месте, не занимая
+        второй слот, а умерший заменяется новым kernel-ом в том же слоте.
+        """
+        return self.__bind(session, restart=True)
+
+    def attach(self, session: str) -> None:
+        """
+        Отмечает подключение клиента к сессии: ее kernel не гасится. Kernel
+        при этом не запускается - его закрепляет acquire.
+        """
+        with self.__lock:
+            self.__clients[session] = self.__clients.get(session, 0) + 1
+
+    def detach(self, session: str) -> None:
+        """Отмечает отключение клиента; с этого момента начинает идти TTL."""
+        with self.__lock:
+            if (clients := self.__clients.pop(session, 0) - 1) > 0:
+                self.__clients[session] = clients
+            if (pooled := self.__sessions.get(session)) is not None:
+                pooled.last_used = time.monotonic()
+
+    def discard(self, session: str) -> None:
+        """Отвязывает kernel от сессии и гасит его."""
+        with self.__lock:
+            while session in self.__switching:
+                self.__changed.wait()
+            pooled = self.__sessions.pop(session, None)
+        if pooled is not None:
+            self.__dispose(pooled)
+            self.__wakeup.set()
+
+    def shutdown(self) -> None:
+        self.__disable.set()
+        self.__wakeup.set()
+        with self.__lock:
+            kernels = self.__spare + list(self.__sessions.values())
+            self.__spare.clear()
+            self.__sessions.clear()
+        for pooled in kernels:
+            self.__dispose(pooled)
+
+    def __bind(self, session: str, restart: bool) -> KernelWrapper:
+        with self.__lock:
+            while session in self.__switching:
+                self.__changed.wait()
+            if (old := self.__sessions.get(session)) is not None:
+                old.last_used = time.monotonic()
+                if old.kernel.alive and not restart:
+                    return old.kernel
+            # с этого момента другие вызовы для сессии ждут результата
+            self.__switching.add(session)
+        try:
+            with self.__lock:
+                if old is not None:
+                    pooled, slot = self.__take_spare(), None
+                else:
+                    pooled, slot = self.__reserve()
+            pooled, retired = self.__switch(session, old, pooled, slot)
+        except Exception:
+            with self.__lock:
+                self.__switching.discard(session)
+                self.__changed.notify_all()
+            raise
+        with self.__lock:
+            pooled.last_used = time.monotonic()
+            self.__sessions[session] = pooled
+            self.__switching.discard(session)
+            self.__changed.notify_all()
+        if retired is not None:
+            Thread(target=self.__dispose, args=(retired,), daemon=True).start()
+        action = "bound to" if old is None else "swapped in for"
+        logger.info(f"Kernel in slot {pooled.slot} {action} session {session}")
+        self.__wakeup.set()
+        return pooled.kernel
+
+    def __switch(
+        self,
+        session: str,
+        old: _PooledKernel | None,
+        pooled: _PooledKernel | None,
+        slot: int | None,
+    ) -> tuple[_PooledKernel, _PooledKernel | None]:
+        """
+        Вне блокировки готовит kernel для сессии: берет свободный, запускает
+        новый в слоте или перезапускает старый. Возвращает его и старый kernel,
+        который нужно погасить.
+        """
+        if pooled is not None:
+            return pooled, old
+        if slot is not None:
+            return self.__start_kernel(slot), None
+        if old is None:
+            raise KernelPoolExhausted(
+                f"All {self.__max_size} kernels of the pool are in use"
+            )
+        if old.kernel.alive:
+            old.kernel.restart_kernel()
+            old.kernel.preload_cells()
+            return old, None
+        # мертвый kernel перезапускать бесполезно: его слот получает новый
+        self.__stop(old)
+        with self.__lock:
+            del self.__sessions[session]
+        return self.__start_kernel(old.slot), None
+
+    def __process_stats(self, index: int) -> dict[tuple, float]:
+        """
+        Поле read_process_stats (0 - процессорное время, 1 - RSS) процессов
+        kernel-ов пула по слотам.
+        """
+        with self.__lock:
+            kernels = [
+                (pooled.slot, pooled.kernel)
+                for pooled in self.__spare + list(self.__sessions.values())
+            ]
+        stats: dict[tuple, float] = {}
+        for slot, kernel in kernels:
+            if (pid := kernel.pid) is not None and (
+                process := read_process_stats(pid)
+            ) is not None:
+                stats[(slot,)] = process[index]
+        return stats
+
+    def __take_spare(self) -> _PooledKernel | None:
+        """Свободный живой kernel; умершие свободные kernel-ы гасятся в фоне."""
+        while self.__spare:
+            pooled = self.__spare.pop()
+            if pooled.kernel.alive:
+                return pooled
+            Thread(target=self.__dispose, args=(pooled,), daemon=True).start()
+        return None
+
+    def __take_slot(self) -> int:
+        if not self.__free_slots:
+            raise KernelPoolExhausted(
+                f"All {self.__max_size} kernels of the pool are in use"
+            )
+        return self.__free_slots.pop(0)
+
+    def __reserve(self) -> tuple[_PooledKernel | None, int | None]:
+        """
+        Под блокировкой: свободный kernel или, если его нет, слот для нового.
+        Когда все слоты заняты, но какой-то держит прогревающийся kernel,
+        ждет его, а не отказывает.
+        """
+        while (pooled := self.__take_spare()) is None:
+            if self.__free_slots or not self.__warming:
+                return None, self.__take_slot()
+            self.__changed.wait()
+        return pooled, None
+
+    def __release_slot(self, slot: int) -> None:
+        with self.__lock:
+            self.__free_slots.append(slot)
+            self.__changed.notify_all()
+
+    def __start_kernel(self, slot: int) -> _PooledKernel:
+        connection_info = {
+            key: value + slot * config.KERNEL_PORT_STRIDE
+            if key.endswith("_port")
+            else value
+            for key, value in config.connection_info.items()
+        }
+        try:
+            kernel = KernelWrapper(connection_info)
+            kernel.preload_cells()
+        except Exception:
+            self.__release_slot(slot)
+            raise
+        # умерший свободный kernel заменяется, не дожидаясь очередной проверки
+        kernel.on_death(lambda reason, detected_at: self.__wakeup.set())
+        logger.info(f"Kernel started in slot {slot}")
+        return _PooledKernel(kernel=kernel, slot=slot)
+
+    def __dispose(self, pooled: _PooledKernel) -> None:
+        self.__stop(pooled)
+        self.__release_slot(pooled.slot)
+        logger.info(f"Kernel in slot {pooled.slot} disposed")
+
+    @staticmethod
+    def __stop(pooled: _PooledKernel) -> None:
+        try:
+            pooled.kernel.shutdown_kernel()
+        except Exception as e:  # noqa: PIE786
+            logger.opt(exception=e).warning(f"Can't shutdown kernel {pooled.slot}")
+
+    def __expired_sessions(self) -> list[str]:
+        now = time.monotonic()
+        return [
+            session
+            for session, pooled in self.__sessions.items()
+            if not self.__clients.get(session)
+            and session not in self.__switching
+            and now - pooled.last_used > self.__idle_ttl_s
+            and pooled.kernel.get_status() == Status.IDLE
+        ]
+
+    def __prewarm(self, slot: int) -> bool:
+        """Запускает в слоте свободный kernel про запас; True - он попал в пул."""
+        try:
+            pooled: _PooledKernel | None = self.__start_kernel(slot)
+        except Exception as e:  # noqa: PIE786
+            logger.opt(exception=e).warning("Can't prewarm kernel")
+            pooled = None
+        with self.__lock:
+            self.__warming -= 1
+            self.__changed.notify_all()
+            if pooled is not None and not self.__disable.is_set():
+                self.__spare.append(pooled)
+                return True
+        if pooled is not None:
+            # пул остановили, пока kernel запускался
+            self.__dispose(pooled)
+        return False
+
+    def __maintain(self) -> None:
+        """Фоновый поток: гасит просроченные kernel-ы и прогревает свободные."""
+        check_interval_s = max(min(self.__idle_ttl_s / 4, 5.0), 0.1)
+        while not self.__disable.is_set():
+            with self.__lock:
+                expired = [
+                    self.__sessions.pop(session)
+                    for session in self.__expired_sessions()
+                ]
+            for pooled in expired:
+                logger.info(f"Reaping idle kernel in slot {pooled.slot}")
+                self.__dispose(pooled)
+
+            with self.__lock:
+                dead = [pooled for pooled in self.__spare if not pooled.kernel.alive]
+                self.__spare = [
+                    pooled for pooled in self.__spare if pooled.kernel.alive
+                ]
+            for pooled in dead:
+                logger.info(f"Replacing dead spare kernel in slot {pooled.slot}")
+                self.__dispose(pooled)
+
+            with self.__lock:
+                need_spare = len(self.__spare) < self.__min_size
+                slot = self.__take_slot() if need_spare and self.__free_slots else None
+                if slot is not None:
+                    self.__warming += 1
+            if slot is not None and self.__prewarm(slot):
+                continue
+
+            self.__wakeup.wait(check_interval_s)
+            self.__wakeup.clear()
@@ -1,49 +1,88 @@
-import queue
+import asyncio
 import time
-from threading import Event, Thread
-from typing import Iterable
+from concurrent.futures import Future
+from contextlib import suppress
+from threading import Event, Lock, Thread
+from typing import Callable
 from uuid import uuid4
 
 import zmq
 from jupyter_client import KernelManager, session
 from loguru import logger
 
+from .binary import RICH_MSG_TYPES, decode_binary
 from .config import get_settings
+from .execution import Execution
+from .metrics import KERNEL_DEATHS
 from .models import KernelResult, Status
 
 config = get_settings()
 
 
+def channel_url(connection_info: dict, port_key: str) -> str:
+    """Адрес zmq канала kernel-а: tcp://ip:port или ipc://путь-port"""
+    transport = connection_info["transport"]
+    ip, port = connection_info["ip"], connection_info[port_key]
+    if transport == "ipc":
+        return f"ipc://{ip}-{port}"
+    return f"{transport}://{ip}:{port}"
+
+
 class KernelWrapper:
     """
     Обертка над библиотечным классом kernel-а.
     """
 
-    MIN_CODE_EXECUTION_TIME_S = 0.05
+    # как часто потоки kernel-а просыпаются без данных, чтобы проверить флаг остановки
+    IOPUB_POLL_TIMEOUT_S = 0.5
+    # сколько ждать, пока kernel начнет доставлять сообщения iopub
+    IOPUB_READY_TIMEOUT_S = 30
+    # причины смерти kernel-а для KernelDied и метрик
+    DIED_EXITED = "exited"
+    DIED_UNRESPONSIVE = "unresponsive"
 
-    def __init__(self) -> None:
+    def __init__(self, connection_info: dict | None = None) -> None:
         # для фиксирования портов отключаем кэширование таковых
         # https://github.com/jupyter/jupyter_client/issues/955#issuecomment-1621917317
         config.UPLOAD_DIR.mkdir(exist_ok=True)
+        connection_info = dict(connection_info or config.connection_info)
+        if connection_info.get("transport") == "ipc":
+            # у каждого kernel-а свои файлы сокетов: <ip>-<port>
+            config.KERNEL_IPC_DIR.mkdir(parents=True, exist_ok=True)
+            connection_info["ip"] = str(config.KERNEL_IPC_DIR / uuid4().hex[:12])
         self.__kernel_manager = KernelManager(
-            kernel_name="python", cache_ports=False, **config.connection_info
+            kernel_name="python",
+            cache_ports=False,
+            **connection_info,
         )
 
         self.__kernel_manager.start_kernel(cwd=str(config.UPLOAD_DIR))
-        info = self.__kernel_manager.client().get_connection_info()
-        iopub_ip = f"{info['transport']}://{info['ip']}:{info['iopub_port']}"  # type: ignore
-        shell_ip = f"{info['transport']}://{info['ip']}:{info['shell_port']}"  # type: ignore
-        self.__key = info["key"]
-        iopub_socket, self.__shell_socket = self.__setup_sockets(iopub_ip, shell_ip)
-        self.__iopub_queue: queue.Queue[tuple] = queue.Queue()
         self.__disable = Event()
-        self.__skip_execution = Event()
-        self.__executor_status = Status.IDLE
         self.__status = Status.BUSY
-        self.__define_jupyter_sockets()
-        Thread(
-            target=self.__start_listening_iopub, args=(iopub_socket,), daemon=True
-        ).start()
+        # запросы в kernel пишут разные потоки, а сокет ими делить нельзя
+        self.__pipe_lock = Lock()
+        # ячейки, отправленные в kernel и еще не завершенные, по msg_id запроса
+        self.__executions: dict[str, Execution] = {}
+        # кто ждет execute_reply, по msg_id запроса
+        self.__replies: dict[str, Callable[[dict], None]] = {}
+        self.__iopub_ready = Event()
+        # пока kernel гасится или перезапускается, его выход - не смерть
+        self.__expected_exit = Event()
+        self.__dead = Event()
+        self.__death: tuple[str, float] | None = None
+        self.__death_callbacks: list[Callable[[str, float], None]] = []
+        self.__death_lock = Lock()
+        sockets = self.__define_jupyter_sockets()
+        Thread(target=self.__start_listening, args=sockets, daemon=True).start()
+        self.__wait_for_iopub()
+        if config.KERNEL_HEARTBEAT_INTERVAL_S > 0:
+            Thread(target=self.__watch_heartbeat, daemon=True).start()
+
+    @property
+    def pid(self) -> int | None:
+        """pid процесса kernel-а"""
+        provisioner = self.__kernel_manager.provisioner
+        return getattr(provisioner, "pid", None)
 
     @property
     def jupyter_info(self) -> dict[str, str]:
@@ -55,124 +94,312 @@ class KernelWrapper:
                 result[key] = str(value)
         return result
 
-    def clear_out(self):
-        for _ in self.handle_results():
-            pass
+    @property
+    def alive(self) -> bool:
+        return not self.__dead.is_set()
+
+    def on_death(self, callback: Callable[[str, float], None]) -> None:
+        """
+        callback(reason, detected_at) вызывается из потока heartbeat, когда
+        kernel умер (процесс завершился или перестал отвечать); detected_at -
+        time.monotonic() обнаружения. Если kernel уже мертв - вызывается сразу.
+        """
+        with self.__death_lock:
+            if (death := self.__death) is None:
+                self.__death_callbacks.append(callback)
+                return
+        callback(*death)
 
     def shutdown_kernel(self):
-        self.__kernel_manager.shutdown_kernel()
+        self.__expected_exit.set()
+        # умерший kernel на просьбу завершиться не ответит: его процесс убивается сразу
+        self.__kernel_manager.shutdown_kernel(now=self.__dead.is_set())
         self.__disable.set()
+        for execution in list(self.__executions.values()):
+            execution.cancel()
+        self.__executions.clear()
+        self.__replies.clear()
 
     def restart_kernel(self):
-        self.__kernel_manager.restart_kernel()
+        self.__expected_exit.set()
+        try:
+            self.__kernel_manager.restart_kernel()
+        finally:
+            self.__expected_exit.clear()
 
     def interrupt_kernel(self):
         self.__kernel_manager.interrupt_kernel()
-        self.__skip_execution.set()
 
     def __define_jupyter_sockets(self):
         jupyter_info = self.__kernel_manager.client().get_connection_info()
         logger.info(f"Connection info: {jupyter_info}")
-        iopub_ip = f"{jupyter_info['transport']}://{jupyter_info['ip']}:{jupyter_info['iopub_port']}"
-        shell_ip = f"{jupyter_info['transport']}://{jupyter_info['ip']}:{jupyter_info['shell_port']}"
-        self.key = jupyter_info["key"]
-        (
-            self.__iopub_socket,
-            self.__shell_socket,
-        ) = self.__setup_sockets(iopub_ip, shell_ip)
+        iopub_ip = channel_url(jupyter_info, "iopub_port")
+        shell_ip = channel_url(jupyter_info, "shell_port")
+        self.__hb_address = channel_url(jupyter_info, "hb_port")
+        self.__key = jupyter_info["key"]
+        self.__session = session.Session(key=self.__key)
+        return self.__setup_sockets(iopub_ip, shell_ip)
 
     def __setup_sockets(self, iopub_ip, shell_ip):
+        """
+        Shell-канал - DEALER: в отличие от REQ он не ждет ответа на каждый
+        запрос, и kernel получает ячейки одну за другой без пауз. Сокетами
+        владеет поток-слушатель; остальные потоки передают ему запросы через
+        inproc-канал.
+        """
         context = zmq.Context()
 
         socket_iopub = context.socket(zmq.SUB)
         socket_iopub.connect(iopub_ip)
         socket_iopub.setsockopt_string(zmq.SUBSCRIBE, "")
 
-        socket_send = context.socket(zmq.REQ)
-        socket_send.connect(shell_ip)
+        socket_shell = context.socket(zmq.DEALER)
+        socket_shell.connect(shell_ip)
 
-        return socket_iopub, socket_send
+        pipe_address = f"inproc://shell-{uuid4()}"
+        socket_requests = context.socket(zmq.PULL)
+        socket_requests.bind(pipe_address)
+        self.__pipe = context.socket(zmq.PUSH)
+        self.__pipe.connect(pipe_address)
 
-    def __start_listening_iopub(self, iopub_socket):
+        return socket_iopub, socket_shell, socket_requests
+
+    def __wait_for_iopub(self) -> None:
+        """
+        SUB-сокет начинает получать сообщения не сразу после connect, и все,
+        что kernel опубликовал до этого, теряется - вместе с idle первой
+        ячейки. Шлем kernel_info_request, пока на iopub не придет его статус.
+        """
+        deadline = time.monotonic() + self.IOPUB_READY_TIMEOUT_S
+        while time.monotonic() < deadline:
+            with self.__pipe_lock:
+                self.__session.send(self.__pipe, "kernel_info_request", content={})
+            if self.__iopub_ready.wait(self.IOPUB_POLL_TIMEOUT_S):
+                return
+        logger.warning("Kernel iopub is silent, first outputs may be lost")
+
+    def __start_listening(self, iopub_socket, shell_socket, requests_socket):
+        """
+        Слушает iopub и shell kernel-а и пересылает в shell новые запросы.
+        Поток спит в poll до прихода данных и за одно пробуждение вычитывает
+        все накопившиеся сообщения.
+        """
         ses = session.Session(key=self.__key)
+        poller = zmq.Poller()
+        for socket in (iopub_socket, shell_socket, requests_socket):
+            poller.register(socket, zmq.POLLIN)
+        poll_timeout_ms = int(self.IOPUB_POLL_TIMEOUT_S * 1000)
         while not self.__disable.is_set():
-            message = ses.recv(iopub_socket, mode=zmq.NOBLOCK)
-            if message != (None, None):
-                if message[1]["msg_type"] == "status":
-                    status = message[1]["content"]["execution_state"]
-                    self.__status = Status.IDLE if status == "idle" else Status.BUSY
+            events = dict(poller.poll(poll_timeout_ms))
+            if requests_socket in events:
+                with suppress(zmq.Again):
+                    while True:
+                        frames = requests_socket.recv_multipart(zmq.NOBLOCK)
+                        shell_socket.send_multipart(frames)
+            if iopub_socket in events:
+                self.__drain(ses, iopub_socket, self.__dispatch)
+            if shell_socket in events:
+                self.__drain(ses, shell_socket, self.__dispatch_reply)
+
+    def __watch_heartbeat(self) -> None:
+        """
+        Следит, что kernel жив: процесс не завершился и отвечает на heartbeat.
+        Эхо heartbeat ipykernel работает в своем потоке без GIL и отвечает,
+        даже пока ячейка считается, так что молчание дольше
+        KERNEL_HEARTBEAT_TIMEOUT_S значит, что процесс завис или остановлен.
+        """
+        interval_s = config.KERNEL_HEARTBEAT_INTERVAL_S
+        context = zmq.Context.instance()
+        socket = None
+        last_beat = time.monotonic()
+        while not self.__disable.wait(interval_s):
+            if self.__expected_exit.is_set():
+                last_beat = time.monotonic()
+                continue
+            if (code := self.__exit_code()) is not None:
+                self.__die(self.DIED_EXITED, f"kernel process exited with code {code}")
+                break
+            if socket is None:
+                socket = context.socket(zmq.REQ)
+                socket.linger = 0
+                socket.connect(self.__hb_address)
+            socket.send(b"ping")
+            if socket.poll(int(interval_s * 1000)):
+                socket.recv()
+                last_beat = time.monotonic()
+                continue
+            # REQ без ответа не даст отправить следующий ping: сокет пересоздается
+            socket.close()
+            socket = None
+            silent_s = time.monotonic() - last_beat
+            if silent_s > config.KERNEL_HEARTBEAT_TIMEOUT_S:
+                self.__die(
+                    self.DIED_UNRESPONSIVE,
+                    f"kernel did not answer heartbeats for {silent_s:.1f}s",
+                )
+                break
+        if socket is not None:
+            socket.close()
 
-                self.__iopub_queue.put(message)
-            time.sleep(self.MIN_CODE_EXECUTION_TIME_S / 10)
+    def __exit_code(self) -> int | None:
+        process = getattr(self.__kernel_manager.provisioner, "process", None)
+        return process.poll() if process is not None else None
 
-    def get_status(self) -> Status:
-        return self.__status
+    def __die(self, reason: str, description: str) -> None:
+        """
+        Kernel умер: ячейки, ждущие его, завершаются ошибкой KernelDied,
+        подписчики on_death узнают об этом.
+        """
+        detected_at = time.monotonic()
+        logger.error(f"Kernel {self.pid} is dead: {description}")
+        KERNEL_DEATHS.inc(reason=reason)
+        self.__status = Status.IDLE
+        with self.__death_lock:
+            self.__death = (reason, detected_at)
+            self.__dead.set()
+            callbacks, self.__death_callbacks = self.__death_callbacks, []
+        executions = list(self.__executions.values())
+        self.__executions.clear()
+        self.__replies.clear()
+        for execution in executions:
+            execution.fail("KernelDied", description)
+        for callback in callbacks:
+            try:
+                callback(reason, detected_at)
+            except Exception as e:  # noqa: PIE786
+                logger.opt(exception=e).warning("Kernel death callback failed")
 
-    def get_ex_status(self) -> Status:
-        return self.__executor_status
+    @staticmethod
+    def __drain(ses: session.Session, socket, dispatch: Callable[[dict], None]):
+        while True:
+            _, message = ses.recv(socket, mode=zmq.NOBLOCK)
+            if message is None:
+                return
+            dispatch(message)
 
-    def __await_task(self):
-        while self.__executor_status == Status.BUSY:
-            time.sleep(self.MIN_CODE_EXECUTION_TIME_S)
+    def __dispatch(self, message: dict) -> None:
+        """
+        Отдает сообщение iopub ячейке, которая его породила (по msg_id в
+        parent_header). Сообщения неизвестных ячеек (например, прогрева или
+        уже отмененных) отбрасываются и не попадают в вывод следующих.
+        """
+        received_at = time.monotonic()
+        self.__iopub_ready.set()
+        msg_type = message["msg_type"]
+        if msg_type == "status":
+            status = message["content"]["execution_state"]
+            self.__status = Status.IDLE if status == "idle" else Status.BUSY
+        msg_id = message["parent_header"].get("msg_id")
+        if (execution := self.__executions.get(msg_id)) is None:
+            return
+        if msg_type == "status":
+            if message["content"]["execution_state"] == "busy":
+                execution.started_at = received_at
+            elif message["content"]["execution_state"] == "idle":
+                execution.finished_at = received_at
+                self.__executions.pop(msg_id, None)
+                if (summary := execution.spill.close()) is not None:
+                    execution.put(
+                        KernelResult(
+                            msg_content=summary, msg_type="spill", msg_id=msg_id
+                        )
+                    )
+                execution.finish()
+        elif msg_type != "execute_input":
+            content = message["content"]
+            if msg_type in RICH_MSG_TYPES:
+                # base64 декодируется здесь, в потоке kernel-а, а не в event loop
+                content = decode_binary(content)
+            # большой вывод уходит в файл, клиентам - только его начало и конец
+            if (content := execution.spill.limit(msg_type, content)) is not None:
+                execution.put(
+                    KernelResult(
+                        msg_content=content,
+                        msg_type=msg_type,
+                        msg_id=msg_id,
+                        received_at=received_at,
+                    )
+                )
+
+    def __dispatch_reply(self, message: dict) -> None:
+        msg_id = message["parent_header"].get("msg_id")
+        if (callback := self.__replies.pop(msg_id, None)) is not None:
+            callback(message)
+
+    def get_status(self) -> Status:
+        return self.__status
 
-    def execute_code(self, code: str):
+    def execute(self, code: str, stop_on_error: bool = False) -> Execution:
         """
-        Исполнение кода
-        code - строка кода получаемая из клиента
+        Отправляет ячейку в kernel и сразу возвращается: следующие ячейки
+        можно отправлять, не дожидаясь этой, kernel исполнит их по порядку.
+        Результаты ячейки читаются из возвращаемого Execution через async for.
 
+        stop_on_error - при ошибке в ячейке kernel отбрасывает уже присланные
+        после нее ячейки (их execute_reply приходит со статусом aborted).
         """
+        msg_id = str(uuid4())
+        execution = Execution(msg_id, asyncio.get_running_loop())
+        if self.__dead.is_set():
+            execution.fail("KernelDied", "kernel is dead, waiting for a restart")
+            return execution
+        self.__executions[msg_id] = execution
         self.__status = Status.BUSY
-        self.__await_task()
-        self.__executor_status = Status.BUSY
-        ses = session.Session(key=self.__key)
-        self.__executor_status = Status.BUSY
-        ses.send(
-            self.__shell_socket,
-            "execute_request",
-            content={
-                "code": code,
-                "silent": False,
-                "store_history": True,
-                "user_expressions": {},
-                "allow_stdin": False,  # todo: add later
-                "stop_on_error": False,
-            },
-            track=True,
-            header={
-                "msg_id": str(uuid4()),
-                "username": "root",
-                "session": ses.session,
-                "msg_type": "execute_request",
-                "version": "5.0",
-            },
+        self.__send_execute_request(
+            code,
+            msg_id,
+            lambda reply: execution.set_reply(reply["content"]),
+            stop_on_error,
         )
-        ses.recv(self.__shell_socket, mode=zmq.BLOCKY)
-        time.sleep(self.MIN_CODE_EXECUTION_TIME_S)
-        self.__executor_status = Status.IDLE
+        return execution
 
-    def handle_results(self) -> Iterable[KernelResult]:
+    def execute_code(self, code: str) -> dict | None:
         """
-        Вытаскивает из очереди сообщения, которые отправляет kernel.
+        Исполнение кода
+        code - строка кода получаемая из клиента
+
+        Блокирует вызывающий поток до ответа kernel-а (execute_reply).
         """
-        while not self.__iopub_queue.empty() and not self.__skip_execution.is_set():
-            kernel_result = KernelResult(
-                msg_content={},
-                msg_type="",
+        reply: Future[dict] = Future()
+        self.__send_execute_request(code, str(uuid4()), reply.set_result)
+        while not self.__disable.is_set():
+            with suppress(TimeoutError):
+                return reply.result(timeout=self.IOPUB_POLL_TIMEOUT_S)
+        return None
+
+    def __send_execute_request(
+        self,
+        code: str,
+        msg_id: str,
+        on_reply: Callable[[dict], None],
+        stop_on_error: bool = False,
+    ) -> None:
+        self.__replies[msg_id] = on_reply
+        with self.__pipe_lock:
+            self.__session.send(
+                self.__pipe,
+                "execute_request",
+                content={
+                    "code": code,
+                    "silent": False,
+                    "store_history": True,
+                    "user_expressions": {},
+                    "allow_stdin": False,  # todo: add later
+                    "stop_on_error": stop_on_error,
+                },
+                header={
+                    "msg_id": msg_id,
+                    "username": "root",
+                    "session": self.__session.session,
+                    "msg_type": "execute_request",
+                    "version": "5.0",
+                },
             )
-            message = self.__iopub_queue.get_nowait()
-            if message[1]["msg_type"] in ["status", "execute_input"]:
-                continue
-            kernel_result.msg_content = message[1]["content"]
-            kernel_result.msg_type = message[1]["msg_type"]
-            logger.info(f"handle result: {str(kernel_result)[:200]}")
-            yield kernel_result
-        self.__skip_execution.clear()
 
     def preload_cells(self):
         self.__preload_cell("from loguru import logger")
 
     def __preload_cell(self, command: str) -> None:
         logger.info(f"Preload command: {command}")
-        self.execute_code(command)
-        for kernel_result in self.handle_results():
-            logger.info(f"Result: {kernel_result.msg_content}")
+        reply = self.execute_code(command)
+        logger.info(f"Result: {reply and reply['content']}")
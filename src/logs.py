@@ -0,0 +1,85 @@
+import sys
+from itertools import count
+from typing import TYPE_CHECKING, Callable
+
+from loguru import logger
+
+from .config import get_settings
+
+if TYPE_CHECKING:
+    from loguru import Record
+
+config = get_settings()
+
+
+class Sampler:
+    """
+    Пропускает каждый every-й вызов: сообщения hot path пишутся в лог
+    выборочно. Вызов стоит одного инкремента, счетчик потокобезопасен.
+    """
+
+    def __init__(self, every: int | None = None) -> None:
+        self.every = max(config.LOG_SAMPLE_EVERY if every is None else every, 1)
+        self.__calls = count()
+
+    def __call__(self) -> bool:
+        return next(self.__calls) % self.every == 0
+
+
+def preview(value, limit: int | None = None) -> str:
+    """
+    Короткое представление значения для лога. Вызывать лениво
+    (logger.opt(lazy=True)): большой вывод kernel-а целиком в строку не
+    превращается, длинные строки и bytes обрезаются еще до repr.
+    """
+    limit = config.LOG_MAX_CHARS if limit is None else limit
+    text = repr(_shorten(value, limit))
+    if len(text) > limit:
+        return f"{text[:limit]}... ({len(text) - limit} more chars)"
+    return text
+
+
+def _shorten(value, limit: int):
+    if isinstance(value, str) and len(value) > limit:
+        return f"{value[:limit]}... ({len(value) - limit} more chars)"
+    if isinstance(value, bytes) and len(value) > limit:
+        return value[:limit] + f"... ({len(value) - limit} more bytes)".encode()
+    if isinstance(value, dict):
+        return {key: _shorten(item, limit) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_shorten(item, limit) for item in value[:limit]]
+    return value
+
+
+def setup_logging() -> None:
+    """
+    Заменяет стандартный вывод loguru одним асинхронным (enqueue) выводом в
+    stderr: запись в поток не держит event loop и потоки kernel-ов. Уровень
+    по умолчанию - LOG_LEVEL, отдельных модулей - LOG_LEVELS.
+    """
+    levels = {
+        module: logger.level(level).no
+        for module, level in {"": config.LOG_LEVEL, **config.LOG_LEVELS}.items()
+    }
+    logger.remove()
+    logger.add(
+        sys.stderr,
+        level=min(levels.values()),
+        filter=_level_filter(levels),
+        enqueue=True,
+    )
+
+
+def _level_filter(levels: dict[str, int]) -> Callable[["Record"], bool]:
+    """
+    Фильтр по уровню самого близкого из перечисленных модулей записи:
+    "src.sender" подчиняется уровню "src.sender", иначе "src", иначе "".
+    """
+
+    def level_filter(record: "Record") -> bool:
+        module = record["name"] or ""
+        while module not in levels:
+            module = module.rpartition(".")[0]
+        return record["level"].no >= levels[module]
+
+    return level_filter
@@ -1,22 +1,33 @@
+import asyncio
+
 import socketio
 from loguru import logger
 
 from src.sender import Sender
 
 from .config import get_settings
+from .fileindex import file_index
 from .handler import Handler
-from .kernelwrapper import KernelWrapper
+from .kernelpool import KernelPool, KernelPoolExhausted
+from .logs import preview
+from .metrics import CLIENT_RECONNECTS, CONNECTED_CLIENTS
+from .models import Cell, OutputCodec
+from .sender import session_room
 
 settings = get_settings()
 
 
 class Messenger:
-    def __init__(self, kernel: KernelWrapper) -> None:
+    def __init__(self, pool: KernelPool) -> None:
         self.sio = socketio.AsyncServer(async_mode="asgi", cors_allowed_origins="*")
         self.sender = Sender(self.sio)
-        self.sender.start()
-        self.handler = Handler(self.sender, kernel)
+        self.__pool = pool
+        # sid клиента -> имя сессии; по умолчанию сессия совпадает с sid
+        self.__sessions: dict[str, str] = {}
+        # имя сессии -> обработчик kernel-а этой сессии
+        self.__handlers: dict[str, Handler] = {}
         self.__setup_socketio_handlers()
+        file_index.subscribe(self.__files_changed)
 
     def _input_prompt_format(self, code: str) -> str:
         splitted_command = code.split("\n")
@@ -26,42 +37,180 @@ class Messenger:
                 command_output += "\n... " + line
         return command_output
 
+    async def _handler(self, sid: str) -> Handler:
+        session = self.__sessions.get(sid, sid)
+        # если свободных kernel-ов нет, запуск нового не должен блокировать loop
+        kernel = await asyncio.to_thread(self.__pool.acquire, session)
+        handler = self.__handlers.get(session)
+        if handler is None or handler.kernel is not kernel:
+            if handler is not None:
+                handler.close()
+            handler = Handler(self.sender, self.__pool, session, kernel)
+            self.__handlers[session] = handler
+        return handler
+
     def __setup_socketio_handlers(self) -> None:
         @self.sio.on("connect")
-        def on_connect(sid, environ):
-            logger.info(f"Client connected {sid}")
+        async def on_connect(sid, environ, auth=None):
+            auth = auth if isinstance(auth, dict) else {}
+            session = str(auth.get("session") or sid)
+            codec = self.sender.codec
+            if codec != OutputCodec.JSON and codec not in (auth.get("codecs") or ()):
+                # такой клиент не сможет прочитать вывод
+                logger.warning(f"Client {sid} rejected: no {codec.value} decoder")
+                raise socketio.exceptions.ConnectionRefusedError(
+                    f"server sends output as {codec.value}, client cannot decode it"
+                )
+            self.__sessions[sid] = session
+            self.__pool.attach(session)
+            # в комнату клиент входит уже после подтверждения подключения,
+            # вместе с досылкой пропущенного
+            asyncio.ensure_future(self.__resume(sid, session, auth))
+            # kernel тоже закрепляется после подтверждения: запуск нового
+            # дольше, чем клиент ждет ответа на подключение
+            asyncio.ensure_future(self.__bind(sid))
+            if auth.get("epoch"):
+                # клиент уже получал вывод этой сессии: это переподключение
+                CLIENT_RECONNECTS.inc()
+            CONNECTED_CLIENTS.set(len(self.__sessions))
+            # индекс файлов начинает следить за UPLOAD_DIR с первым клиентом
+            file_index.start()
+            logger.info(f"Client connected {sid} to session {session}")
 
         @self.sio.on("disconnect")
         def on_disconnect(sid):
-            logger.info(f"Client disconnected {sid}")
+            session = self.__sessions.pop(sid, sid)
+            CONNECTED_CLIENTS.set(len(self.__sessions))
+            self.__pool.detach(session)
+            if session not in self.__sessions.values():
+                # ячейки сессии досчитываются, а вывод копится в журнале для
+                # досылки: клиент может вернуться после обрыва связи
+                asyncio.get_running_loop().call_later(
+                    settings.KERNEL_IDLE_TTL_S, self.__close_abandoned, session
+                )
+            logger.info(f"Client disconnected {sid} from session {session}")
 
         @self.sio.on("command")
         async def on_message(sid, message: dict):
             if not isinstance(message, dict):
                 return
 
-            logger.info(f"Received message: {message}")
+            logger.opt(lazy=True).info("Received message: {}", lambda: preview(message))
             command = message.get("command", "")
             logger.info(f"Executing {command}")
 
+            if command in ("observe", "unobserve"):
+                # наблюдатели получают вывод чужой сессии, но не управляют
+                # kernel-ом; вернувшийся после обрыва наблюдатель, как и
+                # клиент сессии, называет epoch и last_seq и получает пропущенное
+                observed = str(message.get("session", ""))
+                if command == "observe":
+                    await self.__resume(sid, observed, message)
+                else:
+                    self.sio.leave_room(sid, session_room(observed))
+                await self.sio.emit(
+                    "output", data={"status": "operation completed"}, to=sid
+                )
+                return
+
+            try:
+                handler = await self._handler(sid)
+            except KernelPoolExhausted as e:
+                await self.sio.emit(
+                    "output", data={"content": {"text": str(e)}}, to=sid
+                )
+                return
+
             if command == "restart":
-                self.handler.restart()
+                await handler.restart()
             elif command == "shutdown":
-                self.handler.shutdown()
+                await handler.shutdown()
+                self.__discard(sid)
             elif command == "interrupt":
-                self.handler.interrupt()
+                await handler.interrupt()
+            elif command == "execute" and "cells" in message:
+                # пакет ячеек: [{"id": ..., "code": ...}, ...]
+                cells = [
+                    Cell(
+                        str(cell["code"]),
+                        cell_id=str(cell.get("id", index)),
+                        prompt=self._input_prompt_format(str(cell["code"])),
+                    )
+                    for index, cell in enumerate(message["cells"])
+                ]
+                if cells:
+                    handler.execute_batch(cells)
             elif command == "execute":
                 code = message["code"]
-                await self.sio.emit(
-                    "output",
-                    data={"content": {"text": self._input_prompt_format(code)}},
-                )
-                self.handler.execute(code)
+                handler.execute(code, prompt=self._input_prompt_format(code))
             elif command == "exit":
-                self.handler.shutdown()
-                self.sio.disconnect()
-            await self.sio.emit("output", data={"status": "operation completed"})
+                await handler.shutdown()
+                self.__discard(sid)
+                await self.sio.disconnect(sid)
+            await self.sio.emit(
+                "output", data={"status": "operation completed"}, to=sid
+            )
+
+    async def __files_changed(self, added: list[dict], removed: list[str]) -> None:
+        """Рассылает всем клиентам изменения в UPLOAD_DIR."""
+        await self.sio.emit("files", data={"added": added, "removed": removed})
+
+    async def __bind(self, sid: str) -> None:
+        """Заранее закрепляет kernel за сессией только что подключенного клиента."""
+        if sid not in self.__sessions:
+            return
+        try:
+            await self._handler(sid)
+        except KernelPoolExhausted as e:
+            # клиент остается подключенным: kernel закрепится по первой команде,
+            # когда в пуле освободится место
+            logger.warning(f"No kernel for client {sid} yet: {e}")
+            await self.sio.emit("output", data={"content": {"text": str(e)}}, to=sid)
+
+    async def __resume(self, sid: str, session: str, position: dict) -> None:
+        """
+        Вводит клиента в комнату сессии и одним событием resume сообщает epoch
+        журнала вывода и досылает то, что клиент пропустил после сообщения
+        position["last_seq"]. position - auth подключения или команда observe.
+        Между снимком журнала и входом в комнату нет await: досылка не
+        перемешается с новым выводом.
+        """
+        if sid not in self.__sessions:
+            return
+        room = session_room(session)
+        try:
+            last_seq = int(position.get("last_seq") or 0)
+        except (TypeError, ValueError):
+            last_seq = 0
+        resume = self.sender.resume(room, position.get("epoch"), last_seq)
+        self.sio.enter_room(sid, room)
+        if resume["replayed"] or resume["lost"]:
+            logger.info(
+                f"Resuming {sid} in session {session}: "
+                f"{resume['replayed']} replayed, {resume['lost']} lost"
+            )
+        await self.sio.emit("resume", data={"session": session, **resume}, to=sid)
+
+    def __close_abandoned(self, session: str) -> None:
+        if session in self.__sessions.values():
+            return
+        if handler := self.__handlers.pop(session, None):
+            handler.close()
+        self.sender.forget(session_room(session))
+
+    def __discard(self, sid: str) -> None:
+        session = self.__sessions.get(sid, sid)
+        if handler := self.__handlers.pop(session, None):
+            handler.close()
+
+    def start(self) -> None:
+        """
+        Запускает отправку вывода. Вызывается из lifespan-а приложения: Sender
+        должен работать в том же event loop-е, что и сервер.
+        """
+        self.sender.start()
 
     async def stop(self):
+        await file_index.stop()
         await self.sender.stop()
-        self.handler.shutdown()
+        self.__pool.shutdown()
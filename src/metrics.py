@@ -0,0 +1,290 @@
+import os
+from bisect import bisect_left
+from threading import Lock
+from typing import Callable
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# задержки доставки: от долей миллисекунды до секунд
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+# время исполнения ячеек: от мгновенных до долгих расчетов
+DURATION_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 1800.0)
+
+
+def _escape_label_value(value: str) -> str:
+    """Экранирует \\, " и перевод строки, как требует текстовый формат Prometheus."""
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Histogram:
+    """
+    Гистограмма в духе Prometheus: накопительные бакеты, сумма и количество.
+    """
+
+    def __init__(
+        self, name: str, documentation: str, buckets: tuple = DEFAULT_BUCKETS
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.__buckets = tuple(sorted(buckets))
+        self.__counts = [0] * (len(self.__buckets) + 1)
+        self.__sum = 0.0
+        self.__lock = Lock()
+
+    def observe(self, value: float) -> None:
+        with self.__lock:
+            self.__counts[bisect_left(self.__buckets, value)] += 1
+            self.__sum += value
+
+    def render(self) -> str:
+        with self.__lock:
+            counts = list(self.__counts)
+            total_sum = self.__sum
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} histogram",
+        ]
+        cumulative = 0
+        for bound, count in zip(self.__buckets, counts):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{{le="{bound}"}} {cumulative}')
+        cumulative += counts[-1]
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {cumulative}')
+        lines.append(f"{self.name}_sum {total_sum}")
+        lines.append(f"{self.name}_count {cumulative}")
+        return "\n".join(lines)
+
+
+class _LabeledMetric:
+    type_name = ""
+
+    def __init__(
+        self, name: str, documentation: str, labels: tuple[str, ...] = ()
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.__labels = labels
+        self._values: dict[tuple, float] = {}
+        self._lock = Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(label, "")) for label in self.__labels)
+
+    def remove(self, **labels) -> None:
+        """Убирает ряд с такими метками, например, ушедшего адресата."""
+        with self._lock:
+            self._values.pop(self._key(labels), None)
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type_name}",
+        ]
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in values:
+            labels = ",".join(
+                f'{label}="{_escape_label_value(label_value)}"'
+                for label, label_value in zip(self.__labels, key)
+            )
+            lines.append(
+                f"{self.name}{{{labels}}} {value}" if labels else f"{self.name} {value}"
+            )
+        return "\n".join(lines)
+
+
+class Counter(_LabeledMetric):
+    type_name = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_LabeledMetric):
+    type_name = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Collected(_LabeledMetric):
+    """
+    Метрика, значения которой снимаются в момент запроса метрик: collect()
+    возвращает {значения меток по порядку: значение}.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        type_name: str,
+        labels: tuple[str, ...] = (),
+    ) -> None:
+        super().__init__(name, documentation, labels)
+        self.type_name = type_name
+        self.__collect: Callable[[], dict[tuple, float]] | None = None
+
+    def bind(self, collect: Callable[[], dict[tuple, float]]) -> None:
+        self.__collect = collect
+
+    def render(self) -> str:
+        if self.__collect is not None:
+            values = {
+                tuple(str(label) for label in key): value
+                for key, value in self.__collect().items()
+            }
+            with self._lock:
+                self._values = values
+        return super().render()
+
+
+def read_process_stats(pid: int) -> tuple[float, int] | None:
+    """
+    Процессорное время (user + system, секунды) и RSS (байты) процесса из
+    /proc; None, если процесса нет или /proc недоступен.
+    """
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            # имя процесса в скобках может содержать пробелы
+            fields = f.read().rsplit(")", 1)[1].split()
+        with open(f"/proc/{pid}/statm") as f:
+            resident_pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    ticks = os.sysconf("SC_CLK_TCK")
+    # utime и stime - 14-е и 15-е поля stat, после имени это 12-е и 13-е
+    cpu_seconds = (int(fields[11]) + int(fields[12])) / ticks
+    return cpu_seconds, resident_pages * os.sysconf("SC_PAGE_SIZE")
+
+
+class Registry:
+    def __init__(self) -> None:
+        self.__metrics: list = []
+
+    def register(self, metric):
+        self.__metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self.__metrics) + "\n"
+
+
+REGISTRY = Registry()
+
+KERNEL_RESTART_SECONDS = REGISTRY.register(
+    Histogram(
+        "connector_kernel_restart_seconds",
+        "Time from a restart request until the session has a ready kernel.",
+    )
+)
+
+OUTPUT_BUFFER_HIGH_WATER_MARK = REGISTRY.register(
+    Gauge(
+        "connector_output_buffer_high_water_mark",
+        "Largest number of messages queued for a destination.",
+        labels=("destination",),
+    )
+)
+
+OUTPUT_ELIDED_LINES = REGISTRY.register(
+    Counter(
+        "connector_output_elided_lines_total",
+        "Stream lines dropped because the destination buffer was full.",
+        labels=("destination",),
+    )
+)
+
+OUTPUT_ELIDED_DISPLAYS = REGISTRY.register(
+    Counter(
+        "connector_output_elided_displays_total",
+        "Displays dropped because the destination buffer was full.",
+        labels=("destination",),
+    )
+)
+
+CELL_QUEUE_WAIT_SECONDS = REGISTRY.register(
+    Histogram(
+        "connector_cell_queue_wait_seconds",
+        "Time from a cell being queued until the kernel starts executing it.",
+    )
+)
+
+CELL_EXECUTION_SECONDS = REGISTRY.register(
+    Histogram(
+        "connector_cell_execution_seconds",
+        "Time the kernel spent executing a cell (busy to idle).",
+        buckets=DURATION_BUCKETS,
+    )
+)
+
+OUTPUT_LATENCY_SECONDS = REGISTRY.register(
+    Histogram(
+        "connector_output_latency_seconds",
+        "Time from the oldest message of a frame arriving on iopub until the "
+        "frame is emitted.",
+        buckets=LATENCY_BUCKETS,
+    )
+)
+
+SENDER_QUEUE_DEPTH = REGISTRY.register(
+    Gauge(
+        "connector_sender_queue_depth",
+        "Messages waiting in the Sender buffer of a destination.",
+        labels=("destination",),
+    )
+)
+
+OUTPUT_BYTES = REGISTRY.register(
+    Counter(
+        "connector_output_bytes_total",
+        "Payload bytes emitted to a destination, before websocket compression.",
+        labels=("destination",),
+    )
+)
+
+CONNECTED_CLIENTS = REGISTRY.register(
+    Gauge("connector_connected_clients", "Clients connected over socket.io.")
+)
+
+CLIENT_RECONNECTS = REGISTRY.register(
+    Counter(
+        "connector_client_reconnects_total",
+        "Connections of clients resuming a session after a dropped connection.",
+    )
+)
+
+KERNEL_CPU_SECONDS = REGISTRY.register(
+    Collected(
+        "connector_kernel_cpu_seconds_total",
+        "CPU time (user + system) used by the kernel process in a pool slot.",
+        "counter",
+        labels=("slot",),
+    )
+)
+
+KERNEL_RESIDENT_MEMORY_BYTES = REGISTRY.register(
+    Collected(
+        "connector_kernel_resident_memory_bytes",
+        "Resident memory of the kernel process in a pool slot.",
+        "gauge",
+        labels=("slot",),
+    )
+)
+
+KERNEL_DEATHS = REGISTRY.register(
+    Counter(
+        "connector_kernel_deaths_total",
+        "Kernels found dead by the heartbeat monitor.",
+        labels=("reason",),
+    )
+)
+
+KERNEL_RECOVERY_SECONDS = REGISTRY.register(
+    Histogram(
+        "connector_kernel_recovery_seconds",
+        "Time from detecting a dead kernel until its session has a ready "
+        "replacement.",
+    )
+)
@@ -1,4 +1,5 @@
-from dataclasses import dataclass
+import time
+from dataclasses import dataclass, field
 from enum import Enum
 
 
@@ -7,6 +8,36 @@ class Status(Enum):
     IDLE: str = "idle"
 
 
+class OverflowPolicy(str, Enum):
+    """
+    Что делать, когда буфер вывода для клиента переполнен.
+
+    BLOCK - ждать, пока клиент разгребет буфер (тормозит чтение из kernel-а);
+    DROP - выкидывать stream-сообщения, оставляя маркер "N lines elided", а
+    для остальных сообщений освобождать место, выкидывая самые старые показы
+    (display_data, update_display_data) с маркером "N displays elided";
+    LATEST - как DROP, и дополнительно держать в буфере только последний
+    update_display_data для каждого display_id.
+    """
+
+    BLOCK = "block"
+    DROP = "drop"
+    LATEST = "latest"
+
+
+class OutputCodec(str, Enum):
+    """
+    Как кодируется вывод kernel-а для клиентов.
+
+    JSON - события output/output-batch со списком сообщений;
+    MSGPACK - событие output-packed, сообщения упакованы msgpack в одно
+    бинарное вложение (нужен пакет msgpack на сервере и у клиента).
+    """
+
+    JSON = "json"
+    MSGPACK = "msgpack"
+
+
 @dataclass
 class KernelResult:
     """
@@ -16,13 +47,37 @@ class KernelResult:
     image_png - non_text_plain we usually store info about images
 
     json_plotly - a list of dictionaries with info for plotly interactive plots
+
+    msg_id - id of the execute_request the message belongs to
+
+    received_at - time.monotonic() of the message arriving on iopub
     """
 
     msg_content: dict
     msg_type: str
+    # msg_id запроса execute_request, породившего сообщение
+    msg_id: str = ""
+    received_at: float = field(default_factory=time.monotonic)
 
     def json(self) -> dict:
         return {
             "content": self.msg_content,
             "msg_type": self.msg_type,
+            "msg_id": self.msg_id,
         }
+
+
+@dataclass
+class Cell:
+    """
+    Ячейка из очереди Handler-а.
+
+    cell_id - id ячейки на стороне клиента, для ячеек пакета
+    prompt - эхо кода, которое уходит клиентам перед выводом ячейки
+    queued_at - time.monotonic() постановки в очередь
+    """
+
+    code: str
+    cell_id: str | None = None
+    prompt: str | None = None
+    queued_at: float = field(default_factory=time.monotonic)
@@ -0,0 +1,59 @@
+import time
+from collections import deque
+from itertools import islice
+from uuid import uuid4
+
+from .buffer import payload_size
+
+
+class ReplayLog:
+    """
+    Последние сообщения одной сессии с порядковыми номерами (seq).
+
+    Клиент, вернувшийся после обрыва связи, называет номер последнего
+    полученного сообщения и получает пропущенные. Номера действуют в
+    пределах epoch журнала: у нового журнала (перезапуск сервера, журнал
+    истек) epoch другой, и номера начинаются заново. Сообщения помечаются
+    именем сессии: клиент, следящий за чужими сессиями, ведет номера каждой
+    отдельно.
+    """
+
+    def __init__(self, session: str, max_messages: int, max_bytes: int) -> None:
+        self.session = session
+        self.epoch = uuid4().hex
+        self.last_seq = 0
+        self.last_used = time.monotonic()
+        self.__max_messages = max_messages
+        self.__max_bytes = max_bytes
+        self.__messages: deque[tuple[dict, int]] = deque()
+        self.__bytes = 0
+
+    def record(self, messages: list[dict]) -> list[dict]:
+        """Нумерует сообщения и запоминает их; возвращает пронумерованные."""
+        numbered = []
+        for message in messages:
+            self.last_seq += 1
+            message = {**message, "session": self.session, "seq": self.last_seq}
+            size = payload_size(message)
+            self.__messages.append((message, size))
+            self.__bytes += size
+            numbered.append(message)
+        while self.__messages and (
+            len(self.__messages) > self.__max_messages
+            or self.__bytes > self.__max_bytes
+        ):
+            _, size = self.__messages.popleft()
+            self.__bytes -= size
+        self.last_used = time.monotonic()
+        return numbered
+
+    def since(self, seq: int) -> tuple[list[dict], int]:
+        """
+        Сообщения после seq и число пропущенных клиентом сообщений, которые
+        уже вытеснены из журнала.
+        """
+        self.last_used = time.monotonic()
+        first = self.__messages[0][0]["seq"] if self.__messages else self.last_seq + 1
+        lost = max(first - seq - 1, 0)
+        start = max(seq + 1 - first, 0)
+        return [message for message, _ in islice(self.__messages, start, None)], lost
@@ -1,9 +1,48 @@
-from fastapi import APIRouter, File, HTTPException, Response, UploadFile, status
-from fastapi.responses import JSONResponse
+import asyncio
+import stat
+from typing import AsyncIterator
+
+from fastapi import (
+    APIRouter,
+    File,
+    Header,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+    UploadFile,
+    status,
+)
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 
 from src.config import get_settings
+from src.fileindex import file_index
+from src.files import (
+    ChecksumMismatch,
+    UploadConflict,
+    UploadStore,
+    choose_encoding,
+    compressed_chunks,
+    parse_content_range,
+    resolve_path,
+)
+from src.metrics import REGISTRY
+from src.spill import spill_store
 
 router = APIRouter(prefix="/service")
+uploads = UploadStore()
+
+
+class _FileResponse(FileResponse):
+    # по умолчанию файл читается кусками по 64 KB, каждый - отдельным заходом в поток
+    chunk_size = get_settings().DOWNLOAD_CHUNK_BYTES
+
+
+def _etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
 
 
 @router.get("/check", status_code=200)
@@ -13,57 +52,203 @@ def check() -> Response:
     )
 
 
+@router.get("/metrics")
+def metrics() -> Response:
+    return Response(
+        status_code=status.HTTP_200_OK,
+        content=REGISTRY.render(),
+        media_type="text/plain; version=0.0.4",
+    )
+
+
 @router.post("/upload")
 async def upload_file(file: UploadFile = File(...)):
-    config = get_settings()
-    file_path = config.UPLOAD_DIR / file.filename
+    """
+    Загрузка файла формой multipart одним запросом. Пишет через UploadStore,
+    как и PUT /upload/{name}: диск не задерживает event loop.
+    """
+    if not file.filename:
+        raise HTTPException(status_code=400, detail="File name is required")
+
+    async def chunks() -> AsyncIterator[bytes]:
+        while chunk := await file.read(1024 * 1024):  # читаем 1MB за раз
+            yield chunk
 
-    with file_path.open("wb") as f:
-        while True:
-            chunk = await file.read(1024 * 1024)  # читаем 1MB за раз
-            if not chunk:
-                break
-            f.write(chunk)
+    try:
+        result = await uploads.write(file.filename, chunks())
+    except UploadConflict as e:
+        raise HTTPException(
+            status_code=409, detail=str(e), headers={"Upload-Offset": str(e.offset)}
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
     return JSONResponse(
         {
             "filename": file.filename,
-            "saved_to": str(file_path),
+            "saved_to": result["saved_to"],
             "content_type": file.content_type,
         }
     )
 
 
+@router.head("/upload/{name:path}")
+def upload_offset(name: str) -> Response:
+    """Сколько байт загрузки уже на сервере: с этого места ее продолжать."""
+    try:
+        offset = uploads.offset(name)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return Response(
+        status_code=status.HTTP_200_OK, headers={"Upload-Offset": str(offset)}
+    )
+
+
+@router.put("/upload/{name:path}")
+async def upload_chunk(
+    name: str,
+    request: Request,
+    content_range: str | None = Header(None),
+    x_checksum_sha256: str | None = Header(None),
+):
+    """
+    Загрузка файла сырым телом запроса, целиком или кусками.
+
+    Кусок задается заголовком Content-Range: bytes start-end/total, длина тела
+    должна совпадать с ним. Пока total неизвестен ("/*"), загрузка не
+    завершается: последний кусок должен назвать общий размер. Прерванную
+    загрузку можно продолжить с Upload-Offset из HEAD того же адреса. С
+    последним куском можно прислать X-Checksum-Sha256: если хэш файла не
+    совпал, загрузка отбрасывается.
+    """
+    start = 0
+    end: int | None = None
+    total: int | None = None
+    try:
+        if content_range is not None:
+            first, end, total = parse_content_range(content_range)
+            if first is None or end is None:
+                # "bytes */total" - кусок без данных, только узнать смещение
+                offset = uploads.offset(name)
+                return JSONResponse(
+                    {"filename": name, "offset": offset, "complete": False}
+                )
+            start = first
+            length = request.headers.get("content-length")
+            if length is not None and int(length) != end - start + 1:
+                raise ValueError(
+                    f"Content-Length {length} does not match range {start}-{end}"
+                )
+        result = await uploads.write(
+            name, request.stream(), start, end, total, x_checksum_sha256
+        )
+    except UploadConflict as e:
+        raise HTTPException(
+            status_code=409, detail=str(e), headers={"Upload-Offset": str(e.offset)}
+        )
+    except ChecksumMismatch as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return JSONResponse(result, headers={"Upload-Offset": str(result["offset"])})
+
+
+@router.api_route("/download/{name:path}", methods=["GET", "HEAD"])
+async def download_file(name: str, request: Request, compress: bool = False):
+    """
+    Отдает файл из UPLOAD_DIR. Поддерживаются Range (докачка и чтение
+    частями), ETag/If-None-Match и Last-Modified.
+
+    compress=true сжимает ответ на лету (zstd или gzip, по Accept-Encoding);
+    сжатый ответ отдается целиком, без Range.
+    """
+    try:
+        path = resolve_path(name)
+        stat_result = await asyncio.to_thread(path.stat)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="File not found")
+    if not stat.S_ISREG(stat_result.st_mode):
+        raise HTTPException(status_code=400, detail="Not a file")
+
+    response = _FileResponse(path, filename=path.name, stat_result=stat_result)
+    encoding = None
+    if compress and request.method == "GET" and "range" not in request.headers:
+        encoding = choose_encoding(request.headers.get("accept-encoding"))
+    etag = response.headers["etag"]
+    if encoding is not None:
+        # у сжатого представления свой ETag
+        etag = f'{etag[:-1]}-{encoding}"'
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(
+            status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag}
+        )
+    if encoding is None:
+        return response
+    return StreamingResponse(
+        compressed_chunks(path, encoding),
+        media_type=response.media_type,
+        headers={
+            "ETag": etag,
+            "Last-Modified": response.headers["last-modified"],
+            "Content-Disposition": response.headers["content-disposition"],
+            "Content-Encoding": encoding,
+            "Vary": "Accept-Encoding",
+        },
+    )
+
+
+@router.get("/output/{handle}")
+async def output_page(
+    handle: str, offset: int = Query(0, ge=0), limit: int | None = Query(None, ge=1)
+) -> dict:
+    """
+    Страница вывода ячейки, который не поместился в превью (handle из
+    сообщения spill). next_offset - откуда читать следующую страницу.
+    """
+    config = get_settings()
+    limit = min(limit or config.OUTPUT_PAGE_BYTES, config.OUTPUT_PAGE_BYTES)
+    try:
+        return await asyncio.to_thread(spill_store.read, handle, offset, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Output expired")
+
+
 @router.get("/file-list")
-async def file_list() -> list[dict]:
+async def file_list(
+    response: Response,
+    cursor: str | None = None,
+    limit: int | None = Query(None, ge=1),
+    recursive: bool = False,
+) -> list[dict]:
     """
-    Возвращает список файлов и папок в корневом каталоге UPLOAD_DIR.
-    Формат:
+    Возвращает страницу списка файлов и папок UPLOAD_DIR, отсортированного по
+    имени. Формат:
     [
-        {"name": "file1.txt", "type": "file"},
-        {"name": "subfolder", "type": "directory"},
+        {"name": "file1.txt", "type": "file", "size": 10, "mtime": 1700000000.0},
+        {"name": "subfolder", "type": "directory", "size": 4096, "mtime": ...},
         ...
     ]
+    Если есть следующая страница, ее курсор - в заголовке X-Next-Cursor.
+    recursive=true - вместе с содержимым подкаталогов (имена через "/").
     """
     config = get_settings()
-    base_path = config.UPLOAD_DIR
-
-    if not base_path.exists():
-        return []
-
-    result = []
-    for item in base_path.iterdir():
-        result.append(
-            {"name": item.name, "type": "directory" if item.is_dir() else "file"}
-        )
-
-    return result
+    limit = min(limit or config.FILE_LIST_PAGE_SIZE, config.FILE_LIST_PAGE_SIZE)
+    items, next_cursor = await file_index.page(cursor, limit, recursive)
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return items
 
 
 @router.delete("/delete-file")
 async def delete_file(name: str):
-    config = get_settings()
-    file_path = config.UPLOAD_DIR / name
+    try:
+        file_path = resolve_path(name)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
     if not file_path.exists():
         raise HTTPException(status_code=404, detail="File not found")
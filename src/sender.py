@@ -1,20 +1,144 @@
 import asyncio
+import time
+from contextlib import suppress
+from functools import partial
+from threading import Lock, get_ident
+from typing import TypeGuard
 
 import socketio
 from loguru import logger
 
+from .bridge import LoopBridge, loop_bridge
+from .buffer import OutputBuffer, payload_size, stream_name
+from .codec import check_codec, pack_messages
+from .config import get_settings
+from .logs import Sampler, preview
+from .metrics import (
+    OUTPUT_BUFFER_HIGH_WATER_MARK,
+    OUTPUT_BYTES,
+    OUTPUT_ELIDED_DISPLAYS,
+    OUTPUT_ELIDED_LINES,
+    OUTPUT_LATENCY_SECONDS,
+    SENDER_QUEUE_DEPTH,
+)
+from .models import OutputCodec, OverflowPolicy
+from .replay import ReplayLog
+
+config = get_settings()
+# сообщения вывода пишутся в лог выборочно
+sample_log = Sampler()
+
+
+def session_room(session: str) -> str:
+    """Комната socket.io: клиенты сессии и наблюдатели за ней."""
+    return f"session:{session}"
+
+
+def is_session_room(to: str | None) -> TypeGuard[str]:
+    return to is not None and to.startswith("session:")
+
+
+def _plain_stream(message: dict) -> bool:
+    """stream-сообщение без служебных полей (spill и т.п.), только текст."""
+    return stream_name(message) is not None and message["content"].keys() <= {
+        "name",
+        "text",
+    }
+
+
+def _same_stream(previous: dict, message: dict) -> bool:
+    """Кусок того же потока той же ячейки: его можно дописать к previous."""
+    return (
+        _plain_stream(message)
+        and stream_name(previous) == stream_name(message)
+        and {key: value for key, value in previous.items() if key != "content"}
+        == {key: value for key, value in message.items() if key != "content"}
+    )
+
+
+class _Batch:
+    """
+    Пакет сообщений для одного адресата. Подряд идущие stream-сообщения одного
+    потока (stdout/stderr) одной ячейки склеиваются в одно; сообщения со
+    служебными полями (spill, маркеры пропусков) уходят как есть.
+    """
+
+    def __init__(self) -> None:
+        self.messages: list[dict] = []
+        self.__stream_parts: list[str] = []
+
+    def add(self, message: dict) -> None:
+        if self.__stream_parts and _same_stream(self.messages[-1], message):
+            self.__stream_parts.append(message["content"].get("text", ""))
+            return
+        self.__merge_stream()
+        self.messages.append(message)
+        if _plain_stream(message):
+            self.__stream_parts = [message["content"].get("text", "")]
+
+    def build(self) -> list[dict]:
+        self.__merge_stream()
+        return self.messages
+
+    def __merge_stream(self) -> None:
+        if len(self.__stream_parts) > 1:
+            last = self.messages[-1]
+            self.messages[-1] = {
+                **last,
+                "content": {**last["content"], "text": "".join(self.__stream_parts)},
+            }
+        self.__stream_parts = []
+
 
 class Sender:
-    def __init__(self, sio: socketio.AsyncServer):
+    def __init__(
+        self,
+        sio: socketio.AsyncServer,
+        batch_window_s: float | None = None,
+        batch_max_bytes: int | None = None,
+        buffer_size: int | None = None,
+        policy: OverflowPolicy | None = None,
+        codec: OutputCodec | None = None,
+    ):
         self.sio = sio
         self.__task: asyncio.Task | None = None
-        self._queue = asyncio.Queue()
+        self.__bridge: LoopBridge | None = None
+        self.__wake = partial(self.__wakeup, False)
+        self.__wake_flush = partial(self.__wakeup, True)
+        self.__loop_thread: int | None = None
+        self.__batch_window_s = (
+            config.SENDER_BATCH_WINDOW_S if batch_window_s is None else batch_window_s
+        )
+        self.__batch_max_bytes = (
+            config.SENDER_BATCH_MAX_BYTES
+            if batch_max_bytes is None
+            else batch_max_bytes
+        )
+        self.__buffer_size = (
+            config.OUTPUT_BUFFER_MAX_MESSAGES if buffer_size is None else buffer_size
+        )
+        self.__policy = config.OUTPUT_BUFFER_POLICY if policy is None else policy
+        self.codec = config.OUTPUT_CODEC if codec is None else codec
+        check_codec(self.codec)
+        # по буферу на адресата, чтобы медленный клиент не тормозил остальных
+        self.__buffers: dict[str | None, OutputBuffer] = {}
+        self.__buffers_lock = Lock()
+        # журналы вывода сессий для досылки после обрыва связи, по комнате
+        self.__replay: dict[str, ReplayLog] = {}
+        self.__ready = asyncio.Event()
+        self.__flush = asyncio.Event()
+        self.__drained = asyncio.Event()
 
     def start(self) -> None:
-        loop = asyncio.get_event_loop()
-        self.__task = asyncio.ensure_future(self.__sender(), loop=loop)
+        """Запускает отправку в работающем event loop-е; вызывается из него."""
+        loop = asyncio.get_running_loop()
+        self.__bridge = loop_bridge(loop)
+        self.__task = loop.create_task(self.__sender())
 
     async def stop(self) -> None:
+        with self.__buffers_lock:
+            for buffer in self.__buffers.values():
+                buffer.close()
         if not self.__task or self.__task.done():
             return
         self.__task.cancel()
@@ -23,14 +147,179 @@ class Sender:
         except asyncio.CancelledError:
             pass
 
-    def send_message(self, data: dict) -> None:
-        logger.info(f"Sending message from kernel: {data}")
-        self._queue.put_nowait(data)
+    def send_message(
+        self, data: dict, to: str | None = None, received_at: float | None = None
+    ) -> None:
+        """
+        to - sid клиента или комната; без него сообщение уходит всем клиентам
+        received_at - time.monotonic() прихода сообщения из kernel-а
+
+        При политике BLOCK вызов из потока kernel-а ждет, пока в буфере
+        адресата появится место; из event loop-а не блокирует никогда.
+        """
+        if sample_log():
+            logger.opt(lazy=True).debug(
+                "Sending message from kernel to {}: {}",
+                lambda: to,
+                lambda: preview(data),
+            )
+        buffer = self.__buffer(to)
+        on_loop = get_ident() == self.__loop_thread
+        high_water_mark = buffer.high_water_mark
+        elided_displays = buffer.elided_displays
+        if elided := buffer.put(data, block=not on_loop, received_at=received_at):
+            OUTPUT_ELIDED_LINES.inc(elided, destination=to)
+        if buffer.elided_displays != elided_displays:
+            OUTPUT_ELIDED_DISPLAYS.inc(
+                buffer.elided_displays - elided_displays, destination=to
+            )
+        if buffer.high_water_mark != high_water_mark:
+            OUTPUT_BUFFER_HIGH_WATER_MARK.set(buffer.high_water_mark, destination=to)
+        # конец ячейки отправляем сразу, не дожидаясь окна пакета
+        flush = (
+            buffer.size_bytes >= self.__batch_max_bytes
+            or data.get("command") == "notebook-end"
+        )
+        if on_loop:
+            self.__wakeup(flush)
+        elif self.__bridge is not None:
+            # из потока kernel-а: одно пробуждение loop-а на пачку сообщений
+            self.__bridge.notify(self.__wake_flush if flush else self.__wake)
+
+    async def send(
+        self, data: dict, to: str | None = None, received_at: float | None = None
+    ) -> None:
+        """
+        Отправка из event loop-а. При политике BLOCK ждет, пока в буфере
+        адресата появится место, не блокируя сам loop.
+        """
+        buffer = self.__buffer(to)
+        while self.__policy == OverflowPolicy.BLOCK and buffer.full():
+            self.__drained.clear()
+            self.__wakeup(flush=True)
+            await self.__drained.wait()
+        self.send_message(data, to, received_at)
+
+    def resume(self, room: str, epoch: str | None, seq: int) -> dict:
+        """
+        Что дослать клиенту, вернувшемуся в комнату сессии после обрыва:
+        {"epoch", "messages" - все после seq в кодировке вывода, "replayed" -
+        сколько их, "lost" - сколько пропущенных уже не сохранилось}.
+        epoch=None - клиент подключается впервые, ему досылать нечего; epoch
+        другого журнала - досылается весь журнал.
+        """
+        log = self.__replay_log(room)
+        if epoch is None:
+            seq = log.last_seq
+        elif epoch != log.epoch:
+            seq = 0
+        messages, lost = log.since(seq)
+        return {
+            "epoch": log.epoch,
+            "messages": pack_messages(messages, self.codec),
+            "replayed": len(messages),
+            "lost": lost,
+        }
+
+    def forget(self, to: str) -> None:
+        """
+        Забывает адресата, который больше не вернется: его буфер, журнал
+        вывода и ряды метрик.
+        """
+        with self.__buffers_lock:
+            buffer = self.__buffers.pop(to, None)
+        if buffer is not None:
+            buffer.close()
+        self.__replay.pop(to, None)
+        for metric in (
+            OUTPUT_BUFFER_HIGH_WATER_MARK,
+            OUTPUT_ELIDED_LINES,
+            OUTPUT_ELIDED_DISPLAYS,
+            SENDER_QUEUE_DEPTH,
+            OUTPUT_BYTES,
+        ):
+            metric.remove(destination=to)
+
+    def __replay_log(self, room: str) -> ReplayLog:
+        if (log := self.__replay.get(room)) is None:
+            # журналы сессий, к которым давно никто не обращался, больше не нужны
+            expired = time.monotonic() - config.KERNEL_IDLE_TTL_S
+            self.__replay = {
+                name: old
+                for name, old in self.__replay.items()
+                if old.last_used >= expired
+            }
+            log = ReplayLog(
+                room.removeprefix("session:"),
+                config.REPLAY_BUFFER_MESSAGES,
+                config.REPLAY_BUFFER_BYTES,
+            )
+            self.__replay[room] = log
+        return log
+
+    def __buffer(self, to: str | None) -> OutputBuffer:
+        with self.__buffers_lock:
+            if (buffer := self.__buffers.get(to)) is None:
+                buffer = OutputBuffer(self.__buffer_size, self.__policy)
+                self.__buffers[to] = buffer
+            return buffer
+
+    def __wakeup(self, flush: bool) -> None:
+        self.__ready.set()
+        if flush:
+            self.__flush.set()
 
     async def __sender(self) -> None:
+        self.__loop_thread = get_ident()
         while True:
-            msg = await self._queue.get()
-            try:
-                await self.sio.emit("output", data=msg)
-            except Exception as e:
-                logger.opt(exception=e).warning(f"Message could't send {msg=}")
+            await self.__ready.wait()
+            if self.__batch_window_s > 0 and not self.__flush.is_set():
+                # копим пакет, пока не истечет окно или не наберется объем
+                with suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(self.__flush.wait(), self.__batch_window_s)
+            self.__ready.clear()
+            self.__flush.clear()
+            with self.__buffers_lock:
+                buffers = list(self.__buffers.items())
+            for to, buffer in buffers:
+                await self.__send_buffer(to, buffer)
+            self.__drained.set()
+
+    async def __send_buffer(self, to: str | None, buffer: OutputBuffer) -> None:
+        if self.__batch_window_s <= 0:
+            for message in buffer.drain():
+                await self.__emit(to, [message])
+            return
+        SENDER_QUEUE_DEPTH.set(len(buffer), destination=to)
+        messages = buffer.drain(self.__batch_max_bytes)
+        oldest_received = buffer.oldest_received
+        if len(buffer):
+            # не влезло в один пакет - следующий уходит без ожидания окна
+            self.__wakeup(flush=True)
+        if not messages:
+            return
+        batch = _Batch()
+        for message in messages:
+            batch.add(message)
+        await self.__emit(to, batch.build())
+        if oldest_received is not None:
+            OUTPUT_LATENCY_SECONDS.observe(time.monotonic() - oldest_received)
+
+    async def __emit(self, to: str | None, messages: list[dict]) -> None:
+        if is_session_room(to):
+            messages = self.__replay_log(to).record(messages)
+        data: dict | list[dict] | bytes
+        if self.codec != OutputCodec.JSON:
+            event, data = "output-packed", pack_messages(messages, self.codec)
+        elif len(messages) == 1:
+            event, data = "output", messages[0]
+        else:
+            event, data = "output-batch", messages
+        try:
+            await self.sio.emit(event, data=data, to=to)
+        except Exception as e:
+            logger.opt(exception=e, lazy=True).warning(
+                "Message could't send to {}: {}", lambda: to, lambda: preview(messages)
+            )
+            return
+        OUTPUT_BYTES.inc(payload_size(data), destination=to)
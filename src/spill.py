@@ -0,0 +1,232 @@
+import os
+import re
+import time
+from pathlib import Path
+from typing import BinaryIO
+from uuid import uuid4
+
+from loguru import logger
+
+from .binary import RICH_MSG_TYPES
+from .config import get_settings
+
+config = get_settings()
+
+HANDLE = re.compile(r"[0-9a-f]{32}")
+# сколько последних байт строки показывается, пока вывод идет в файл
+LIVE_LINE_BYTES = 1024
+
+
+def utf8_prefix(data: bytes) -> bytes:
+    """Обрезает в конце незаконченный многобайтовый символ UTF-8."""
+    for back in range(1, min(4, len(data)) + 1):
+        byte = data[-back]
+        if byte & 0xC0 != 0x80:
+            # начало символа: сколько байт он занимает
+            length = 1 if byte < 0x80 else 2 if byte < 0xE0 else 3 if byte < 0xF0 else 4
+            return data if length <= back else data[:-back]
+    return data
+
+
+def utf8_suffix(data: bytes) -> bytes:
+    """Отрезает в начале продолжение символа, начатого до data."""
+    start = 0
+    while start < min(3, len(data)) and data[start] & 0xC0 == 0x80:
+        start += 1
+    return data[start:]
+
+
+class SpillStore:
+    """
+    Файлы с полным выводом ячеек, который не поместился в превью.
+    Клиент дочитывает их страницами по handle. Файлы старше SPILL_TTL_S
+    удаляются при создании новых.
+    """
+
+    def __init__(self, directory: Path | None = None, ttl_s: float | None = None):
+        self.__dir = directory or config.SPILL_DIR
+        self.__ttl_s = config.SPILL_TTL_S if ttl_s is None else ttl_s
+
+    def create(self) -> tuple[str, BinaryIO]:
+        self.__dir.mkdir(parents=True, exist_ok=True)
+        self.__cleanup()
+        handle = uuid4().hex
+        return handle, self.path(handle).open("wb")
+
+    def path(self, handle: str) -> Path:
+        if not HANDLE.fullmatch(handle):
+            raise ValueError(f"Invalid output handle: {handle}")
+        return self.__dir / f"{handle}.txt"
+
+    def read(self, handle: str, offset: int, limit: int) -> dict:
+        """
+        Страница вывода: не больше limit байт с offset, по границе символа.
+        Блокирующий вызов.
+        """
+        with self.path(handle).open("rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            data = os.pread(f.fileno(), limit, offset)
+        if offset + len(data) < size:
+            data = utf8_prefix(data)
+        return {
+            "handle": handle,
+            "text": data.decode("utf-8", errors="replace"),
+            "offset": offset,
+            "next_offset": offset + len(data),
+            "size": size,
+        }
+
+    def __cleanup(self) -> None:
+        expired = time.time() - self.__ttl_s
+        for entry in os.scandir(self.__dir):
+            try:
+                if entry.stat().st_mtime < expired:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                continue
+
+
+spill_store = SpillStore()
+
+
+class OutputSpill:
+    """
+    Ограничивает вывод одной ячейки, который уходит клиентам.
+
+    Пока stream-вывод ячейки меньше OUTPUT_PREVIEW_BYTES, он проходит как
+    есть. Дальше весь stream-вывод (вместе с уже отправленным) пишется в файл
+    SpillStore, клиенту сразу уходит маркер с handle, по которому остальное
+    читается страницами, раз в OUTPUT_LIVE_PREVIEW_S - последняя строка
+    вывода с его текущим размером, а по окончании ячейки - сообщение spill с
+    хвостом вывода. Огромный text/plain в display_data/execute_result заменяется
+    началом и концом со своим handle.
+
+    Вызывается только из потока kernel-а: запись на диск не трогает event loop.
+    """
+
+    def __init__(
+        self,
+        store: SpillStore = spill_store,
+        preview_bytes: int | None = None,
+        tail_bytes: int | None = None,
+        live_preview_s: float | None = None,
+    ) -> None:
+        self.__store = store
+        self.__preview_bytes = (
+            config.OUTPUT_PREVIEW_BYTES if preview_bytes is None else preview_bytes
+        )
+        self.__tail_bytes = (
+            config.OUTPUT_TAIL_BYTES if tail_bytes is None else tail_bytes
+        )
+        self.__live_preview_s = (
+            config.OUTPUT_LIVE_PREVIEW_S if live_preview_s is None else live_preview_s
+        )
+        self.__next_preview = 0.0
+        # уже отправленный клиентам stream-вывод, пока файла нет
+        self.__head: list[bytes] = []
+        self.__sent = 0
+        self.__handle: str | None = None
+        self.__file: BinaryIO | None = None
+        self.__size = 0
+        self.__tail = b""
+
+    def limit(self, msg_type: str, content: dict) -> dict | None:
+        """Что отправить клиентам вместо content; None - ничего."""
+        if msg_type == "stream":
+            return self.__limit_stream(content)
+        if msg_type in RICH_MSG_TYPES:
+            return self.__limit_rich(content)
+        return content
+
+    def close(self) -> dict | None:
+        """Содержимое итогового сообщения spill, если вывод уходил в файл."""
+        if self.__file is None:
+            return None
+        self.__file.close()
+        self.__file = None
+        tail = utf8_suffix(self.__tail)
+        logger.info(f"Cell output of {self.__size} bytes spilled to {self.__handle}")
+        return {
+            "name": "stdout",
+            "text": tail.decode("utf-8", errors="replace"),
+            "spill": self.__spilled(len(tail)),
+        }
+
+    def __spilled(self, tail_shown: int) -> dict:
+        return {
+            "handle": self.__handle,
+            "offset": self.__sent,
+            "tail_offset": self.__size - tail_shown,
+            "size": self.__size,
+        }
+
+    def __limit_stream(self, content: dict) -> dict | None:
+        data = content.get("text", "").encode("utf-8")
+        if self.__file is not None:
+            self.__file.write(data)
+            self.__size += len(data)
+            self.__tail = (self.__tail + data[-self.__tail_bytes :])[
+                -self.__tail_bytes :
+            ]
+            return self.__live_preview(content)
+        if self.__sent + len(data) <= self.__preview_bytes:
+            self.__head.append(data)
+            self.__sent += len(data)
+            return content
+        # превью кончилось: отправляем то, что в него влезло, остальное - в файл
+        shown = utf8_prefix(data[: self.__preview_bytes - self.__sent])
+        self.__handle, self.__file = self.__store.create()
+        self.__file.write(b"".join(self.__head))
+        self.__file.write(data)
+        self.__head = []
+        self.__size = self.__sent + len(data)
+        self.__sent += len(shown)
+        self.__tail = data[len(shown) :][-self.__tail_bytes :]
+        self.__next_preview = time.monotonic() + self.__live_preview_s
+        return {
+            **content,
+            "text": shown.decode("utf-8")
+            + "\n... output is too large, the rest is kept on the server ...\n",
+            "spill": self.__spilled(0),
+        }
+
+    def __live_preview(self, content: dict) -> dict | None:
+        """Последняя строка вывода, идущего в файл, не чаще OUTPUT_LIVE_PREVIEW_S."""
+        if (now := time.monotonic()) < self.__next_preview:
+            return None
+        self.__next_preview = now + self.__live_preview_s
+        line = self.__tail.rstrip(b"\n").rsplit(b"\n", 1)[-1][-LIVE_LINE_BYTES:]
+        text = utf8_suffix(line).decode("utf-8", errors="replace")
+        return {
+            **content,
+            "text": f"... [{self.__size} bytes kept on the server] {text}\n",
+            "spill": self.__spilled(0),
+        }
+
+    def __limit_rich(self, content: dict) -> dict:
+        text = content.get("data", {}).get("text/plain")
+        if not isinstance(text, str) or len(text) <= self.__preview_bytes:
+            return content
+        data = text.encode("utf-8")
+        if len(data) <= self.__preview_bytes:
+            return content
+        handle, file = self.__store.create()
+        with file:
+            file.write(data)
+        head = utf8_prefix(data[: self.__preview_bytes])
+        tail = utf8_suffix(data[-self.__tail_bytes :])
+        return {
+            **content,
+            "data": {
+                **content["data"],
+                "text/plain": head.decode("utf-8")
+                + "\n...\n"
+                + tail.decode("utf-8", errors="replace"),
+            },
+            "spill": {
+                "handle": handle,
+                "offset": len(head),
+                "tail_offset": len(data) - len(tail),
+                "size": len(data),
+            },
+        }
@@ -0,0 +1,39 @@
+import socket
+import threading
+import time
+
+import pytest
+import uvicorn
+from fastapi import FastAPI
+
+from src.config import get_settings
+from src.routes import router
+
+
+@pytest.fixture
+def upload_dir(tmp_path, monkeypatch):
+    """UPLOAD_DIR во временном каталоге теста."""
+    monkeypatch.setattr(get_settings(), "UPLOAD_DIR", tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def server_url(upload_dir):
+    """Маршруты /service на uvicorn на свободном локальном порту."""
+    app = FastAPI()
+    app.include_router(router)
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = uvicorn.Server(
+        uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning")
+    )
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 5
+    while not server.started:
+        assert time.monotonic() < deadline, "server did not start"
+        time.sleep(0.01)
+    yield f"http://127.0.0.1:{port}"
+    server.should_exit = True
+    thread.join(5)
@@ -0,0 +1,122 @@
+import threading
+import time
+
+from src.buffer import OutputBuffer
+from src.models import OverflowPolicy
+
+
+def stream(text: str) -> dict:
+    return {
+        "command": "notebook-upd",
+        "msg_type": "stream",
+        "content": {"name": "stdout", "text": text},
+    }
+
+
+def display(index: int, display_id: str | None = None) -> dict:
+    message = {
+        "command": "notebook-upd",
+        "msg_type": "display_data" if display_id is None else "update_display_data",
+        "content": {"data": {"text/plain": str(index)}},
+    }
+    if display_id is not None:
+        message["content"]["transient"] = {"display_id": display_id}
+    return message
+
+
+def end() -> dict:
+    return {"command": "notebook-end", "content": {}}
+
+
+def test_drop_elides_stream_lines_with_one_marker():
+    buffer = OutputBuffer(2, OverflowPolicy.DROP)
+    buffer.put(stream("a\n"))
+    buffer.put(stream("b\n"))
+    assert buffer.put(stream("c\nd\n")) == 2
+    assert buffer.put(stream("e\n")) == 1
+    messages = buffer.drain()
+    assert [m["content"]["text"] for m in messages[:2]] == ["a\n", "b\n"]
+    assert messages[2]["elided"] == 3
+    assert "3 lines elided" in messages[2]["content"]["text"]
+
+
+def test_drop_keeps_cell_end_over_maxsize():
+    buffer = OutputBuffer(1, OverflowPolicy.DROP)
+    buffer.put(stream("a\n"))
+    buffer.put(end())
+    assert [m["command"] for m in buffer.drain()] == ["notebook-upd", "notebook-end"]
+
+
+def test_drop_bounds_displays_with_marker():
+    buffer = OutputBuffer(5, OverflowPolicy.DROP)
+    for index in range(1000):
+        buffer.put(display(index))
+    assert len(buffer) == 5
+    assert buffer.elided_displays == 996
+    messages = buffer.drain()
+    marker = next(m for m in messages if "elided" in m)
+    assert "996 displays elided" in marker["content"]["text"]
+    # выброшены самые старые показы, последние дойдут до клиента
+    assert messages[-1]["content"]["data"]["text/plain"] == "999"
+
+
+def test_drop_evicts_display_for_cell_end():
+    buffer = OutputBuffer(3, OverflowPolicy.DROP)
+    for index in range(3):
+        buffer.put(display(index))
+    buffer.put(end())
+    messages = buffer.drain()
+    # маркер сам занимает место: под конец ячейки уходят два старых показа
+    assert [m.get("elided") for m in messages] == [2, None, None]
+    assert messages[1]["content"]["data"]["text/plain"] == "2"
+    assert messages[2]["command"] == "notebook-end"
+
+
+def test_latest_keeps_last_update_of_display():
+    buffer = OutputBuffer(10, OverflowPolicy.LATEST)
+    for index in range(5):
+        buffer.put(display(index, display_id="progress"))
+    buffer.put(display(0, display_id="other"))
+    messages = buffer.drain()
+    assert [m["content"]["data"]["text/plain"] for m in messages] == ["4", "0"]
+    # после отправки обновление снова встает в очередь
+    buffer.put(display(5, display_id="progress"))
+    assert len(buffer) == 1
+
+
+def test_drain_respects_max_bytes():
+    buffer = OutputBuffer(10, OverflowPolicy.DROP)
+    for _ in range(3):
+        buffer.put(stream("x" * 100))
+    assert len(buffer.drain(max_bytes=150)) == 2
+    assert len(buffer) == 1
+
+
+def test_block_waits_for_drain():
+    buffer = OutputBuffer(1, OverflowPolicy.BLOCK)
+    buffer.put(stream("a\n"))
+    writer = threading.Thread(target=buffer.put, args=(stream("b\n"),))
+    writer.start()
+    time.sleep(0.1)
+    assert writer.is_alive() and len(buffer) == 1
+    assert len(buffer.drain()) == 1
+    writer.join(1)
+    assert not writer.is_alive()
+    assert buffer.drain()[0]["content"]["text"] == "b\n"
+
+
+def test_block_never_waits_without_block():
+    buffer = OutputBuffer(1, OverflowPolicy.BLOCK)
+    buffer.put(stream("a\n"))
+    buffer.put(stream("b\n"), block=False)
+    assert len(buffer) == 2
+
+
+def test_close_releases_blocked_writer():
+    buffer = OutputBuffer(1, OverflowPolicy.BLOCK)
+    buffer.put(stream("a\n"))
+    writer = threading.Thread(target=buffer.put, args=(stream("b\n"),))
+    writer.start()
+    buffer.close()
+    writer.join(1)
+    assert not writer.is_alive()
@@ -0,0 +1,56 @@
+import asyncio
+
+import pytest
+
+from frontapp.client import _unpack
+from src import codec
+from src.codec import check_codec, pack_messages
+from src.models import OutputCodec
+from src.sender import Sender
+
+# без msgpack кодек вывода - только JSON, проверять нечего
+pytest.importorskip("msgpack")
+
+MESSAGES = [
+    {"command": "notebook-upd", "content": {"text": "1\n"}},
+    {"command": "notebook-upd", "content": {"data": {"image/png": b"\x89PNG\x00"}}},
+]
+
+
+def test_json_messages_are_sent_as_is():
+    assert pack_messages(MESSAGES, OutputCodec.JSON) is MESSAGES
+    assert _unpack(MESSAGES) is MESSAGES
+
+
+def test_msgpack_round_trip_keeps_binary_data():
+    packed = pack_messages(MESSAGES, OutputCodec.MSGPACK)
+    assert isinstance(packed, bytes)
+    assert _unpack(packed) == MESSAGES
+
+
+def test_msgpack_codec_requires_package(monkeypatch):
+    check_codec(OutputCodec.MSGPACK)
+    monkeypatch.setattr(codec, "msgpack", None)
+    check_codec(OutputCodec.JSON)
+    with pytest.raises(RuntimeError):
+        check_codec(OutputCodec.MSGPACK)
+
+
+def test_sender_packs_batch_into_one_event():
+    events = []
+
+    class FakeServer:
+        async def emit(self, event, data=None, to=None):
+            events.append((event, data))
+
+    async def run():
+        sender = Sender(FakeServer(), batch_window_s=0.01, codec=OutputCodec.MSGPACK)
+        sender.start()
+        for message in MESSAGES:
+            sender.send_message(message, to="sid")
+        await asyncio.sleep(0.1)
+        await sender.stop()
+
+    asyncio.run(run())
+    assert [event for event, _ in events] == ["output-packed"]
+    assert _unpack(events[0][1]) == MESSAGES
@@ -0,0 +1,74 @@
+import asyncio
+
+import aiohttp
+import pytest
+
+from frontapp.transfer import download_file
+
+
+def download(server_url: str, target, progress=None):
+    async def run():
+        async with aiohttp.ClientSession() as http:
+            return await download_file(http, server_url, "data.bin", target, progress)
+
+    return asyncio.run(run())
+
+
+def etag(server_url: str) -> str:
+    async def run():
+        async with aiohttp.ClientSession() as http:
+            async with http.head(f"{server_url}/service/download/data.bin") as r:
+                return r.headers["ETag"]
+
+    return asyncio.run(run())
+
+
+@pytest.fixture
+def data(upload_dir) -> bytes:
+    data = bytes(range(256)) * 4096
+    (upload_dir / "data.bin").write_bytes(data)
+    return data
+
+
+def test_download_whole_file(server_url, data, tmp_path):
+    target = tmp_path / "out" / "data.bin"
+    target.parent.mkdir()
+    assert download(server_url, target) == target
+    assert target.read_bytes() == data
+    assert not target.with_name("data.bin.part").exists()
+    assert not target.with_name("data.bin.part.validator").exists()
+
+
+def test_download_resumes_unchanged_file(server_url, data, tmp_path):
+    target = tmp_path / "data.bin"
+    target.with_name("data.bin.part").write_bytes(data[:1000])
+    target.with_name("data.bin.part.validator").write_text(etag(server_url))
+    received = []
+    download(server_url, target, lambda offset, total: received.append(offset))
+    assert target.read_bytes() == data
+    # докачка начинается с места остановки, а не с нуля
+    assert received[0] > 1000 and received[-1] == len(data)
+
+
+def test_download_restarts_changed_file(server_url, data, upload_dir, tmp_path):
+    target = tmp_path / "data.bin"
+    target.with_name("data.bin.part").write_bytes(data[:1000])
+    target.with_name("data.bin.part.validator").write_text(etag(server_url))
+    changed = b"changed" + data
+    (upload_dir / "data.bin").write_bytes(changed)
+    download(server_url, target)
+    assert target.read_bytes() == changed
+
+
+def test_download_restarts_part_without_validator(server_url, data, tmp_path):
+    target = tmp_path / "data.bin"
+    target.with_name("data.bin.part").write_bytes(b"garbage")
+    download(server_url, target)
+    assert target.read_bytes() == data
+
+
+def test_download_restarts_part_past_end(server_url, data, tmp_path):
+    target = tmp_path / "data.bin"
+    target.with_name("data.bin.part").write_bytes(data + b"tail")
+    download(server_url, target)
+    assert target.read_bytes() == data
@@ -0,0 +1,147 @@
+import asyncio
+import hashlib
+
+import aiohttp
+import pytest
+
+from src.files import (
+    ChecksumMismatch,
+    UploadConflict,
+    UploadStore,
+    parse_content_range,
+    resolve_path,
+)
+
+
+async def body(*chunks: bytes):
+    for chunk in chunks:
+        yield chunk
+
+
+def write(store: UploadStore, *chunks: bytes, **kwargs) -> dict:
+    return asyncio.run(store.write("data.bin", body(*chunks), **kwargs))
+
+
+@pytest.mark.parametrize(
+    "header, expected",
+    [
+        ("bytes 0-99/1000", (0, 99, 1000)),
+        ("bytes 900-999/1000", (900, 999, 1000)),
+        ("bytes 0-99/*", (0, 99, None)),
+        ("bytes */1000", (None, None, 1000)),
+        ("bytes */*", (None, None, None)),
+    ],
+)
+def test_parse_content_range(header, expected):
+    assert parse_content_range(header) == expected
+
+
+@pytest.mark.parametrize(
+    "header",
+    ["bytes 0-99", "items 0-99/1000", "bytes 99-0/1000", "bytes 0-1000/1000", ""],
+)
+def test_parse_content_range_rejects_invalid(header):
+    with pytest.raises(ValueError):
+        parse_content_range(header)
+
+
+def test_resolve_path_stays_in_upload_dir(upload_dir):
+    assert resolve_path("a/b.txt") == upload_dir.resolve() / "a" / "b.txt"
+    for name in ("../secret", "/etc/passwd"):
+        with pytest.raises(ValueError):
+            resolve_path(name)
+
+
+def test_whole_body_completes(upload_dir):
+    data = b"x" * 1000
+    result = write(UploadStore(write_buffer_bytes=64), data[:300], data[300:])
+    assert result["complete"] and result["size"] == 1000
+    assert result["sha256"] == hashlib.sha256(data).hexdigest()
+    assert (upload_dir / "data.bin").read_bytes() == data
+    assert not (upload_dir / "data.bin.part").exists()
+
+
+def test_chunks_complete_at_total(upload_dir):
+    store = UploadStore()
+    first = write(store, b"a" * 10, start=0, end=9, total=20)
+    assert first == {"filename": "data.bin", "offset": 10, "complete": False}
+    assert store.offset("data.bin") == 10
+    result = write(store, b"b" * 10, start=10, end=19, total=20)
+    assert result["complete"]
+    assert (upload_dir / "data.bin").read_bytes() == b"a" * 10 + b"b" * 10
+
+
+def test_chunks_of_unknown_total_do_not_complete(upload_dir):
+    store = UploadStore()
+    result = write(store, b"a" * 10, start=0, end=9)
+    assert not result["complete"]
+    assert not (upload_dir / "data.bin").exists()
+
+
+def test_chunk_must_continue_from_offset(upload_dir):
+    store = UploadStore()
+    write(store, b"a" * 10, start=0, end=9, total=30)
+    with pytest.raises(UploadConflict) as error:
+        write(store, b"c" * 10, start=20, end=29, total=30)
+    assert error.value.offset == 10
+
+
+def test_short_chunk_is_kept_for_resume(upload_dir):
+    store = UploadStore()
+    with pytest.raises(ValueError):
+        write(store, b"a" * 5, start=0, end=9, total=20)
+    assert store.offset("data.bin") == 5
+
+
+def test_long_chunk_is_cut_at_range_end(upload_dir):
+    store = UploadStore()
+    with pytest.raises(ValueError):
+        write(store, b"a" * 8, b"b" * 8, start=0, end=9, total=20)
+    assert (upload_dir / "data.bin.part").read_bytes() == b"a" * 8 + b"b" * 2
+
+
+def test_checksum_mismatch_discards_upload(upload_dir):
+    with pytest.raises(ChecksumMismatch):
+        write(UploadStore(), b"data", checksum="0" * 64)
+    assert not (upload_dir / "data.bin").exists()
+    assert not (upload_dir / "data.bin.part").exists()
+
+
+def test_resume_after_restart_rehashes_part(upload_dir):
+    data = b"0123456789" * 3
+    write(UploadStore(), data[:10], start=0, end=9, total=30)
+    # новый UploadStore - как после перезапуска сервера
+    result = write(
+        UploadStore(),
+        data[10:],
+        start=10,
+        end=29,
+        total=30,
+        checksum=hashlib.sha256(data).hexdigest(),
+    )
+    assert result["complete"]
+    assert (upload_dir / "data.bin").read_bytes() == data
+
+
+def post_form(server_url: str, filename: str, data: bytes) -> tuple[int, dict]:
+    async def run():
+        form = aiohttp.FormData()
+        form.add_field("file", data, filename=filename)
+        async with aiohttp.ClientSession() as http:
+            async with http.post(f"{server_url}/service/upload", data=form) as r:
+                return r.status, await r.json()
+
+    return asyncio.run(run())
+
+
+def test_multipart_upload_is_saved(server_url, upload_dir):
+    status, result = post_form(server_url, "form.bin", b"x" * 3_000_000)
+    assert status == 200 and result["filename"] == "form.bin"
+    assert (upload_dir / "form.bin").read_bytes() == b"x" * 3_000_000
+    assert not (upload_dir / "form.bin.part").exists()
+
+
+def test_multipart_upload_without_filename_is_rejected(server_url, upload_dir):
+    status, _ = post_form(server_url, "", b"data")
+    assert status == 400
+    assert list(upload_dir.iterdir()) == []
@@ -0,0 +1,33 @@
+import hashlib
+
+import pytest
+
+from frontapp.imagecache import ImageCache
+from frontapp.parser import parse_image
+
+
+def test_put_and_get_from_disk(tmp_path):
+    data = b"\x89PNG"
+    key = hashlib.sha256(data).hexdigest()
+    ImageCache(bytes, cache_dir=tmp_path).put(key, data)
+    # новый кэш пуст в памяти и поднимает картинку с диска
+    assert ImageCache(bytes, cache_dir=tmp_path).get(key) == data
+
+
+@pytest.mark.parametrize("key", ["../../escape", "/etc/passwd", "A" * 64, ""])
+def test_key_that_is_not_sha256_is_rejected(tmp_path, key):
+    cache = ImageCache(bytes, cache_dir=tmp_path / "images")
+    with pytest.raises(ValueError):
+        cache.put(key, b"data")
+    assert list(tmp_path.rglob("*")) == [tmp_path / "images"]
+
+
+def test_parse_image_rehashes_invalid_key():
+    data = b"\x89PNG"
+    message = {
+        "content": {
+            "data": {"image/png": data},
+            "sha256": {"image/png": "../../escape"},
+        }
+    }
+    assert parse_image(message) == (hashlib.sha256(data).hexdigest(), data)
@@ -0,0 +1,146 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from src import kernelpool
+from src.kernelpool import KernelPool, KernelPoolExhausted
+from src.models import Status
+
+
+class FakeKernel:
+    """KernelWrapper без процесса kernel-а: запуск занимает start_delay_s."""
+
+    start_delay_s = 0.0
+
+    def __init__(self, connection_info: dict) -> None:
+        time.sleep(self.start_delay_s)
+        self.connection_info = connection_info
+        self.alive = True
+        self.restarts = 0
+        self.stopped = False
+        self.pid = None
+
+    def preload_cells(self) -> None:
+        pass
+
+    def on_death(self, callback) -> None:
+        pass
+
+    def restart_kernel(self) -> None:
+        self.restarts += 1
+
+    def shutdown_kernel(self) -> None:
+        self.alive = False
+        self.stopped = True
+
+    def get_status(self) -> Status:
+        return Status.IDLE
+
+
+@pytest.fixture
+def make_pool(monkeypatch):
+    monkeypatch.setattr(kernelpool, "KernelWrapper", FakeKernel)
+    pools = []
+
+    def make_pool(min_size: int, max_size: int) -> KernelPool:
+        pool = KernelPool(min_size=min_size, max_size=max_size, idle_ttl_s=600)
+        pools.append(pool)
+        return pool
+
+    yield make_pool
+    for pool in pools:
+        pool.shutdown()
+
+
+def wait_for(predicate, timeout_s: float = 2.0) -> None:
+    deadline = time.monotonic() + timeout_s
+    while not predicate():
+        assert time.monotonic() < deadline, "condition was not met in time"
+        time.sleep(0.01)
+
+
+def test_acquire_keeps_kernel_of_session(make_pool):
+    pool = make_pool(min_size=0, max_size=2)
+    kernel = pool.acquire("a")
+    assert pool.acquire("a") is kernel
+    assert pool.acquire("b") is not kernel
+
+
+def test_acquire_raises_when_all_slots_are_taken(make_pool):
+    pool = make_pool(min_size=0, max_size=1)
+    pool.acquire("a")
+    with pytest.raises(KernelPoolExhausted):
+        pool.acquire("b")
+
+
+def test_acquire_frees_slot_of_discarded_session(make_pool):
+    pool = make_pool(min_size=0, max_size=1)
+    kernel = pool.acquire("a")
+    pool.discard("a")
+    assert kernel.stopped
+    assert pool.acquire("b") is not kernel
+
+
+def test_concurrent_acquire_binds_one_kernel(make_pool, monkeypatch):
+    monkeypatch.setattr(FakeKernel, "start_delay_s", 0.1)
+    pool = make_pool(min_size=0, max_size=1)
+    with ThreadPoolExecutor(3) as executor:
+        kernels = list(executor.map(pool.acquire, ["a"] * 3))
+    assert kernels[0] is kernels[1] is kernels[2]
+
+
+def test_acquire_waits_for_warming_kernel(make_pool, monkeypatch):
+    monkeypatch.setattr(FakeKernel, "start_delay_s", 0.3)
+    pool = make_pool(min_size=1, max_size=1)
+    # единственный слот занят прогревом: acquire ждет его, а не отказывает
+    time.sleep(0.05)
+    assert pool.acquire("a").alive
+
+
+def test_acquire_replaces_dead_kernel(make_pool):
+    pool = make_pool(min_size=0, max_size=1)
+    kernel = pool.acquire("a")
+    kernel.alive = False
+    fresh = pool.acquire("a")
+    assert fresh is not kernel and fresh.alive
+    assert kernel.stopped
+
+
+def test_replace_swaps_in_spare_kernel(make_pool):
+    pool = make_pool(min_size=1, max_size=3)
+    kernel = pool.acquire("a")
+    # пул прогревает новый свободный kernel взамен занятого
+    time.sleep(0.1)
+    fresh = pool.replace("a")
+    assert fresh is not kernel and fresh.restarts == 0
+    assert pool.acquire("a") is fresh
+    wait_for(lambda: kernel.stopped)
+
+
+def test_replace_restarts_in_place_without_spare(make_pool):
+    pool = make_pool(min_size=0, max_size=1)
+    kernel = pool.acquire("a")
+    assert pool.replace("a") is kernel
+    assert kernel.restarts == 1 and not kernel.stopped
+
+
+def test_replace_starts_new_kernel_in_slot_of_dead_one(make_pool):
+    pool = make_pool(min_size=0, max_size=1)
+    kernel = pool.acquire("a")
+    kernel.alive = False
+    fresh = pool.replace("a")
+    assert fresh is not kernel and kernel.restarts == 0
+    assert kernel.stopped
+
+
+def test_acquire_during_replace_gets_new_kernel(make_pool, monkeypatch):
+    pool = make_pool(min_size=0, max_size=2)
+    kernel = pool.acquire("a")
+    kernel.alive = False
+    monkeypatch.setattr(FakeKernel, "start_delay_s", 0.2)
+    with ThreadPoolExecutor(2) as executor:
+        replaced = executor.submit(pool.replace, "a")
+        time.sleep(0.05)
+        acquired = executor.submit(pool.acquire, "a")
+        assert acquired.result() is replaced.result() is not kernel
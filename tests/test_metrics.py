@@ -0,0 +1,17 @@
+from src.metrics import Counter, Gauge
+
+
+def test_label_values_are_escaped():
+    counter = Counter("bytes_total", "Bytes.", labels=("destination",))
+    counter.inc(3, destination='session:a"b\\c\nd')
+    assert counter.render().splitlines()[-1] == (
+        'bytes_total{destination="session:a\\"b\\\\c\\nd"} 3'
+    )
+
+
+def test_removed_series_is_not_rendered():
+    gauge = Gauge("depth", "Depth.", labels=("destination",))
+    gauge.set(1, destination="a")
+    gauge.set(2, destination="b")
+    gauge.remove(destination="a")
+    assert gauge.render().splitlines()[2:] == ['depth{destination="b"} 2']
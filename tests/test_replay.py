@@ -0,0 +1,92 @@
+import asyncio
+
+from src.models import OutputCodec
+from src.replay import ReplayLog
+from src.sender import Sender, session_room
+
+
+class FakeServer:
+    """Вместо socketio.AsyncServer: запоминает отправленные события."""
+
+    def __init__(self) -> None:
+        self.events: list[tuple[str, object, str | None]] = []
+
+    async def emit(self, event: str, data=None, to: str | None = None) -> None:
+        self.events.append((event, data, to))
+
+
+def line(index: int) -> dict:
+    return {"command": "notebook-upd", "content": {"text": f"{index}\n"}}
+
+
+def test_record_numbers_messages_of_session():
+    log = ReplayLog("a", max_messages=100, max_bytes=10**6)
+    numbered = log.record([line(0), line(1)])
+    assert [(m["session"], m["seq"]) for m in numbered] == [("a", 1), ("a", 2)]
+    assert log.last_seq == 2
+
+
+def test_since_returns_messages_after_seq():
+    log = ReplayLog("a", max_messages=100, max_bytes=10**6)
+    log.record([line(index) for index in range(5)])
+    messages, lost = log.since(3)
+    assert [m["seq"] for m in messages] == [4, 5] and lost == 0
+    assert log.since(5) == ([], 0)
+
+
+def test_since_counts_evicted_messages_as_lost():
+    log = ReplayLog("a", max_messages=3, max_bytes=10**6)
+    log.record([line(index) for index in range(10)])
+    messages, lost = log.since(2)
+    assert [m["seq"] for m in messages] == [8, 9, 10]
+    assert lost == 5
+
+
+def test_log_is_bounded_by_bytes():
+    log = ReplayLog("a", max_messages=100, max_bytes=200)
+    log.record([{"content": {"text": "x" * 90}} for _ in range(5)])
+    messages, lost = log.since(0)
+    assert len(messages) == 2 and lost == 3
+
+
+def resume_after_output(*positions) -> list[dict]:
+    """
+    Шлет в комнату сессии три строки и возвращает resume нового клиента и
+    resume для каждой позиции (epoch, seq); epoch None - epoch журнала.
+    """
+
+    async def run() -> list[dict]:
+        server = FakeServer()
+        sender = Sender(server, batch_window_s=0, codec=OutputCodec.JSON)
+        sender.start()
+        room = session_room("a")
+        first = sender.resume(room, None, 0)
+        for index in range(3):
+            sender.send_message(line(index), to=room)
+        await asyncio.sleep(0.05)
+        await sender.stop()
+        assert [data["seq"] for _, data, _ in server.events] == [1, 2, 3]
+        return [first] + [
+            sender.resume(room, first["epoch"] if epoch is None else epoch, seq)
+            for epoch, seq in positions
+        ]
+
+    return asyncio.run(run())
+
+
+def test_resume_sends_nothing_to_new_client():
+    first, again = resume_after_output((None, 0))
+    assert first["replayed"] == 0 and first["messages"] == []
+    assert again["epoch"] == first["epoch"] and again["replayed"] == 3
+
+
+def test_resume_sends_missed_messages():
+    _, resumed = resume_after_output((None, 1))
+    assert resumed["replayed"] == 2 and resumed["lost"] == 0
+    assert [m["seq"] for m in resumed["messages"]] == [2, 3]
+    assert {m["session"] for m in resumed["messages"]} == {"a"}
+
+
+def test_resume_with_other_epoch_sends_whole_log():
+    _, resumed = resume_after_output(("stale-epoch", 3))
+    assert [m["seq"] for m in resumed["messages"]] == [1, 2, 3]
@@ -0,0 +1,51 @@
+from src.sender import _Batch
+
+
+def stream(text: str, **fields) -> dict:
+    return {
+        "command": "notebook-upd",
+        "msg_type": "stream",
+        "content": {"name": "stdout", "text": text},
+        **fields,
+    }
+
+
+def batch(*messages: dict) -> list[dict]:
+    built = _Batch()
+    for message in messages:
+        built.add(message)
+    return built.build()
+
+
+def test_adjacent_chunks_of_stream_are_merged():
+    messages = batch(stream("a\n"), stream("b\n"), stream("c\n"))
+    assert len(messages) == 1
+    assert messages[0]["content"]["text"] == "a\nb\nc\n"
+
+
+def test_spill_announcement_is_not_merged_away():
+    spilled = stream("... [100 bytes kept on the server]\n")
+    spilled["content"]["spill"] = {"handle": "h", "size": 100}
+    messages = batch(stream("a\n"), spilled, stream("b\n"))
+    assert [m["content"].get("spill") for m in messages] == [
+        None,
+        {"handle": "h", "size": 100},
+        None,
+    ]
+    assert messages[2]["content"]["text"] == "b\n"
+
+
+def test_elided_marker_is_not_merged():
+    messages = batch(stream("a\n"), stream("\n... 3 lines elided ...\n", elided=3))
+    assert [m.get("elided") for m in messages] == [None, 3]
+
+
+def test_chunks_of_different_cells_are_not_merged():
+    messages = batch(stream("a\n", cell_id="1"), stream("b\n", cell_id="2"))
+    assert [m["cell_id"] for m in messages] == ["1", "2"]
+
+
+def test_other_messages_break_stream():
+    display = {"command": "notebook-upd", "msg_type": "display_data", "content": {}}
+    messages = batch(stream("a\n"), display, stream("b\n"), stream("c\n"))
+    assert [m["content"].get("text") for m in messages] == ["a\n", None, "b\nc\n"]